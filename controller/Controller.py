@@ -19,30 +19,30 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
 
-import time
-import psutil
+import os
 from controller.framework.CFx import CFX
-
-
-# Function checks the system process table for Tincan process
-def is_tincan_proc():
-    # Iterates across process table to find Tincan process
-    for process in psutil.process_iter():
-        if process.name().find("ipop-tincan") != -1:
-            return True
-    return False
+from controller.modules.TincanInterface import wait_for_tincan
 
 
 def main():
-    # Wait for ipop-tincan process to start
-    while is_tincan_proc() is False:
-        print("Waiting on IPOP Tincan to start...")
-        time.sleep(10)
+    config, config_file = CFX.parse_config()
+    tci_cfg = config["TincanInterface"]
+    if tci_cfg.get("Enabled", True):
+        # Wait for ipop-tincan to answer on its control port
+        waited = wait_for_tincan(tci_cfg)
+        print("IPOP Tincan ready after {0:.3f}s".format(waited))
+    cfx_class = CFX
+    if config["CFx"]["Runtime"] == "Asyncio":
+        # run all the modules on a single event loop
+        from controller.framework.CFxAsync import AsyncCFX
+        cfx_class = AsyncCFX
     # Create CFX object that initializes internal data structure of all the controller modules
-    cfx = CFX()
+    cfx = cfx_class(config, config_file)
     cfx.initialize()
     cfx.wait_for_shutdown_event()
-    cfx.terminate()
+    if not cfx.terminate():
+        # a module missed the shutdown deadline, exit without waiting on its threads
+        os._exit(1)  # pylint: disable=protected-access
 
 if __name__ == "__main__":
     main()
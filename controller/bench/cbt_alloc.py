@@ -0,0 +1,127 @@
+# ipop-project
+# Copyright 2016, University of Florida
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+Measures the cost of a CBT round trip through the dispatch path: the initiator creates the
+CBT and queues it, the recipient dequeues it, sets the response and completes it, and the
+initiator dequeues the response and frees the CBT. The run is repeated with the CBT pool
+disabled (CBTPoolSize 0) and enabled, and the memory held by live CBTs is measured with
+tracemalloc.
+
+    python -m controller.bench.cbt_alloc --iterations 100000 --live 10000
+"""
+
+import argparse
+import json
+import time
+import tracemalloc
+import controller.framework.fxlib as fxlib
+from controller.framework.CFxHandle import CFxHandle
+from controller.framework.CFxLog import CFxLogChannel
+
+
+class BenchCFx():
+    """The subset of CFX used by a CFxHandle to create, complete and free CBTs"""
+    def __init__(self, pool_size):
+        self._log_channel = CFxLogChannel(fxlib.CONFIG["CFx"]["LogBufferSize"])
+        self._config = dict(fxlib.CONFIG["CFx"])
+        self._config["CBTPoolSize"] = pool_size
+        self._timer_wheel = None
+        self.handles = {}
+
+    def query_param(self, param_name=""):
+        return self._config.get(param_name)
+
+    def submit_cbt(self, cbt):
+        if cbt.op_type == "Request":
+            recipient = cbt.request.recipient
+        else:
+            recipient = cbt.response.recipient
+        self.handles[recipient].enqueue_cbt(fxlib.CBT_PRIO_QUERY, cbt)
+
+
+def make_handles(pool_size):
+    cfx = BenchCFx(pool_size)
+    for name in ("LinkManager", "TincanInterface"):
+        handle = CFxHandle(cfx)
+        handle._cm_config = {}
+        handle._create_worker_queues()
+        cfx.handles[name] = handle
+    return cfx.handles["LinkManager"], cfx.handles["TincanInterface"]
+
+
+def round_trips(initiator, recipient, iterations):
+    params = dict(OverlayId="A0FB389", LinkId="8F2D5A41C7B34E0E9A6D1F3B2C4E5A6B")
+    start = time.perf_counter()
+    for _ in range(iterations):
+        cbt = initiator.create_cbt(initiator="LinkManager", recipient="TincanInterface",
+                                   action="TCI_QUERY_LINK_STATS", params=params)
+        initiator.submit_cbt(cbt)
+        cbt = recipient._cm_queue.get()
+        # pending while the recipient handles it, as the worker registers it
+        recipient._pending_cbts.add(cbt)
+        cbt.set_response("Link Stats", True)
+        recipient.complete_cbt(cbt)
+        cbt = initiator._cm_queue.get()
+        initiator.free_cbt(cbt)
+    return (time.perf_counter() - start) / iterations
+
+
+def live_memory(initiator, count):
+    # bytes held per CBT that has a request and a response
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    cbts = []
+    for _ in range(count):
+        cbt = initiator.create_cbt(initiator="LinkManager", recipient="TincanInterface",
+                                   action="TCI_QUERY_LINK_STATS")
+        cbt.set_response(None, True)
+        cbts.append(cbt)
+    size = tracemalloc.get_traced_memory()[0] - base
+    tracemalloc.stop()
+    for cbt in cbts:
+        initiator.free_cbt(cbt)
+    return size / count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CBT dispatch cost with and without pooling")
+    parser.add_argument("--iterations", type=int, default=100000)
+    parser.add_argument("--live", type=int, default=10000, help="CBTs held for the memory test")
+    parser.add_argument("--json", dest="json_file", help="write the results to this file")
+    args = parser.parse_args()
+
+    results = []
+    print("{0:>10} {1:>14} {2:>14}".format("pool size", "us/round trip", "bytes/CBT"))
+    for pool_size in (0, fxlib.CONFIG["CFx"]["CBTPoolSize"]):
+        initiator, recipient = make_handles(pool_size)
+        round_trips(initiator, recipient, min(args.iterations, 1000))
+        elapsed = round_trips(initiator, recipient, args.iterations)
+        mem = live_memory(initiator, args.live)
+        results.append(dict(CBTPoolSize=pool_size, RoundTripSec=elapsed, BytesPerCBT=mem))
+        print("{0:>10} {1:>14.2f} {2:>14.0f}".format(pool_size, elapsed * 1e6, mem))
+    if args.json_file:
+        with open(args.json_file, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,364 @@
+# ipop-project
+# Copyright 2016, University of Florida
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+A stand-in for Tincan's control plane. It answers the v5 control requests TincanInterface sends
+to the control port and reports a link up once both of its endpoints have been given the peer's
+candidate address set. Tunnels and links are only recorded, no frames are carried.
+
+The messages it sends can be delayed by a fixed latency plus a random jitter, and the datagrams
+it receives and sends can be lost at random. Run on its own it serves a controller, or the
+TincanInterface load driver, on the control port until it is interrupted:
+
+    python -m controller.bench.fake_tincan --port 5800 --latency 0.002 --loss 0.01
+"""
+
+import argparse
+import collections
+import heapq
+import itertools
+import random
+import select
+import signal
+import socket
+import threading
+import time
+import uuid
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+
+class FakeTincanNetwork():
+    """Pairs the endpoints of the links created on the fake Tincans of one process"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints = {}    # link id -> {FakeTincan: overlay id}
+
+    def endpoint_ready(self, tincan, overlay_id, link_id):
+        with self._lock:
+            ends = self._endpoints.setdefault(link_id, {})
+            ends[tincan] = overlay_id
+            ready = list(ends.items()) if len(ends) == 2 else []
+        for end, olid in ready:
+            end.link_state_change(olid, link_id, "LINK_STATE_UP")
+
+    def endpoint_removed(self, tincan, link_id):
+        with self._lock:
+            ends = self._endpoints.get(link_id, {})
+            ends.pop(tincan, None)
+            peers = list(ends.items())
+            if not ends:
+                self._endpoints.pop(link_id, None)
+        for end, olid in peers:
+            end.link_state_change(olid, link_id, "LINK_STATE_DOWN")
+
+
+class FakeTincan():
+    """
+    latency and jitter are the seconds every message sent to the controller is delayed by, the
+    jitter is drawn uniformly for each message. loss is the probability that a datagram received
+    or sent is dropped. CreateLink fails once max_links links exist, None is unlimited. A
+    peerless Tincan reports a link up as soon as it is given the peer's candidate address set
+    instead of waiting for the other end on the network.
+    """
+    def __init__(self, port, address="::1", network=None, latency=0, jitter=0, loss=0,
+                 max_links=None, peerless=False, seed=None):
+        self._network = network if network is not None else FakeTincanNetwork()
+        self._latency = latency
+        self._jitter = jitter
+        self._loss = loss
+        self._max_links = max_links
+        self._peerless = peerless
+        self._rand = random.Random(seed)
+        self._delayed = []      # min-heap of (due, seq, datagram, dest) waiting for the latency
+        self._seq = itertools.count()
+        self._send_cond = threading.Condition()
+        self._sender = None
+        family = socket.AF_INET6 if ":" in address else socket.AF_INET
+        self._sock = socket.socket(family, socket.SOCK_DGRAM)
+        # room for the bursts of a load test, the kernel caps it at net.core.rmem_max
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 << 20)
+        self._sock.bind((address, port))
+        self._ctrl_sock = None
+        self._ctrl_dest = None
+        self._lock = threading.Lock()
+        self._tunnels = {}      # tunnel id -> descriptor
+        self._links = {}        # link id -> (overlay id, tunnel id, online)
+        self._running = False
+        self._thread = None
+        self.requests = collections.Counter()   # command -> requests received
+        self.dropped = collections.Counter()    # "Received"/"Sent" -> datagrams lost
+        self.send_errors = 0
+        self._handlers = {
+            "CreateCtrlRespLink": self._create_ctrl_link,
+            "ConfigureLogging": self._configure_logging,
+            "CreateTunnel": self._create_tunnel,
+            "CreateLink": self._create_link,
+            "QueryLinkStats": self._query_link_stats,
+            "QueryCandidateAddressSet": self._query_cas,
+            "QueryOverlayInfo": self._query_overlay_info,
+            "RemoveTunnel": self._remove_tunnel,
+            "RemoveLink": self._remove_link,
+            "SendIcc": self._send_icc,
+        }
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._serve, name="FakeTincan", daemon=True)
+        self._thread.start()
+        if self._latency or self._jitter:
+            self._sender = threading.Thread(target=self._send_delayed, name="FakeTincan::send",
+                                            daemon=True)
+            self._sender.start()
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+        if self._sender is not None:
+            with self._send_cond:
+                self._send_cond.notify()
+            self._sender.join()
+        self._sock.close()
+        if self._ctrl_sock is not None:
+            self._ctrl_sock.close()
+
+    def _serve(self):
+        while self._running:
+            socks, _, _ = select.select([self._sock], [], [], 0.1)
+            if socks:
+                data, _ = self._sock.recvfrom(65507)
+                if self._lost("Received"):
+                    continue
+                self.process_ctrl(json.loads(data.decode("utf-8")))
+
+    def _lost(self, direction):
+        if self._loss and self._rand.random() < self._loss:
+            self.dropped[direction] += 1
+            return True
+        return False
+
+    def _send_delayed(self):
+        with self._send_cond:
+            while self._running:
+                if not self._delayed:
+                    self._send_cond.wait()
+                    continue
+                wait = self._delayed[0][0] - time.monotonic()
+                if wait > 0:
+                    self._send_cond.wait(wait)
+                    continue
+                _, _, data, dest = heapq.heappop(self._delayed)
+                self._sendto(data, dest)
+
+    def process_ctrl(self, ctl):
+        req = ctl["IPOP"]["Request"]
+        cmd = req.get("Command")
+        self.requests[cmd] += 1
+        handler = self._handlers.get(cmd)
+        if handler is None:
+            self._respond(ctl, "Unsupported command {0}".format(cmd), False)
+            return
+        handler(ctl, req)
+
+    def _respond(self, ctl, msg, success=True):
+        resp = {
+            "IPOP": {
+                "ProtocolVersion": 5,
+                "TransactionId": ctl["IPOP"].get("TransactionId", 0),
+                "ControlType": "TincanResponse",
+                "Request": ctl["IPOP"]["Request"],
+                "Response": {"Success": success, "Message": msg}
+            }
+        }
+        self._send(resp)
+
+    def _send(self, ctl):
+        # nothing can be sent until the controller has created the control link
+        if self._ctrl_dest is None or self._lost("Sent"):
+            return
+        data = json.dumps(ctl).encode("utf-8")
+        if self._sender is None:
+            self._sendto(data, self._ctrl_dest)
+            return
+        due = time.monotonic() + self._latency + self._rand.uniform(0, self._jitter)
+        with self._send_cond:
+            heapq.heappush(self._delayed, (due, next(self._seq), data, self._ctrl_dest))
+            if self._delayed[0][2] is data:
+                self._send_cond.notify()
+
+    def _sendto(self, data, dest):
+        try:
+            self._ctrl_sock.sendto(data, dest)
+        except OSError:
+            # a datagram that is too large, or a controller that has gone away
+            self.send_errors += 1
+
+    def link_state_change(self, overlay_id, link_id, state):
+        with self._lock:
+            link = self._links.get(link_id)
+            if link is None:
+                return
+            self._links[link_id] = (link[0], link[1], state == "LINK_STATE_UP")
+        self._send({
+            "IPOP": {
+                "ProtocolVersion": 5,
+                "TransactionId": 0,
+                "ControlType": "TincanRequest",
+                "Request": {"Command": "LinkStateChange", "OverlayId": overlay_id,
+                            "LinkId": link_id, "Data": state}
+            }
+        })
+
+    def _create_ctrl_link(self, ctl, req):
+        family = socket.AF_INET if req.get("AddressFamily") == "af_inet" else socket.AF_INET6
+        if self._ctrl_sock is None or self._ctrl_sock.family != family:
+            self._ctrl_sock = socket.socket(family, socket.SOCK_DGRAM)
+        self._ctrl_dest = (req["IP"], req["Port"])
+        self._respond(ctl, "Control response link created")
+
+    def _configure_logging(self, ctl, req):
+        # pylint: disable=unused-argument
+        self._respond(ctl, "Logging configured")
+
+    def _tunnel_descriptor(self, req):
+        tnl_id = req["TunnelId"]
+        with self._lock:
+            desc = self._tunnels.get(tnl_id)
+            if desc is None:
+                mac = uuid.uuid4().hex[:12]
+                desc = self._tunnels[tnl_id] = {
+                    "OverlayId": req["OverlayId"],
+                    "TunnelId": tnl_id,
+                    "TapName": req.get("TapName") or "ipop" + tnl_id[:7],
+                    "MAC": ":".join(mac[i:i + 2] for i in range(0, 12, 2)),
+                    "FPR": uuid.uuid4().hex.upper(),
+                }
+        return desc
+
+    def _create_tunnel(self, ctl, req):
+        self._respond(ctl, dict(self._tunnel_descriptor(req)))
+
+    def _create_link(self, ctl, req):
+        # the tunnel is created on demand, as node B's first CreateLink does not follow a
+        # CreateTunnel
+        desc = dict(self._tunnel_descriptor(req))
+        link_id = req["LinkId"]
+        with self._lock:
+            full = (link_id not in self._links and self._max_links is not None and
+                    len(self._links) >= self._max_links)
+            if not full:
+                self._links.setdefault(link_id, (req["OverlayId"], req["TunnelId"], False))
+        if full:
+            self._respond(ctl, "The limit of {0} links is reached".format(self._max_links),
+                          False)
+            return
+        desc["CAS"] = "{0}:udp:{1}".format(link_id[:7], desc["MAC"])
+        self._respond(ctl, desc)
+        if req["PeerInfo"].get("CAS"):
+            if self._peerless:
+                self.link_state_change(req["OverlayId"], link_id, "LINK_STATE_UP")
+            else:
+                self._network.endpoint_ready(self, req["OverlayId"], link_id)
+
+    def _query_link_stats(self, ctl, req):
+        stats = {}
+        with self._lock:
+            for tnl_id in req.get("TunnelIds") or ():
+                for link_id, (_, link_tnl, online) in self._links.items():
+                    if link_tnl == tnl_id:
+                        stats.setdefault(tnl_id, {})[link_id] = {
+                            "Status": "ONLINE" if online else "OFFLINE",
+                            "IceRole": "controlling",
+                            "Stats": []}
+                if tnl_id not in stats:
+                    stats[tnl_id] = {tnl_id: {"Status": "UNKNOWN"}}
+        self._respond(ctl, stats)
+
+    def _query_cas(self, ctl, req):
+        self._respond(ctl, "{0}:udp:cas".format(req["LinkId"][:7]))
+
+    def _query_overlay_info(self, ctl, req):
+        with self._lock:
+            tnls = [dict(desc) for desc in self._tunnels.values()
+                    if desc["OverlayId"] == req["OverlayId"]]
+        self._respond(ctl, tnls)
+
+    def _remove_tunnel(self, ctl, req):
+        tnl_id = req["TunnelId"]
+        with self._lock:
+            self._tunnels.pop(tnl_id, None)
+            link_ids = [lnk for lnk, (_, tnl, _) in self._links.items() if tnl == tnl_id]
+            for link_id in link_ids:
+                del self._links[link_id]
+        for link_id in link_ids:
+            self._network.endpoint_removed(self, link_id)
+        self._respond(ctl, "Tunnel removed")
+
+    def _remove_link(self, ctl, req):
+        link_id = req["LinkId"]
+        with self._lock:
+            removed = self._links.pop(link_id, None)
+        if removed is not None:
+            self._network.endpoint_removed(self, link_id)
+        self._respond(ctl, "Link removed")
+
+    def _send_icc(self, ctl, req):
+        # pylint: disable=unused-argument
+        self._respond(ctl, "ICC sent")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="A stand-in for Tincan's control plane")
+    parser.add_argument("--port", type=int, default=5800, help="the control port")
+    parser.add_argument("--address", default="::1", help="the control address")
+    parser.add_argument("--latency", type=float, default=0,
+                        help="seconds every message to the controller is delayed by")
+    parser.add_argument("--jitter", type=float, default=0,
+                        help="max random seconds added to the latency of each message")
+    parser.add_argument("--loss", type=float, default=0,
+                        help="probability that a datagram received or sent is dropped")
+    parser.add_argument("--max-links", type=int, help="links that can exist at once")
+    parser.add_argument("--seed", type=int, help="seed of the latency and loss draws")
+    args = parser.parse_args()
+
+    tincan = FakeTincan(args.port, args.address, latency=args.latency, jitter=args.jitter,
+                        loss=args.loss, max_links=args.max_links, peerless=True, seed=args.seed)
+    stopped = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopped.set())
+    tincan.start()
+    print("Fake Tincan on {0}:{1}".format(args.address, args.port), flush=True)
+    try:
+        while not stopped.wait(1):
+            pass
+    except KeyboardInterrupt:
+        pass
+    tincan.stop()
+    for cmd, count in sorted(tincan.requests.items()):
+        print("{0:<28} {1:>10}".format(cmd, count))
+    print("dropped: {0} received, {1} sent, send errors: {2}".format(
+        tincan.dropped["Received"], tincan.dropped["Sent"], tincan.send_errors))
+
+
+if __name__ == "__main__":
+    main()
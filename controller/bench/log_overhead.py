@@ -0,0 +1,152 @@
+# ipop-project
+# Copyright 2016, University of Florida
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+Measures the logging cost of one link creation handshake (both node A and node B phases) as
+the number of tunnels held by LinkManager grows. The eager variant formats every message and
+writes it to the log channel, as the modules did before the level gated API. The lazy variant
+uses the log_debug()/log_info() methods, which skip formatting when the level is filtered.
+
+    python -m controller.bench.log_overhead --tunnels 10 100 1000 --level ERROR
+"""
+
+import argparse
+import json
+import logging
+import time
+import uuid
+import controller.framework.fxlib as fxlib
+from controller.framework.CFxHandle import CFxHandle
+from controller.framework.CFxLog import CFxLogChannel
+from controller.framework.ControllerModule import ControllerModule
+
+
+class BenchCFx():
+    """The subset of CFX used by a CFxHandle for logging"""
+    def __init__(self, level):
+        self._log_channel = CFxLogChannel(fxlib.CONFIG["CFx"]["LogBufferSize"], level)
+
+    def query_param(self, param_name=""):
+        return fxlib.CONFIG["CFx"].get(param_name)
+
+
+class BenchModule(ControllerModule):
+    def initialize(self):
+        pass
+
+    def process_cbt(self, cbt):
+        pass
+
+    def timer_method(self):
+        pass
+
+    def terminate(self):
+        pass
+
+
+def make_tunnels(count):
+    tunnels = {}
+    for _ in range(count):
+        tnlid = uuid.uuid4().hex
+        tunnels[tnlid] = dict(OverlayId="A0FB389", PeerId=uuid.uuid4().hex,
+                              TunnelState="TNL_ONLINE", CreationStartTime=time.time(),
+                              Descriptor=dict(MAC="0A1B2C3D4E5F", TapName="ipop" + tnlid[:7],
+                                              FPR="SHA-256 " + uuid.uuid4().hex * 2),
+                              Link=dict(CreationState=0xC0, Stats=dict()))
+    return tunnels
+
+
+def handshake_eager(mod, tunnels, lnkid, node_id, peer_id):
+    write = mod._cfx_handle._log_channel.write
+    name = mod._module_name
+    write("LOG_DEBUG", name, "Create Link:{} Phase 1/5 Node A".format(lnkid[:7]))
+    write("LOG_DEBUG", name, "Create Link:{} Phase 2/5 Node A".format(lnkid[:7]))
+    write("LOG_DEBUG", name, "_tunnels:{}".format(tunnels))
+    write("LOG_DEBUG", name, "Create Link:{} Phase 3/5 Node A".format(lnkid[:7]))
+    write("LOG_DEBUG", name, "Create Link:{} Phase 4/5 Node A".format(lnkid[:7]))
+    write("LOG_DEBUG", name, "Create Link:{} Phase 5/5 Node A".format(lnkid[:7]))
+    write("LOG_INFO", name, "Tunnel {0} created: {1}:{2}->{3}"
+          .format(lnkid[:7], "A0FB389", node_id[:7], peer_id[:7]))
+    write("LOG_DEBUG", name, "Create Link:{} Phase 1/4 Node B".format(lnkid[:7]))
+    write("LOG_DEBUG", name, "Create Link:{} Phase 2/4 Node B".format(lnkid[:7]))
+    write("LOG_DEBUG", name, "_tunnels:{}".format(tunnels))
+    write("LOG_DEBUG", name, "Create Link: {} Phase 3/4 Node B".format(lnkid[:7]))
+    write("LOG_DEBUG", name, "Create Link:{} Phase 4/4 Node B".format(lnkid[:7]))
+    write("LOG_INFO", name, "Tunnel {0} accepted: {1}:{2}<-{3}"
+          .format(lnkid[:7], "A0FB389", node_id[:7], peer_id[:7]))
+
+
+def handshake_lazy(mod, tunnels, lnkid, node_id, peer_id):
+    mod.log_debug("Create Link:{} Phase 1/5 Node A", lnkid[:7])
+    mod.log_debug("Create Link:{} Phase 2/5 Node A", lnkid[:7])
+    mod.log_debug("_tunnels:{}", tunnels)
+    mod.log_debug("Create Link:{} Phase 3/5 Node A", lnkid[:7])
+    mod.log_debug("Create Link:{} Phase 4/5 Node A", lnkid[:7])
+    mod.log_debug("Create Link:{} Phase 5/5 Node A", lnkid[:7])
+    mod.log_info("Tunnel {0} created: {1}:{2}->{3}", lnkid[:7], "A0FB389", node_id[:7],
+                 peer_id[:7])
+    mod.log_debug("Create Link:{} Phase 1/4 Node B", lnkid[:7])
+    mod.log_debug("Create Link:{} Phase 2/4 Node B", lnkid[:7])
+    mod.log_debug("_tunnels:{}", tunnels)
+    mod.log_debug("Create Link: {} Phase 3/4 Node B", lnkid[:7])
+    mod.log_debug("Create Link:{} Phase 4/4 Node B", lnkid[:7])
+    mod.log_info("Tunnel {0} accepted: {1}:{2}<-{3}", lnkid[:7], "A0FB389", node_id[:7],
+                 peer_id[:7])
+
+
+def measure(handshake, mod, tunnels, iterations):
+    lnkid, node_id, peer_id = uuid.uuid4().hex, uuid.uuid4().hex, uuid.uuid4().hex
+    start = time.perf_counter()
+    for _ in range(iterations):
+        handshake(mod, tunnels, lnkid, node_id, peer_id)
+    return (time.perf_counter() - start) / iterations
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Logging cost per link handshake")
+    parser.add_argument("--tunnels", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--level", default="ERROR", help="Logger LogLevel")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--json", dest="json_file", help="write the results to this file")
+    args = parser.parse_args()
+
+    level = getattr(logging, args.level)
+    handle = CFxHandle(BenchCFx(level))
+    mod = BenchModule(handle, {}, "LinkManager")
+    handle._cm_instance = mod
+    results = []
+    print("LogLevel={0}".format(args.level))
+    print("{0:>8} {1:>14} {2:>14} {3:>8}".format("tunnels", "eager us/hs", "lazy us/hs",
+                                                 "speedup"))
+    for count in args.tunnels:
+        tunnels = make_tunnels(count)
+        eager = measure(handshake_eager, mod, tunnels, args.iterations)
+        lazy = measure(handshake_lazy, mod, tunnels, args.iterations)
+        results.append(dict(Tunnels=count, LogLevel=args.level, EagerSec=eager, LazySec=lazy))
+        print("{0:>8} {1:>14.1f} {2:>14.1f} {3:>7.1f}x".format(count, eager * 1e6, lazy * 1e6,
+                                                             eager / lazy))
+    if args.json_file:
+        with open(args.json_file, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
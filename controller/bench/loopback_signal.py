@@ -0,0 +1,164 @@
+# ipop-project
+# Copyright 2016, University of Florida
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+A stand-in for the XMPP server. The Signal modules of the controllers running in this process
+connect to a LoopbackHub instead, which broadcasts their presence to the other members of the
+overlay and delivers their messages, in order, on its own thread.
+"""
+
+import collections
+import queue
+import threading
+try:
+    import simplejson as json
+except ImportError:
+    import json
+import controller.modules.Signal as xmpp_signal
+
+LoopbackJid = collections.namedtuple("LoopbackJid", ["bare", "full"])
+
+
+class LoopbackHub():
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._overlays = {}     # overlay id -> {full jid: transport}
+        self._presence = {}     # full jid -> last presence status
+        self._que = queue.Queue()
+        self._thread = None
+        self.presence_sent = collections.Counter()  # full jid -> presence stanzas sent
+        self.msgs_sent = collections.Counter()      # full jid -> messages sent
+
+    def start(self):
+        self._thread = threading.Thread(target=self._deliver, name="LoopbackHub", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._que.put(None)
+            self._thread.join()
+
+    def _deliver(self):
+        while True:
+            item = self._que.get()
+            if item is None:
+                return
+            func, args = item
+            func(*args)
+
+    def join(self, overlay_id, xport):
+        # like a server sending the roster's presence on sign on
+        jid = xport.boundjid.full
+        with self._lock:
+            members = self._overlays.setdefault(overlay_id, {})
+            for peer_jid in members:
+                status = self._presence.get(peer_jid)
+                if status is not None:
+                    self._que.put((xport.presence_received, (peer_jid, status)))
+            members[jid] = xport
+
+    def leave(self, overlay_id, xport):
+        with self._lock:
+            self._overlays.get(overlay_id, {}).pop(xport.boundjid.full, None)
+            self._presence.pop(xport.boundjid.full, None)
+
+    def send_presence(self, overlay_id, sender, status):
+        with self._lock:
+            self.presence_sent[sender] += 1
+            self._presence[sender] = status
+            for jid, xport in self._overlays.get(overlay_id, {}).items():
+                if jid != sender:
+                    self._que.put((xport.presence_received, (sender, status)))
+
+    def send_msg(self, overlay_id, sender, peer_jid, msg_type, payload):
+        with self._lock:
+            self.msgs_sent[sender] += 1
+            xport = self._overlays.get(overlay_id, {}).get(peer_jid)
+        if xport is not None:
+            self._que.put((xport.message_received, (sender, msg_type, payload)))
+
+
+class LoopbackTransport():
+    """The XmppTransport interface used by Signal, with the same presence and message handling"""
+    def __init__(self, hub, overlay_id, sig, presence_publisher, jid_cache, outgoing_rem_acts):
+        self._hub = hub
+        self._overlay_id = overlay_id
+        self._sig = sig
+        self._node_id = sig._cm_config["NodeId"]  # pylint: disable=protected-access
+        self._presence_publisher = presence_publisher
+        self._jid_cache = jid_cache
+        self._outgoing_rem_acts = outgoing_rem_acts
+        self._host = "loopback"
+        bare = "{0}@{1}".format(self._node_id, self._host)
+        self.boundjid = LoopbackJid(bare, bare + "/ipop")
+
+    def connect_to_server(self):
+        self._hub.join(self._overlay_id, self)
+        self.send_presence(pstatus="ident#" + self._node_id)
+
+    def shutdown(self):
+        self._hub.leave(self._overlay_id, self)
+
+    def send_presence(self, pstatus):
+        self._hub.send_presence(self._overlay_id, self.boundjid.full, pstatus)
+
+    def send_msg(self, peer_jid, msg_type, payload):
+        self._hub.send_msg(self._overlay_id, self.boundjid.full, peer_jid, msg_type, payload)
+
+    def presence_received(self, sender, status):
+        if "#" not in status:
+            return
+        pstatus, peer_id = status.split("#")
+        if pstatus == "ident":
+            if peer_id == self._node_id:
+                return
+            pts = self._jid_cache.add_entry(node_id=peer_id, jid=sender)
+            self._presence_publisher.post_update(
+                dict(PeerId=peer_id, OverlayId=self._overlay_id, PresenceTimestamp=pts))
+        elif pstatus == "uid?" and peer_id == self._node_id:
+            self.send_msg(sender, "uid!", self.boundjid.full + "#" + self._node_id)
+
+    def message_received(self, sender, msg_type, payload):
+        if msg_type == "uid!":
+            match_jid, matched_uid = payload.split("#")
+            self._jid_cache.add_entry(matched_uid, match_jid)
+            rm_que = self._outgoing_rem_acts.get(matched_uid, queue.Queue())
+            while not rm_que.empty():
+                entry = rm_que.get()
+                self.send_msg(match_jid, entry[0], json.dumps(entry[1]))
+        elif msg_type in ("invk", "cmpt"):
+            self._sig.handle_remote_action(self._overlay_id, json.loads(payload), msg_type)
+
+
+class Signal(xmpp_signal.Signal):
+    """
+    Signal connected to the LoopbackHub given by the harness instead of an XMPP server. It keeps
+    the module's class name, which the framework uses to address the module.
+    """
+    hub = None
+
+    def _create_transport_instance(self, overlay_id, overlay_descr, jid_cache, outgoing_rem_acts):
+        xport = LoopbackTransport(self.hub, overlay_id, self, self._presence_publisher,
+                                  jid_cache, outgoing_rem_acts)
+        # an XMPP session is established after the modules are initialized, connecting on the
+        # worker keeps the roster's presence from reaching the node before Topology subscribes
+        self.schedule_timer(0, xport.connect_to_server)
+        return xport
@@ -0,0 +1,296 @@
+# ipop-project
+# Copyright 2016, University of Florida
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+Runs complete controllers, CFX with all of its modules, for overlays of growing size in one
+process to find where Topology and Signal stop scaling. Each node has its own fake Tincan on the
+control port, and all nodes signal through a loopback hub that stands in for the XMPP server.
+Every size runs in a fresh worker process. For each size the harness reports:
+
+- the time until every node has discovered all of its peers,
+- the time until the overlay has converged, meaning every node has discovered all of its peers
+  and the tunnels connected at both ends join all the nodes into a single component,
+- the signalling messages and Tincan control requests each node sent until convergence,
+- the CPU time of each node, used while it started and by its threads until convergence.
+
+    python -m controller.bench.overlay_sim --nodes 10 50 100 --json overlay_sim.json
+"""
+
+import argparse
+import concurrent.futures
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from controller.framework.ControllerModule import ControllerModule, notification_handler
+
+
+class OverlayMonitor():
+    """Tracks the peers discovered and the tunnels connected by every node of the overlay"""
+    def __init__(self, node_ids):
+        self._lock = threading.Lock()
+        self._node_ids = list(node_ids)
+        self._discovered = {node_id: set() for node_id in node_ids}
+        self._connected = {node_id: set() for node_id in node_ids}
+        self._complete = 0      # nodes that have discovered all their peers
+        self._start = time.monotonic()
+        self.discovered_time = None
+        self.converged_time = None
+        self.converged = threading.Event()
+
+    def peer_discovered(self, node_id, peer_id):
+        with self._lock:
+            peers = self._discovered[node_id]
+            if peer_id in peers:
+                return
+            peers.add(peer_id)
+            if len(peers) == len(self._node_ids) - 1:
+                self._complete += 1
+                if self._complete == len(self._node_ids):
+                    self.discovered_time = time.monotonic() - self._start
+            self._check_converged()
+
+    def tunnel_event(self, node_id, peer_id, update_type):
+        with self._lock:
+            if update_type == "CONNECTED":
+                self._connected[node_id].add(peer_id)
+                self._check_converged()
+            elif update_type in ("DISCONNECTED", "REMOVED"):
+                self._connected[node_id].discard(peer_id)
+
+    def edges(self):
+        """The tunnels connected at both ends"""
+        with self._lock:
+            return sum(1 for node_id, peers in self._connected.items() for peer_id in peers
+                       if node_id < peer_id and node_id in self._connected.get(peer_id, ()))
+
+    def _check_converged(self):
+        if self.converged_time is not None or self.discovered_time is None:
+            return
+        # the nodes reached from the first one over tunnels that are up at both ends
+        reached = {self._node_ids[0]}
+        frontier = [self._node_ids[0]]
+        while frontier:
+            node_id = frontier.pop()
+            for peer_id in self._connected[node_id]:
+                if peer_id not in reached and node_id in self._connected.get(peer_id, ()):
+                    reached.add(peer_id)
+                    frontier.append(peer_id)
+        if len(reached) == len(self._node_ids):
+            self.converged_time = time.monotonic() - self._start
+            self.converged.set()
+
+
+class OverlayProbe(ControllerModule):
+    """Passes the node's peer discoveries and tunnel events to the harness' OverlayMonitor"""
+    monitor = None
+
+    def initialize(self):
+        self._cfx_handle.start_subscription("Signal", "SIG_PEER_PRESENCE_NOTIFY")
+        self._cfx_handle.start_subscription("LinkManager", "LNK_TUNNEL_EVENTS")
+
+    @notification_handler("SIG_PEER_PRESENCE_NOTIFY")
+    def req_handler_peer_presence(self, cbt):
+        self.monitor.peer_discovered(self._cm_config["NodeId"], cbt.request.params["PeerId"])
+
+    @notification_handler("LNK_TUNNEL_EVENTS")
+    def req_handler_link_events(self, cbt):
+        params = cbt.request.params
+        self.monitor.tunnel_event(self._cm_config["NodeId"], params["PeerId"],
+                                  params["UpdateType"])
+
+    def timer_method(self):
+        pass
+
+    def terminate(self):
+        pass
+
+
+def thread_cpu_times():
+    """
+    The CPU seconds used by each thread of the process keyed by its native id, read from
+    /proc. Empty where /proc is not available.
+    """
+    ticks = os.sysconf("SC_CLK_TCK")
+    times = {}
+    try:
+        tids = os.listdir("/proc/self/task")
+    except OSError:
+        return times
+    for tid in tids:
+        try:
+            # nanoseconds on the CPU, where the kernel keeps scheduler statistics
+            with open("/proc/self/task/{0}/schedstat".format(tid)) as f:
+                times[int(tid)] = int(f.read().split()[0]) / 1e9
+            continue
+        except (OSError, ValueError, IndexError):
+            pass
+        try:
+            with open("/proc/self/task/{0}/stat".format(tid)) as f:
+                # utime and stime are the 14th and 15th fields, the name may contain spaces
+                fields = f.read().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        times[int(tid)] = (int(fields[11]) + int(fields[12])) / ticks
+    return times
+
+
+def _thread_ids():
+    return {thread.native_id for thread in threading.enumerate()}
+
+
+def node_config(node_id, ctrl_port, tincan_port, runtime, log_dir, interval, coalesce):
+    from controller.bench.startup import node_config as startup_config
+    config = startup_config(node_id, ctrl_port, tincan_port, runtime, log_dir)
+    del config["StartupProbe"]
+    # the console logger is shared by the nodes of the process, a file logger per node would
+    # add a handler to the same logging.Logger for each of them
+    config["Logger"].update(LogLevel="ERROR", Device="Console")
+    config["Signal"]["TimerInterval"] = interval
+    config["LinkManager"]["TimerInterval"] = interval
+    config["Topology"].update(TimerInterval=interval, PeerDiscoveryCoalesce=coalesce)
+    config["OverlayProbe"] = {"Enabled": True,
+                              "Dependencies": ["Logger", "Signal", "LinkManager"]}
+    return config
+
+
+def run(num_nodes, runtime="Threads", base_port=16000, timeout=120, interval=10, coalesce=3):
+    """Start num_nodes controllers, wait for the overlay to converge and return the results"""
+    from controller.bench import loopback_signal
+    from controller.bench.fake_tincan import FakeTincan, FakeTincanNetwork
+    from controller.bench.startup import bench_cfx_class, parse_config
+    cfx_class = bench_cfx_class(runtime, OverlayProbe)
+    # the modules are initialized on this thread, where the CPU time of the startup is measured
+    cfx_class.parallel_init = False
+    hub = loopback_signal.LoopbackHub()
+    hub.start()
+    loopback_signal.Signal.hub = hub
+    network = FakeTincanNetwork()
+    node_ids = [uuid.uuid4().hex for _ in range(num_nodes)]
+    monitor = OverlayProbe.monitor = OverlayMonitor(node_ids)
+    tincans, nodes, node_threads, start_cpu = [], [], [], []
+    result = OrderedDict(Nodes=num_nodes, Runtime=runtime)
+    cpu_start = time.process_time()
+    base_threads = _thread_ids()
+    try:
+        with tempfile.TemporaryDirectory(prefix="ipop-overlay-sim-") as workdir:
+            for idx, node_id in enumerate(node_ids):
+                ctrl_port, tincan_port = base_port + 2 * idx, base_port + 2 * idx + 1
+                tincan = FakeTincan(tincan_port, network=network)
+                tincan.start()
+                tincans.append(tincan)
+                config_file = os.path.join(workdir, "node{0}.json".format(idx))
+                with open(config_file, "w") as f:
+                    json.dump(node_config(node_id, ctrl_port, tincan_port, runtime, workdir,
+                                          interval, coalesce), f)
+                config, _ = parse_config(config_file)
+                before = _thread_ids()
+                cpu = time.thread_time()
+                cfx = cfx_class(config)
+                cfx.initialize()
+                start_cpu.append(time.thread_time() - cpu)
+                nodes.append(cfx)
+                node_threads.append(_thread_ids() - before)
+            result["StartSec"] = time.monotonic() - monitor._start  # pylint: disable=protected-access
+            monitor.converged.wait(timeout)
+            # read the counters before the shutdown adds its own messages
+            cpu_times = thread_cpu_times()
+            result["DiscoverSec"] = monitor.discovered_time
+            result["ConvergeSec"] = monitor.converged_time
+            result["Edges"] = monitor.edges()
+            sig_msgs = [hub.presence_sent[jid] + hub.msgs_sent[jid] for jid in
+                        ("{0}@loopback/ipop".format(node_id) for node_id in node_ids)]
+            ctrl_reqs = [sum(tincan.requests.values()) for tincan in tincans]
+            node_cpu = [cpu + sum(cpu_times.get(tid, 0) for tid in tids)
+                        for cpu, tids in zip(start_cpu, node_threads)]
+            tincan_tids = set().union(*node_threads) | base_threads
+            result["SignalMsgsPerNode"] = sum(sig_msgs) / num_nodes
+            result["SignalMsgsMax"] = max(sig_msgs)
+            result["TincanRequestsPerNode"] = sum(ctrl_reqs) / num_nodes
+            result["CpuSecPerNode"] = sum(node_cpu) / num_nodes
+            result["CpuSecMax"] = max(node_cpu)
+            result["StartCpuSecPerNode"] = sum(start_cpu) / num_nodes
+            # the fake Tincans, the hub and the threads started after initialization
+            result["HarnessCpuSec"] = sum(sec for tid, sec in cpu_times.items()
+                                          if tid not in tincan_tids)
+            result["ProcessCpuSec"] = time.process_time() - cpu_start
+            result["Threads"] = threading.active_count()
+    finally:
+        for cfx in nodes:
+            cfx.terminate()
+        for tincan in tincans:
+            tincan.stop()
+        hub.stop()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convergence of an in-process overlay")
+    parser.add_argument("--nodes", type=int, nargs="+", default=[2, 10, 50],
+                        help="overlay sizes, each run in a fresh process")
+    parser.add_argument("--runtime", default="Threads", choices=("Threads", "Asyncio"))
+    parser.add_argument("--base-port", type=int, default=16000,
+                        help="first of the control ports, each node uses two")
+    parser.add_argument("--timeout", type=float, default=120,
+                        help="seconds to wait for each overlay to converge")
+    parser.add_argument("--interval", type=float, default=10,
+                        help="TimerInterval of Signal, LinkManager and Topology")
+    parser.add_argument("--coalesce", type=int, default=3,
+                        help="Topology PeerDiscoveryCoalesce")
+    parser.add_argument("--json", dest="json_file", help="write the results to this file")
+    args = parser.parse_args()
+
+    results = []
+    print("{0:>6} {1:>9} {2:>10} {3:>10} {4:>7} {5:>10} {6:>10} {7:>10} {8:>8}".format(
+        "nodes", "start s", "discover s", "converge s", "edges", "sig msgs", "tincan req",
+        "cpu ms", "threads"))
+    for num_nodes in args.nodes:
+        # a fresh process per size, the threads and sockets of the previous one are gone
+        ctx = multiprocessing.get_context("spawn")
+        with concurrent.futures.ProcessPoolExecutor(1, mp_context=ctx) as pool:
+            result = pool.submit(run, num_nodes, args.runtime, args.base_port, args.timeout,
+                                 args.interval, args.coalesce).result()
+        results.append(result)
+        print("{0:>6} {1:>9.2f} {2:>10} {3:>10} {4:>7} {5:>10.1f} {6:>10.1f} {7:>10.1f} {8:>8}"
+              .format(num_nodes, result["StartSec"],
+                      "timeout" if result["DiscoverSec"] is None else
+                      "{0:.2f}".format(result["DiscoverSec"]),
+                      "timeout" if result["ConvergeSec"] is None else
+                      "{0:.2f}".format(result["ConvergeSec"]),
+                      result["Edges"], result["SignalMsgsPerNode"],
+                      result["TincanRequestsPerNode"], result["CpuSecPerNode"] * 1e3,
+                      result["Threads"]), flush=True)
+    if args.json_file:
+        with open(args.json_file, "w") as f:
+            json.dump(OrderedDict(Python=sys.version.split()[0], Runtime=args.runtime,
+                                  Interval=args.interval, Coalesce=args.coalesce,
+                                  Overlays=results), f, indent=2)
+    if any(result["ConvergeSec"] is None for result in results):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
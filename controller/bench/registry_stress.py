@@ -0,0 +1,250 @@
+# ipop-project
+# Copyright 2016, University of Florida
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+Hammers a CBTRegistry from several threads the way a module's workers, its timers and its
+transport threads use it. Producers register CBTs and hand half of them to a consumer thread,
+which removes them by identity, and release the other half themselves after looking them up.
+An expiry thread races the consumer to claim the same CBTs, and a reader keeps taking
+snapshots and stats. At the end the registry must be empty, every CBT must have been released
+exactly once and the insert and removal counters must agree.
+
+A second run races the completion of pending requests on a CFxHandle: listener threads claim
+and complete them the way the Tincan and XMPP listeners do, while the handle's deadlines expire
+them on its worker. Each request must be completed exactly once, with the response set by the
+winner left intact.
+
+    python -m controller.bench.registry_stress --threads 4 --cbts 50000
+"""
+
+import argparse
+import collections
+import queue
+import random
+import sys
+import threading
+import time
+import controller.framework.fxlib as fxlib
+from controller.framework.CBT import CBT
+from controller.framework.CFxHandle import CFxHandle
+from controller.framework.CFxLeakDetector import CBTAgeBuckets
+from controller.framework.CFxLog import CFxLogChannel
+from controller.framework.CFxRegistry import CBTRegistry
+from controller.framework.CFxTimer import CFxTimer, CFxTimerWheel
+
+EXPIRED = "The request has expired"
+
+
+def producer(reg, handoff, expiry, count, errors):
+    for i in range(count):
+        cbt = CBT("LinkManager", "TincanInterface", "TCI_QUERY_LINK_STATS")
+        cbt.time_create = time.time()
+        reg.add(cbt)
+        if reg.get(cbt.tag) is not cbt or cbt.tag not in reg:
+            errors.append("lookup failed for {0}".format(cbt.tag))
+        if i % 2:
+            handoff.put(cbt)
+            expiry.put(cbt)
+        elif not reg.discard(cbt):
+            errors.append("producer lost {0}".format(cbt.tag))
+    handoff.put(None)
+
+
+def claimer(reg, que, claimed, lock, producers):
+    # the consumer and the expiry thread race to release the same CBTs
+    while producers:
+        cbt = que.get()
+        if cbt is None:
+            producers -= 1
+        elif reg.discard(cbt):
+            with lock:
+                claimed.append(cbt.tag)
+
+
+def reader(reg, done, snaps):
+    while not done.is_set():
+        reg.values()
+        reg.stats()
+        len(reg)
+        snaps[0] += 1
+
+
+def run(num_threads, count):
+    errors, claimed, snaps = [], [], [0]
+    lock = threading.Lock()
+    reg = CBTRegistry("pending", CBTAgeBuckets(10))
+    handoff, expiry = queue.Queue(), queue.Queue()
+    done = threading.Event()
+    producers = [threading.Thread(target=producer, args=(reg, handoff, expiry, count, errors))
+                 for _ in range(num_threads)]
+    consumer = threading.Thread(target=claimer, args=(reg, handoff, claimed, lock, num_threads))
+    expirer = threading.Thread(target=claimer, args=(reg, expiry, claimed, lock, 1))
+    snapper = threading.Thread(target=reader, args=(reg, done, snaps))
+    start = time.perf_counter()
+    for thd in producers + [consumer, expirer, snapper]:
+        thd.start()
+    for thd in producers + [consumer]:
+        thd.join()
+    expiry.put(None)
+    expirer.join()
+    elapsed = time.perf_counter() - start
+    done.set()
+    snapper.join()
+
+    stats = reg.stats()
+    total = num_threads * count
+    if len(claimed) != num_threads * (count // 2) or len(set(claimed)) != len(claimed):
+        errors.append("{0} handed off CBTs released, {1} distinct".format(len(claimed),
+                                                                            len(set(claimed))))
+    if stats["Size"] or stats["Inserted"] != total or stats["Removed"] != total:
+        errors.append("registry not balanced: {0}".format(stats))
+    if len(reg._ages):   # pylint: disable=protected-access
+        errors.append("{0} CBTs left in the age buckets".format(len(reg._ages)))
+    return elapsed, total, snaps[0], stats, errors
+
+
+class BenchCFx():
+    """The subset of CFX used by a CFxHandle to expire and complete requests"""
+    def __init__(self):
+        self._log_channel = CFxLogChannel(fxlib.CONFIG["CFx"]["LogBufferSize"])
+        self._config = dict(fxlib.CONFIG["CFx"])
+        self._timer_wheel = CFxTimerWheel(self._config["TimerResolution"])
+        self._lock = threading.Lock()
+        self.completions = collections.Counter()  # tag -> times the response was submitted
+        self.responses = {}     # tag -> response data when it was first submitted
+
+    def query_param(self, param_name=""):
+        return self._config.get(param_name)
+
+    def submit_cbt(self, cbt):
+        with self._lock:
+            self.completions[cbt.tag] += 1
+            self.responses.setdefault(cbt.tag, cbt.response.data)
+
+
+def run_worker(handle):
+    # the handle's worker only runs its expiry timers here
+    while True:
+        item = handle._cm_queue.get()   # pylint: disable=protected-access
+        if item is None:
+            return
+        if isinstance(item, CFxTimer):
+            handle._run_timer(item)     # pylint: disable=protected-access
+
+
+def listener(handle, que, won, lag):
+    rand = random.Random()
+    while True:
+        cbt = que.get()
+        if cbt is None:
+            return
+        delay = cbt.time_submit + rand.uniform(0, lag) - time.time()
+        if delay > 0:
+            time.sleep(delay)
+        pending = handle.claim_pending_cbt(cbt.tag)
+        if pending is not None:
+            # a listener can be preempted between finding the request and completing it
+            time.sleep(0)
+            pending.set_response("listener", True)
+            handle.complete_cbt(pending, claimed=True)
+            won.append(pending.tag)
+
+
+def complete_race(num_threads, count, timeout=0.05):
+    """Requests that expire after up to timeout seconds, answered after up to twice that"""
+    cfx = BenchCFx()
+    handle = CFxHandle(cfx)
+    handle._cm_config = {}      # pylint: disable=protected-access
+    handle._create_worker_queues()  # pylint: disable=protected-access
+    cfx._timer_wheel.start()    # pylint: disable=protected-access
+    worker = threading.Thread(target=run_worker, args=(handle,))
+    worker.start()
+    ques = [queue.Queue() for _ in range(num_threads)]
+    won = []
+    listeners = [threading.Thread(target=listener, args=(handle, que, won, 2 * timeout))
+                 for que in ques]
+    for thd in listeners:
+        thd.start()
+    rand = random.Random()
+    cbts = []
+    # switch threads far more often than every 5ms so the claims interleave with the expiry
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    start = time.perf_counter()
+    for i in range(count):
+        cbt = CBT("LinkManager", "TincanInterface", "TCI_QUERY_LINK_STATS")
+        cbt.timeout = rand.uniform(0, timeout)
+        cbt.time_submit = time.time()
+        handle._add_pending(cbt)    # pylint: disable=protected-access
+        ques[i % num_threads].put(cbt)
+        cbts.append(cbt)
+        if i % 100 == 99:
+            time.sleep(0.001)
+    for que in ques:
+        que.put(None)
+    for thd in listeners:
+        thd.join()
+    deadline = time.monotonic() + timeout + 1
+    while len(handle._pending_cbts) and time.monotonic() < deadline:   # pylint: disable=protected-access
+        time.sleep(0.01)
+    elapsed = time.perf_counter() - start
+    sys.setswitchinterval(switch_interval)
+    handle._cm_queue.put((fxlib.CBT_PRIO_CONTROL, None))  # pylint: disable=protected-access
+    worker.join()
+    cfx._timer_wheel.stop()     # pylint: disable=protected-access
+
+    errors = []
+    for cbt in cbts:
+        completions = cfx.completions[cbt.tag]
+        if completions != 1:
+            errors.append("{0} completed {1} times".format(cbt.tag, completions))
+        elif cfx.responses[cbt.tag] != cbt.response.data:
+            errors.append("{0} response overwritten after it was submitted".format(cbt.tag))
+        elif cbt.expired != (cbt.response.data == EXPIRED):
+            errors.append("{0} expired={1} with response {2}".format(
+                cbt.tag, cbt.expired, cbt.response.data))
+    expired = sum(1 for cbt in cbts if cbt.expired)
+    return elapsed, len(won), expired, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent use of the CBT registry")
+    parser.add_argument("--threads", type=int, default=4, help="producer threads")
+    parser.add_argument("--cbts", type=int, default=50000, help="CBTs per producer")
+    args = parser.parse_args()
+
+    elapsed, total, snaps, stats, errors = run(args.threads, args.cbts)
+    print("{0} CBTs from {1} producers in {2:.2f}s, {3:.0f} CBTs/s, {4} snapshots"
+          .format(total, args.threads, elapsed, total / elapsed, snaps))
+    print("stats: {0}".format(stats))
+    elapsed, won, expired, race_errors = complete_race(args.threads, args.cbts // 5)
+    print("{0} requests completed in {1:.2f}s, {2} by listeners and {3} by expiry".format(
+        args.cbts // 5, elapsed, won, expired))
+    errors.extend(race_errors)
+    for err in errors[:20]:
+        print("ERROR: {0}".format(err))
+    if errors:
+        raise SystemExit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
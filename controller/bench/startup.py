@@ -0,0 +1,248 @@
+# ipop-project
+# Copyright 2016, University of Florida
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+Measures how long the controller takes from process start to a usable overlay. The import time
+of each controller module is taken from a fresh interpreter run with -X importtime. Then a few
+nodes are started in this process, each with its own fake Tincan on the control port and all
+signalling through a loopback hub in place of the XMPP server, and for each node the time spent
+in CFX.parse_config, the CFX constructor and initialize, every module's initialize, and the time
+until LinkManager publishes its first CONNECTED tunnel event are recorded.
+
+    python -m controller.bench.startup --nodes 2 --json startup.json
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+import controller.framework.fxlib as fxlib
+from controller.framework.ControllerModule import ControllerModule, notification_handler
+
+OVERLAY_ID = "A0FB389"
+
+
+class StartupProbe(ControllerModule):
+    """Records when the node's first tunnel is connected"""
+    def __init__(self, cfx_handle, module_config, module_name):
+        super(StartupProbe, self).__init__(cfx_handle, module_config, module_name)
+        self.connected = threading.Event()
+        self.connected_time = None
+
+    def initialize(self):
+        self._cfx_handle.start_subscription("LinkManager", "LNK_TUNNEL_EVENTS")
+
+    @notification_handler("LNK_TUNNEL_EVENTS")
+    def req_handler_link_events(self, cbt):
+        if cbt.request.params["UpdateType"] == "CONNECTED" and not self.connected.is_set():
+            self.connected_time = time.monotonic()
+            self.connected.set()
+
+    def timer_method(self):
+        pass
+
+    def terminate(self):
+        pass
+
+
+def import_times():
+    """
+    The cumulative import time of each controller module, measured in a fresh interpreter so
+    the modules imported by this benchmark do not hide their cost. A module that fails to
+    import is reported with the error instead.
+    """
+    names = ["controller.Controller", "controller.framework.CFx",
+             "controller.modules.XmppTransport"] + \
+        ["controller.modules." + name for name in fxlib.MODULE_ORDER[1:]]
+    # -X importtime does not report the modules loaded by importlib.import_module()
+    code = ("for name in {0!r}:\n"
+            "    try:\n"
+            "        __import__(name)\n"
+            "    except Exception as err:\n"
+            "        print(name, repr(err))\n").format(names)
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                          universal_newlines=True, check=False)
+    times = OrderedDict()
+    for line in proc.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        name = name.strip()
+        if name.startswith("controller.") and cumulative.strip().isdigit():
+            times[name] = int(cumulative) / 1e6
+    errors = dict(line.split(" ", 1) for line in proc.stdout.splitlines() if " " in line)
+    return times, errors
+
+
+def bench_cfx_class(runtime, probe=StartupProbe):
+    """The CFX of the selected runtime with the loopback Signal and the probe module"""
+    from controller.bench import loopback_signal
+    from controller.framework.CFx import CFX
+    base = CFX
+    if runtime == "Asyncio":
+        from controller.framework.CFxAsync import AsyncCFX
+        base = AsyncCFX
+    modules = {"Signal": loopback_signal.Signal, probe.__name__: probe}
+
+    class BenchCFX(base):
+        def _module_class(self, module_name):
+            if module_name in modules:
+                return modules[module_name]
+            return super(BenchCFX, self)._module_class(module_name)
+    return BenchCFX
+
+
+def node_config(node_id, ctrl_port, tincan_port, runtime, log_dir):
+    return {
+        "CFx": {"NodeId": node_id, "Overlays": [OVERLAY_ID], "Runtime": runtime},
+        "Logger": {"LogLevel": "WARNING", "Device": "File", "Directory": log_dir},
+        "TincanInterface": {"CtrlRecvPort": ctrl_port, "CtrlSendPort": tincan_port},
+        "Signal": {"Overlays": {OVERLAY_ID: {"HostAddress": "loopback", "Port": 5222}}},
+        "LinkManager": {"Stun": ["stun.l.google.com:19302"],
+                        "Overlays": {OVERLAY_ID: {"Type": "TUNNEL", "TapName": "ipop"}}},
+        "Topology": {"PeerDiscoveryCoalesce": 1, "Overlays": {OVERLAY_ID: {}}},
+        "BridgeController": {"Enabled": False},
+        "StartupProbe": {"Enabled": True, "Dependencies": ["Logger", "LinkManager"]},
+    }
+
+
+def parse_config(config_file):
+    """Run CFX.parse_config on the config file as if it were given with -c"""
+    from controller.framework.CFx import CFX
+    argv = sys.argv
+    sys.argv = [argv[0], "-c", config_file]
+    try:
+        start = time.perf_counter()
+        config, _ = CFX.parse_config()
+        elapsed = time.perf_counter() - start
+    finally:
+        sys.argv = argv
+    return config, elapsed
+
+
+def start_node(cfx_class, config_file):
+    result = OrderedDict()
+    start = time.monotonic()
+    config, result["ParseConfigSec"] = parse_config(config_file)
+    begin = time.perf_counter()
+    cfx = cfx_class(config)
+    result["ConstructSec"] = time.perf_counter() - begin
+    begin = time.perf_counter()
+    cfx.initialize()
+    result["InitializeSec"] = time.perf_counter() - begin
+    result["ModuleInitSec"] = dict(cfx._init_times)    # pylint: disable=protected-access
+    result["NodeId"] = config["CFx"]["NodeId"]
+    return cfx, start, result
+
+
+def run(num_nodes, runtime, base_port, timeout, workdir):
+    from controller.bench.fake_tincan import FakeTincan, FakeTincanNetwork
+    cfx_class = bench_cfx_class(runtime)
+    from controller.bench import loopback_signal
+    hub = loopback_signal.LoopbackHub()
+    hub.start()
+    loopback_signal.Signal.hub = hub
+    network = FakeTincanNetwork()
+    node_ids = [uuid.uuid4().hex for _ in range(num_nodes)]
+    tincans, nodes = [], []
+    bench_start = time.monotonic()
+    try:
+        for idx, node_id in enumerate(node_ids):
+            ctrl_port, tincan_port = base_port + 2 * idx, base_port + 2 * idx + 1
+            tincan = FakeTincan(tincan_port, network=network)
+            tincan.start()
+            tincans.append(tincan)
+            log_dir = os.path.join(workdir, "node{0}".format(idx), "")
+            config_file = os.path.join(workdir, "node{0}.json".format(idx))
+            with open(config_file, "w") as f:
+                json.dump(node_config(node_id, ctrl_port, tincan_port, runtime, log_dir), f)
+            nodes.append(start_node(cfx_class, config_file))
+        deadline = time.monotonic() + timeout
+        for cfx, start, result in nodes:
+            probe = cfx._cfx_handle_dict["StartupProbe"]._cm_instance   # pylint: disable=protected-access
+            probe.connected.wait(max(0, deadline - time.monotonic()))
+            result["FirstConnectedSec"] = None
+            if probe.connected_time is not None:
+                result["FirstConnectedSec"] = probe.connected_time - start
+        first = [start + result["FirstConnectedSec"] for _, start, result in nodes
+                 if result["FirstConnectedSec"] is not None]
+        time_to_tunnel = min(first) - bench_start if first else None
+    finally:
+        for cfx, _, _ in nodes:
+            cfx.terminate()
+        for tincan in tincans:
+            tincan.stop()
+        hub.stop()
+    return [result for _, _, result in nodes], time_to_tunnel
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Controller startup and time to first tunnel")
+    parser.add_argument("--nodes", type=int, default=2, help="controllers started in-process")
+    parser.add_argument("--runtime", default="Threads", choices=("Threads", "Asyncio"))
+    parser.add_argument("--base-port", type=int, default=15800,
+                        help="first of the control ports, each node uses two")
+    parser.add_argument("--timeout", type=float, default=60,
+                        help="seconds to wait for the first tunnel")
+    parser.add_argument("--json", dest="json_file", help="write the results to this file")
+    args = parser.parse_args()
+
+    imports, import_errors = import_times()
+    print("{0:<40} {1:>10}".format("module", "import ms"))
+    for name, elapsed in imports.items():
+        print("{0:<40} {1:>10.1f}".format(name, elapsed * 1e3))
+    for name, err in import_errors.items():
+        print("{0:<40} {1}".format(name, err))
+
+    with tempfile.TemporaryDirectory(prefix="ipop-startup-") as workdir:
+        nodes, time_to_tunnel = run(args.nodes, args.runtime, args.base_port, args.timeout,
+                                    workdir)
+    print("{0:>8} {1:>12} {2:>12} {3:>12} {4:>14}".format(
+        "node", "parse ms", "construct ms", "init ms", "connected ms"))
+    for result in nodes:
+        connected = result["FirstConnectedSec"]
+        print("{0:>8} {1:>12.1f} {2:>12.1f} {3:>12.1f} {4:>14}".format(
+            result["NodeId"][:7], result["ParseConfigSec"] * 1e3, result["ConstructSec"] * 1e3,
+            result["InitializeSec"] * 1e3,
+            "timeout" if connected is None else "{0:.1f}".format(connected * 1e3)))
+    print("time to first tunnel: {0}".format(
+        "timeout" if time_to_tunnel is None else "{0:.3f}s".format(time_to_tunnel)))
+
+    results = OrderedDict(Python=sys.version.split()[0], Runtime=args.runtime, Nodes=args.nodes,
+                          ImportSec=imports, ImportErrors=import_errors, Startup=nodes,
+                          TimeToFirstTunnelSec=time_to_tunnel)
+    if args.json_file:
+        with open(args.json_file, "w") as f:
+            json.dump(results, f, indent=2)
+    if time_to_tunnel is None:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
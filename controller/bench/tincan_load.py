@@ -0,0 +1,377 @@
+# ipop-project
+# Copyright 2016, University of Florida
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+Load test of TincanInterface on its own. A controller with only the Logger, TincanInterface and
+a load driver module is started against a fake Tincan, run in its own process with the given
+latency, jitter and loss unless --tincan-port names one that is already running. The driver
+creates the links whose stats are queried, then submits control requests to TincanInterface at
+the target rate for the duration of the run, with at most --window of them outstanding, and
+reports:
+
+- the transactions completed per second,
+- the response latency, from the submission of the request to the driver to its response,
+- the transactions that were lost, which expire after --timeout without a response, and those
+  that failed with a response.
+
+The mix names the weight of each kind of transaction. A tunnel is created and removed, and a
+link is created, reported up by Tincan and removed, so each of them is two transactions.
+
+    python -m controller.bench.tincan_load --rate 5000 --duration 10 --loss 0.001
+"""
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from controller.framework.ControllerModule import (ControllerModule, notification_handler,
+                                                   response_handler)
+
+OVERLAY_ID = "A0FB389"
+MIX = OrderedDict([("stats", 4), ("cas", 2), ("icc", 2), ("tunnel", 1), ("link", 1)])
+
+
+class TincanLoadDriver(ControllerModule):
+    """Submits the control requests and records the response latency of each of them"""
+    def __init__(self, cfx_handle, module_config, module_name):
+        super(TincanLoadDriver, self).__init__(cfx_handle, module_config, module_name)
+        self._lock = threading.Lock()
+        self._submitted = {}    # CBT tag -> perf_counter at submission
+        self.idle = threading.Condition(self._lock)
+        self.timeout = None
+        self.tunnel_ids = []
+        self.link_ids = []
+        self.submitted = 0
+        self.last_response = None
+        self.latencies = []
+        self.completed = Counter()  # action -> transactions completed with success
+        self.failed = Counter()     # action -> transactions that failed with a response
+        self.lost = Counter()       # action -> transactions expired without a response
+        self.link_events = Counter()    # LinkStateChange state -> notifications
+
+    def initialize(self):
+        self._cfx_handle.start_subscription("TincanInterface", "TCI_TINCAN_MSG_NOTIFY")
+
+    @property
+    def outstanding(self):
+        return len(self._submitted)
+
+    def submit(self, action, params):
+        cbt = self.create_cbt(self._module_name, "TincanInterface", action, params)
+        cbt.timeout = self.timeout
+        with self._lock:
+            self._submitted[cbt.tag] = time.perf_counter()
+            self.submitted += 1
+        self.submit_cbt(cbt)
+
+    def submit_kind(self, kind, rand):
+        if kind == "stats":
+            self.submit("TCI_QUERY_LINK_STATS", self.tunnel_ids)
+        elif kind == "cas":
+            self.submit("TCI_QUERY_CAS", {"OverlayId": OVERLAY_ID,
+                                          "LinkId": rand.choice(self.link_ids)})
+        elif kind == "icc":
+            self.submit("TCI_ICC", {"OverlayId": OVERLAY_ID, "LinkId": rand.choice(self.link_ids),
+                                    "Data": "load"})
+        elif kind == "tunnel":
+            self.submit("TCI_CREATE_TUNNEL", tunnel_params(uuid.uuid4().hex))
+        elif kind == "link":
+            self.submit("TCI_CREATE_LINK", link_params(uuid.uuid4().hex, uuid.uuid4().hex))
+
+    @response_handler("TCI_QUERY_LINK_STATS", "TCI_QUERY_CAS", "TCI_ICC", "TCI_CREATE_TUNNEL",
+                      "TCI_CREATE_LINK", "TCI_REMOVE_TUNNEL", "TCI_REMOVE_LINK")
+    def resp_handler_control(self, cbt):
+        now = time.perf_counter()
+        action = cbt.request.action
+        params = cbt.request.params
+        expired = cbt.expired
+        with self._lock:
+            submitted = self._submitted.pop(cbt.tag)
+            if expired:
+                self.lost[action] += 1
+            else:
+                self.last_response = now
+                if cbt.response.status:
+                    self.completed[action] += 1
+                    self.latencies.append(now - submitted)
+                else:
+                    self.failed[action] += 1
+        self.free_cbt(cbt)
+        # the tunnels and links created under load are removed again, a lost request is not
+        # followed up as it would only be answered after the load has ended
+        if not expired and action == "TCI_CREATE_TUNNEL" and \
+                params["TunnelId"] not in self.tunnel_ids:
+            self.submit("TCI_REMOVE_TUNNEL", {"OverlayId": OVERLAY_ID,
+                                              "TunnelId": params["TunnelId"]})
+        elif not expired and action == "TCI_CREATE_LINK" and \
+                params["LinkId"] not in self.link_ids:
+            self.submit("TCI_REMOVE_LINK", {"OverlayId": OVERLAY_ID,
+                                            "TunnelId": params["TunnelId"],
+                                            "LinkId": params["LinkId"]})
+        with self._lock:
+            if not self._submitted:
+                self.idle.notify_all()
+
+    @notification_handler("TCI_TINCAN_MSG_NOTIFY")
+    def req_handler_tincan_msg(self, cbt):
+        if cbt.request.params["Command"] == "LinkStateChange":
+            with self._lock:
+                self.link_events[cbt.request.params["Data"]] += 1
+
+    def wait_idle(self, timeout):
+        """Wait until every transaction has a response or has expired"""
+        with self._lock:
+            return self.idle.wait_for(lambda: not self._submitted, timeout)
+
+    def reset(self):
+        with self._lock:
+            self.submitted = 0
+            self.last_response = None
+            self.latencies = []
+            self.completed.clear()
+            self.failed.clear()
+            self.lost.clear()
+            self.link_events.clear()
+
+    def timer_method(self):
+        pass
+
+    def terminate(self):
+        pass
+
+
+def tunnel_params(tnl_id):
+    return {"OverlayId": OVERLAY_ID, "TunnelId": tnl_id, "NodeId": None, "Type": "TUNNEL",
+            "TapName": "ipop" + tnl_id[:7], "StunServers": ["stun.l.google.com:19302"]}
+
+
+def link_params(tnl_id, link_id):
+    params = tunnel_params(tnl_id)
+    params.update(LinkId=link_id, NodeData={"UID": uuid.uuid4().hex, "MAC": "",
+                                            "CAS": "peer:udp:cas", "FPR": ""})
+    return params
+
+
+def udp_rcvbuf_errors():
+    """The datagrams the kernel has dropped on full UDP receive buffers, None if not known"""
+    total = None
+    try:
+        with open("/proc/net/snmp") as f:
+            rows = [line.split() for line in f if line.startswith("Udp:")]
+        total = int(dict(zip(rows[0], rows[1]))["RcvbufErrors"])
+        with open("/proc/net/snmp6") as f:
+            for line in f:
+                if line.startswith("Udp6RcvbufErrors"):
+                    total += int(line.split()[1])
+    except (OSError, IndexError, KeyError, ValueError):
+        pass
+    return total
+
+
+def percentile(ordered, fraction):
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def node_config(ctrl_port, tincan_port, runtime):
+    return {
+        "CFx": {"NodeId": uuid.uuid4().hex, "Overlays": [OVERLAY_ID], "Runtime": runtime,
+                "ConfigWatch": False},
+        "Logger": {"LogLevel": "ERROR", "Device": "Console"},
+        "TincanInterface": {"CtrlRecvPort": ctrl_port, "CtrlSendPort": tincan_port},
+        "Signal": {"Enabled": False},
+        "LinkManager": {"Enabled": False},
+        "Topology": {"Enabled": False},
+        "BridgeController": {"Enabled": False},
+        "TincanLoadDriver": {"Enabled": True, "Dependencies": ["Logger", "TincanInterface"]},
+    }
+
+
+def start_tincan(args):
+    """Run the fake Tincan in its own process, so it does not compete for the GIL"""
+    cmd = [sys.executable, "-m", "controller.bench.fake_tincan", "--port", str(args.tincan_port),
+           "--latency", str(args.latency), "--jitter", str(args.jitter),
+           "--loss", str(args.loss)]
+    if args.max_links is not None:
+        cmd += ["--max-links", str(args.max_links)]
+    if args.seed is not None:
+        cmd += ["--seed", str(args.seed)]
+    return subprocess.Popen(cmd, stdout=subprocess.PIPE, universal_newlines=True)
+
+
+def drive(driver, rate, duration, window, mix, rand):
+    """
+    Submit transactions at rate per second, 0 is as fast as the window allows, and return the
+    time the load started
+    """
+    kinds = rand.choices(list(mix), weights=list(mix.values()), k=65536)
+    issued = 0
+    start = time.perf_counter()
+    end = start + duration
+    while True:
+        now = time.perf_counter()
+        if now >= end:
+            break
+        due = int((now - start) * rate) - issued if rate else window
+        due = min(due, window - driver.outstanding)
+        if due <= 0:
+            time.sleep(0.0005)
+            continue
+        for _ in range(due):
+            driver.submit_kind(kinds[issued % len(kinds)], rand)
+            issued += 1
+    return start
+
+
+def run(args):
+    from controller.bench.startup import bench_cfx_class, parse_config
+    from controller.modules.TincanInterface import wait_for_tincan
+    tincan = None if args.external else start_tincan(args)
+    cfx = None
+    result = OrderedDict(Runtime=args.runtime, Rate=args.rate, Window=args.window,
+                         Links=args.links, LatencySec=args.latency, JitterSec=args.jitter,
+                         Loss=args.loss)
+    try:
+        with tempfile.TemporaryDirectory(prefix="ipop-tincan-load-") as workdir:
+            config_file = os.path.join(workdir, "config.json")
+            with open(config_file, "w") as f:
+                json.dump(node_config(args.ctrl_port, args.tincan_port, args.runtime), f)
+            config, _ = parse_config(config_file)
+        result["TincanReadySec"] = wait_for_tincan(config["TincanInterface"])
+        cfx = bench_cfx_class(args.runtime, TincanLoadDriver)(config)
+        cfx.initialize()
+        driver = cfx._cfx_handle_dict["TincanLoadDriver"]._cm_instance  # pylint: disable=protected-access
+        driver.timeout = args.timeout
+        rand = random.Random(args.seed)
+
+        # the tunnels and links of the overlay, one link for each tunnel as created by LinkManager
+        driver.tunnel_ids = [uuid.uuid4().hex for _ in range(args.links)]
+        driver.link_ids = [uuid.uuid4().hex for _ in range(args.links)]
+        for tnl_id, link_id in zip(driver.tunnel_ids, driver.link_ids):
+            driver.submit("TCI_CREATE_LINK", link_params(tnl_id, link_id))
+        driver.wait_idle(args.timeout + 1)
+        result["LinksCreated"] = driver.completed["TCI_CREATE_LINK"]
+        driver.reset()
+
+        mix = OrderedDict((kind, weight) for kind, weight in args.mix.items() if weight > 0)
+        if not driver.link_ids:
+            mix.pop("cas", None)
+            mix.pop("icc", None)
+        rcvbuf_errors = udp_rcvbuf_errors()
+        start = drive(driver, args.rate, args.duration, args.window, mix, rand)
+        drained = driver.wait_idle(args.timeout + 1)
+        if rcvbuf_errors is not None:
+            rcvbuf_errors = udp_rcvbuf_errors() - rcvbuf_errors
+        # the lost transactions expire after the last response
+        elapsed = (driver.last_response or start) - start
+        latencies = sorted(driver.latencies)
+        completed = sum(driver.completed.values())
+        result["Submitted"] = driver.submitted
+        result["LoadSec"] = elapsed
+        result["Completed"] = completed
+        result["Failed"] = sum(driver.failed.values())
+        result["Lost"] = sum(driver.lost.values()) + (0 if drained else driver.outstanding)
+        result["ThroughputPerSec"] = completed / elapsed if elapsed else None
+        result["LatencyP50Sec"] = percentile(latencies, 0.5)
+        result["LatencyP99Sec"] = percentile(latencies, 0.99)
+        result["LatencyMaxSec"] = latencies[-1] if latencies else None
+        # a loss of the fake Tincan is not counted here, a full receive buffer is, on either end
+        result["RcvbufErrors"] = rcvbuf_errors
+        result["LinkStateChanges"] = dict(driver.link_events)
+        result["Actions"] = OrderedDict(
+            (action, OrderedDict(Completed=driver.completed[action], Failed=driver.failed[action],
+                                 Lost=driver.lost[action]))
+            for action in sorted(set(driver.completed) | set(driver.failed) | set(driver.lost)))
+    finally:
+        if cfx is not None:
+            cfx.terminate()
+        if tincan is not None:
+            tincan.terminate()
+            out, _ = tincan.communicate()
+            print(out, end="")
+    return result
+
+
+def parse_mix(value):
+    mix = OrderedDict((kind, 0) for kind in MIX)
+    for item in value.split(","):
+        kind, _, weight = item.partition("=")
+        if kind not in mix:
+            raise argparse.ArgumentTypeError("unknown transaction {0}".format(kind))
+        mix[kind] = int(weight or 1)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput and latency of TincanInterface")
+    parser.add_argument("--rate", type=float, default=2000,
+                        help="transactions submitted per second, 0 is as fast as the window "
+                             "allows")
+    parser.add_argument("--duration", type=float, default=10, help="seconds of load")
+    parser.add_argument("--window", type=int, default=256,
+                        help="max transactions outstanding at once")
+    parser.add_argument("--links", type=int, default=8,
+                        help="links whose stats are queried and addressed by ICC")
+    parser.add_argument("--mix", type=parse_mix, default=MIX,
+                        help="weights of the transactions, such as stats=4,cas=2,icc=2,"
+                             "tunnel=1,link=1")
+    parser.add_argument("--timeout", type=float, default=2,
+                        help="seconds after which a transaction without a response is lost")
+    parser.add_argument("--runtime", default="Threads", choices=("Threads", "Asyncio"))
+    parser.add_argument("--latency", type=float, default=0, help="the fake Tincan's latency")
+    parser.add_argument("--jitter", type=float, default=0, help="the fake Tincan's jitter")
+    parser.add_argument("--loss", type=float, default=0, help="the fake Tincan's loss")
+    parser.add_argument("--max-links", type=int, help="the fake Tincan's link limit")
+    parser.add_argument("--seed", type=int, help="seed of the mix and the fake Tincan")
+    parser.add_argument("--ctrl-port", type=int, default=15901, help="the controller's port")
+    parser.add_argument("--tincan-port", type=int, default=15900, help="the fake Tincan's port")
+    parser.add_argument("--external", action="store_true",
+                        help="use the Tincan already running on --tincan-port")
+    parser.add_argument("--json", dest="json_file", help="write the results to this file")
+    args = parser.parse_args()
+
+    result = run(args)
+    for key, value in result.items():
+        if key == "Actions":
+            continue
+        if isinstance(value, float):
+            value = "{0:.6f}".format(value) if key.endswith("Sec") else "{0:g}".format(value)
+        print("{0:<20} {1}".format(key, value))
+    print("{0:<24} {1:>10} {2:>8} {3:>8}".format("action", "completed", "failed", "lost"))
+    for action, counts in result["Actions"].items():
+        print("{0:<24} {1:>10} {2:>8} {3:>8}".format(action, counts["Completed"],
+                                                      counts["Failed"], counts["Lost"]))
+    result["Python"] = sys.version.split()[0]
+    if args.json_file:
+        with open(args.json_file, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
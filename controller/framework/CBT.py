@@ -19,12 +19,20 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
 
+import itertools
 import uuid
 
 
 class CBT():
-    tag_counter = int(uuid.uuid4().hex[:15], base=16)
+    __slots__ = ("tag", "parent", "child_count", "completed", "op_type", "request", "response",
+                 "time_create", "time_submit", "time_complete", "time_free", "timeout",
+                 "expired", "_spare_response")
+    # next() on a count is atomic, so tags are unique across all the threads creating CBTs
+    _tags = itertools.count(int(uuid.uuid4().hex[:15], base=16))
+
     class Request():
+        __slots__ = ("initiator", "recipient", "action", "params")
+
         def __init__(self, initiator="", recipient="", action="", params=None):
             self.initiator = initiator
             self.recipient = recipient
@@ -37,6 +45,8 @@ class CBT():
             return msg
 
     class Response():
+        __slots__ = ("status", "initiator", "recipient", "data")
+
         def __init__(self,):
             self.status = False
             self.initiator = None
@@ -49,18 +59,34 @@ class CBT():
             return msg
 
     def __init__(self, initiator="", recipient="", action="", params=""):
-        self.tag = CBT.tag_counter
-        CBT.tag_counter = CBT.tag_counter + 1
+        self.request = self.Request(initiator, recipient, action, params)
+        self._spare_response = None
+        self.response = None
+        self._init_state()
+
+    def _init_state(self):
+        self.tag = next(CBT._tags)
         self.parent = None
         self.child_count = 0
         self.completed = False
         self.op_type = "Request"
-        self.request = self.Request(initiator, recipient, action, params)
-        self.response = None
         self.time_create = None
         self.time_submit = None
         self.time_complete = None
         self.time_free = None
+        self.timeout = None  # seconds the recipient has to complete the request
+        self.expired = False
+
+    def reuse(self, initiator="", recipient="", action="", params=""):
+        """
+        Reinitialize a released CBT as a new request. It is given a new tag so any stale
+        reference held by its previous tag no longer matches it.
+        """
+        if self.response is not None:
+            self._spare_response = self.response
+            self.response = None
+        self.set_request(initiator, recipient, action, params)
+        self._init_state()
 
     def __repr__(self):
         msg = ("{\n\ttag: %d,\n\tparent: %s,\n\tchild_count: %d, \
@@ -78,7 +104,12 @@ class CBT():
 
     def set_response(self, data="", status=False):
         self.op_type = "Response"
-        self.response = self.Response()
+        if self.response is None:
+            if self._spare_response is not None:
+                self.response = self._spare_response
+                self._spare_response = None
+            else:
+                self.response = self.Response()
         self.response.initiator = self.request.recipient
         self.response.recipient = self.request.initiator
         self.response.status = status
@@ -21,23 +21,57 @@
 
 import os
 import json
+import logging
 import signal
 import argparse
+import copy
+import concurrent.futures
 import threading
 import time
+import functools
 import importlib
+import importlib.util
 import uuid
 from collections import OrderedDict
 import controller.framework.fxlib as fxlib
+from controller.framework.CFxConfig import (CFxConfigWatcher, diff_config,
+                                            report_config_changes, validate_config,
+                                            wait_for_file)
 from controller.framework.CFxHandle import CFxHandle
+from controller.framework.CFxLog import CFxLogChannel
+from controller.framework.CFxMetrics import CFxMetrics
 from controller.framework.CFxSubscription import CFxSubscription
+from controller.framework.CFxTimer import CFxTimerWheel
+from controller.framework.CFxTrace import CFxTracer
+
+
+@functools.lru_cache(maxsize=None)
+def find_model_spec(model, module_name):
+    """
+    The spec of the model's implementation of module_name, None if the model does not override
+    it. Specs are looked up with the import system once, regardless of the working directory.
+    """
+    try:
+        return importlib.util.find_spec("controller.modules.{0}.{1}".format(model, module_name))
+    except ImportError:
+        # the model has no package of its own
+        return None
+
 
 # pylint: disable=protected-access
 class CFX():
-
-    def __init__(self):
-        self._config = OrderedDict()
-        self.parse_config()
+    # the type of handle created for each controller module
+    handle_class = CFxHandle
+    # the modules of a dependency level are initialized on concurrent threads
+    parallel_init = True
+
+    def __init__(self, config=None, config_file=None):
+        # the config file is watched for changes while the controller runs
+        self._config_file = config_file
+        self._config_watcher = None
+        if config is None:
+            config, self._config_file = self.parse_config()
+        self._config = config
         """
         CFxHandleDict is a dict containing the references to CFxHandles of all
         CMs. The key is the module name and value as the CFxHandle reference
@@ -45,15 +79,45 @@ class CFX():
         self._cfx_handle_dict = {}
         self.model = self._config["CFx"]["Model"]
         self._event = None
-        self._subscriptions = {}
+        self._subscriptions = {}  # (owner name, subscription name) -> CFxSubscription
         self._node_id = self._set_node_id()
         self._load_order = []
+        self._init_times = {}  # module name -> seconds taken by its initialize()
+        self._action_prio = dict(fxlib.CBT_PRIO_ACTIONS)
+        self._log_channel = CFxLogChannel(
+            self._config["CFx"]["LogBufferSize"],
+            getattr(logging, self._config["Logger"].get("LogLevel", "NOTSET"), logging.NOTSET))
+        self._timer_wheel = CFxTimerWheel(self._config["CFx"]["TimerResolution"])
+        self._tracer = None
+        self._trace_requested = False
+        if self._config["CFx"].get("TraceBufferSize", 0) > 0:
+            self._tracer = CFxTracer(self._config["CFx"]["TraceBufferSize"])
+        self._metrics = None
+        if self._config["CFx"].get("MetricsFile"):
+            self._metrics = CFxMetrics(self._config["CFx"]["MetricsFile"],
+                                       self._config["CFx"].get("MetricsInterval", 15))
 
     def submit_cbt(self, cbt):
         recipient = cbt.request.recipient
+        prio = self._action_prio.get(cbt.request.action)
+        if prio is None:
+            prio = self._classify_action(cbt.request.action)
         if cbt.op_type == "Response":
             recipient = cbt.response.recipient
-        self._cfx_handle_dict[recipient]._cm_queue.put(cbt)
+            if prio != fxlib.CBT_PRIO_LOG:
+                prio = fxlib.CBT_PRIO_CONTROL
+        self._cfx_handle_dict[recipient].enqueue_cbt(prio, cbt)
+
+    def _classify_action(self, action):
+        """
+        Determine the priority class of a CBT action from its prefix and cache the result so
+        subsequent CBTs with the same action are classified with a single lookup.
+        """
+        prio = fxlib.CBT_PRIO_QUERY
+        if action:
+            prio = fxlib.CBT_PRIO_PREFIXES.get(action[:4], fxlib.CBT_PRIO_QUERY)
+        self._action_prio[action] = prio
+        return prio
 
     def initialize(self,):
         # check for circular dependencies in the configuration file
@@ -68,45 +132,97 @@ class CFX():
             raise RuntimeError("Circular dependency detected in config.json. Fix and restart IPOP")
 
         self.build_load_order()
-        # iterate and load the modules specified in the configuration file
-        for module_name in self._load_order:
-            self.load_module(module_name)
-
-        # intialize all the CFxHandles which in turn initialize the CMs
-        for module_name in self._load_order:
-            self._cfx_handle_dict[module_name].initialize()
-
-        # start all the worker and timer threads
+        if self._timer_wheel is not None:
+            self._timer_wheel.start()
+        try:
+            # iterate and load the modules specified in the configuration file
+            for module_name in self._load_order:
+                self.load_module(module_name)
+
+            # intialize all the CFxHandles which in turn initialize the CMs
+            self._initialize_modules()
+        except BaseException:
+            if self._timer_wheel is not None:
+                self._timer_wheel.stop()
+            raise
+
+        # start all the worker threads
         for module_name in self._cfx_handle_dict:
-            self._cfx_handle_dict[module_name]._cm_thread.start()
-            if self._cfx_handle_dict[module_name]._timer_thread:
-                self._cfx_handle_dict[module_name]._timer_thread.start()
-
-    def load_module(self, module_name):
+            for worker in self._cfx_handle_dict[module_name]._cm_threads:
+                worker.start()
+        if self._metrics is not None:
+            self._metrics.start()
+        if self._config_file and self._config["CFx"].get("ConfigWatch", False):
+            self._config_watcher = CFxConfigWatcher(self._config_file, self.reload_config,
+                                                    self._config["CFx"]["ConfigPollInterval"])
+            self._config_watcher.start()
+
+    def _initialize_modules(self):
+        """
+        Initialize the modules one dependency level at a time. The modules of a level only
+        depend on the lower ones, so they are initialized in parallel and the time to ready is
+        that of the slowest module in each level instead of the sum over all of them.
         """
-        Dynamically load the modules specified in the config file. Allow model
+        start = time.monotonic()
+        for level in self._dependency_levels():
+            if self.parallel_init and len(level) > 1:
+                with concurrent.futures.ThreadPoolExecutor(len(level), "CFx::__init") as pool:
+                    futs = [pool.submit(self._initialize_module, name) for name in level]
+                # report from this thread once the level joined so the lines do not interleave
+                for module_name in level:
+                    self._print_init_time(module_name)
+                # re-raise the first failure
+                for fut in futs:
+                    fut.result()
+            else:
+                for module_name in level:
+                    self._initialize_module(module_name)
+                    self._print_init_time(module_name)
+        crit_path = sum(max(self._init_times[name] for name in level)
+                        for level in self._dependency_levels())
+        print("Modules initialized in {0:.3f}s, critical path {1:.3f}s, serial sum {2:.3f}s"
+              .format(time.monotonic() - start, crit_path, sum(self._init_times.values())))
+
+    def _initialize_module(self, module_name):
+        start = time.monotonic()
+        self._cfx_handle_dict[module_name].initialize()
+        self._init_times[module_name] = time.monotonic() - start
+
+    def _print_init_time(self, module_name):
+        # a module that failed to initialize has no time recorded
+        if module_name in self._init_times:
+            print("{0} initialized in {1:.3f}s".format(module_name, self._init_times[module_name]))
+
+    def _module_class(self, module_name):
+        """
+        Import the module implementing module_name and return its class. Allow model
         specific module implementations to override the default by attempting
         to load them first.
         """
-        if self.model:
-            if os.path.isfile("controller/modules/{0}/{1}.py"
-                              .format(self.model, module_name)):
-                module = importlib.import_module("controller.modules.{0}.{1}"
-                                                 .format(self.model, module_name))
-            else:
-                module = importlib.import_module("controller.modules.{0}"
-                                                 .format(module_name))
-
+        spec = find_model_spec(self.model, module_name) if self.model else None
+        if spec is not None:
+            module = importlib.import_module(spec.name)
+        else:
+            module = importlib.import_module("controller.modules.{0}"
+                                             .format(module_name))
         # get the class with name key from module
-        module_class = getattr(module, module_name)
+        return getattr(module, module_name)
+
+    def load_module(self, module_name):
+        """Dynamically load the modules specified in the config file"""
+        module_class = self._module_class(module_name)
 
         # create a CFxHandle object for each module
-        handle = CFxHandle(self)
+        handle = self.handle_class(self)
         self._config[module_name]["NodeId"] = self._node_id
         instance = module_class(handle, self._config[module_name], module_name)
 
         handle._cm_instance = instance
         handle._cm_config = self._config[module_name]
+        handle._create_worker_queues()
+        if self._metrics is not None:
+            handle._metrics = self._metrics.add_module(module_name, handle)
+        handle._tracer = self._tracer
 
         # store the CFxHandle object references in the
         # dict with module name as the key
@@ -150,10 +266,9 @@ class CFX():
         # pylint: disable=unused-argument
         print("Signal handler called with signal ", signum)
 
-    def parse_config(self):
-        for k in fxlib.MODULE_ORDER:
-            self._config[k] = fxlib.CONFIG.get(k)
-        self._set_nid_file_name()
+    @staticmethod
+    def parse_config():
+        """Load the config given on the command line, returns it and the config file if any"""
         parser = argparse.ArgumentParser(description="Starts the IPOP Controller")
         parser.add_argument("-c", help="load configuration from a file",
                             dest="config_file", metavar="config_file")
@@ -164,24 +279,70 @@ class CFX():
         #                     dest="ip_config", metavar="ip_config")
         args = parser.parse_args()
         if args.config_file:
-            while not os.path.isfile(args.config_file):
-                print("Waiting on config file {}".format(args.config_file))
-                time.sleep(10)
+            wait_for_file(args.config_file, fxlib.CONFIG["CFx"]["ConfigPollInterval"])
+        config = CFX.load_config(args.config_file, args.config_string)
+        if not CFX.validate_config(config):
+            raise RuntimeError("Invalid configuration. Fix the config file and restart IPOP")
+        return config, args.config_file
+
+    @staticmethod
+    def load_config(config_file=None, config_string=None):
+        """Merge the config file, or else the config string, into a copy of the defaults"""
+        config = OrderedDict()
+        for k in fxlib.MODULE_ORDER:
+            config[k] = copy.deepcopy(fxlib.CONFIG.get(k))
+        CFX._set_nid_file_name(config)
+        if config_file:
             # load the configuration file
-            with open(args.config_file) as f:
+            with open(config_file) as f:
                 # load the configuration file into an OrderedDict with the
                 # modules in the order in which they appear
                 json_data = json.load(f, object_pairs_hook=OrderedDict)
                 for key in json_data:
-                    if self._config.get(key, False):
-                        self._config[key].update(json_data[key])
+                    if config.get(key, False):
+                        config[key].update(json_data[key])
                     else:
-                        self._config[key] = json_data[key]
-        elif args.config_string:
-            loaded_config = json.loads(args.config_string)
+                        config[key] = json_data[key]
+        elif config_string:
+            loaded_config = json.loads(config_string)
             for key in loaded_config:
-                if self._config.get(key, None):
-                    self._config[key].update(loaded_config[key])
+                if config.get(key, None):
+                    config[key].update(loaded_config[key])
+        return config
+
+    @staticmethod
+    def validate_config(config):
+        """Print the problems found by the config schema, returns False if there are errors"""
+        errors, warnings = validate_config(config, fxlib.CONFIG_SCHEMA, fxlib.MODULE_SCHEMA)
+        for msg in warnings:
+            print("Config warning: {0}".format(msg))
+        for msg in errors:
+            print("Config error: {0}".format(msg))
+        return not errors
+
+    def reload_config(self):
+        """
+        Load the config file again and pass the differences from the running config to the
+        modules. The changes to CFx, to modules that are not loaded and those a module cannot
+        apply while running are reported and take effect on the next restart.
+        """
+        try:
+            config = self.load_config(self._config_file)
+        except (OSError, ValueError) as err:
+            print("Failed to reload config file {0}: {1}".format(self._config_file, err))
+            return
+        if not self.validate_config(config):
+            print("Config file {0} was not reloaded".format(self._config_file))
+            return
+        for module_name in self._cfx_handle_dict:
+            if isinstance(config.get(module_name), dict):
+                config[module_name]["NodeId"] = self._node_id
+        for module_name, changes in diff_config(self._config, config).items():
+            handle = self._cfx_handle_dict.get(module_name)
+            if handle is None:
+                report_config_changes(module_name, [], changes)
+            else:
+                handle.reload_config(changes)
 
     def _set_node_id(self,):
         config = self._config["CFx"]
@@ -202,13 +363,14 @@ class CFX():
                 f.write(nodeid)
         return nodeid
 
-    def _set_nid_file_name(self):
+    @staticmethod
+    def _set_nid_file_name(config):
         NID_FILENAME = "nid"
         if os.name == "posix":
             DIRNAME_PREFIX = os.path.normpath("/var/opt/ipop-vpn")
         else:
             DIRNAME_PREFIX = "."
-        self._config["CFx"]["NidFileName"] = os.path.join(DIRNAME_PREFIX, NID_FILENAME)
+        config["CFx"]["NidFileName"] = os.path.join(DIRNAME_PREFIX, NID_FILENAME)
 
     def wait_for_shutdown_event(self):
         self._event = threading.Event()
@@ -228,24 +390,89 @@ class CFX():
         else:
             for sig in [signal.SIGINT, signal.SIGTERM]:
                 signal.signal(sig, CFX.__handler)
-            # sleeps until signal is received
+            if self._tracer is not None:
+                signal.signal(signal.SIGUSR1, self.__trace_handler)
+            # sleeps until signal is received, SIGUSR1 writes the CBT trace and keeps waiting
             # pylint: disable=no-member
-            signal.pause()
+            while True:
+                signal.pause()
+                if not self._trace_requested:
+                    break
+                self._trace_requested = False
+                self.dump_trace()
 
-    def terminate(self):
-        for module_name in self._cfx_handle_dict:
-            if self._cfx_handle_dict[module_name]._timer_thread:
-                self._cfx_handle_dict[module_name]._exit_event.set()
-            self._cfx_handle_dict[module_name]._cm_queue.put(None)
+    def __trace_handler(self, signum=None, frame=None):
+        # pylint: disable=unused-argument
+        self._trace_requested = True
+
+    def dump_trace(self, path=None):
+        """Write the CBT trace buffer as Chrome trace event JSON to path or the TraceFile"""
+        if self._tracer is None:
+            return
+        if path is None:
+            path = self._config["CFx"].get("TraceFile", "cbt_trace.json")
+        try:
+            cnt = self._tracer.export(path)
+            print("Wrote {0} CBT trace events to {1}".format(cnt, path))
+        except OSError as err:
+            print("Failed to write the CBT trace to {0}: {1}".format(path, err))
 
-        # wait for the threads to process their current CBTs and exit
+    def terminate(self):
+        """
+        Stop the modules in reverse dependency order, the modules of a level stop in parallel
+        and each level is given an equal share of the time left of the ShutdownTimeout. The
+        workers finish their current CBT and discard the queued ones. Returns False if a module
+        had not stopped by the deadline, its workers are daemon threads and are abandoned.
+        """
+        start = time.monotonic()
+        deadline = start + self._config["CFx"]["ShutdownTimeout"]
+        if self._config_watcher is not None:
+            self._config_watcher.stop()
+        if self._timer_wheel is not None:
+            self._timer_wheel.stop()
         print("waiting for threads to exit ...")
-        for module_name in self._cfx_handle_dict:
-            self._cfx_handle_dict[module_name]._cm_thread.join()
-            print("{0} exited".format(self._cfx_handle_dict[module_name]._cm_thread.name))
-            if self._cfx_handle_dict[module_name]._timer_thread:
-                self._cfx_handle_dict[module_name]._timer_thread.join()
-                print("{0} exited".format(self._cfx_handle_dict[module_name]._timer_thread.name))
+        stopped = True
+        levels = self._dependency_levels()
+        for idx, level in enumerate(reversed(levels)):
+            level_start = time.monotonic()
+            level_deadline = level_start + max(deadline - level_start, 0) / (len(levels) - idx)
+            for module_name in level:
+                for que in self._cfx_handle_dict[module_name]._cm_queues:
+                    que.put((fxlib.CBT_PRIO_CONTROL, None))
+            for module_name in level:
+                handle = self._cfx_handle_dict[module_name]
+                for worker in handle._cm_threads:
+                    worker.join(max(level_deadline - time.monotonic(), 0))
+                stopped = self._report_stop(module_name, handle, level_start) and stopped
+        if self._metrics is not None:
+            self._metrics.stop()
+        print("Shutdown {0} in {1:.3f}s".format("completed" if stopped else "timed out",
+                                                time.monotonic() - start))
+        return stopped
+
+    @staticmethod
+    def _report_stop(module_name, handle, level_start):
+        if handle._stop_time is None:
+            print("{0} did not exit before the shutdown deadline".format(module_name))
+            return False
+        print("{0} exited in {1:.3f}s".format(module_name, handle._stop_time - level_start))
+        return True
+
+    def _dependency_levels(self):
+        """
+        Group the loaded modules into levels by their dependencies. A module is one level above
+        the highest of its dependencies, so the modules in a level only depend on lower ones.
+        """
+        levels = {}
+        # the load order places the dependencies ahead of their dependents
+        for module_name in self._load_order:
+            deps = [levels[dep] for dep in self._config[module_name].get("Dependencies", ())
+                    if dep in levels]
+            levels[module_name] = max(deps) + 1 if deps else 0
+        grouped = [[] for _ in range(max(levels.values(), default=-1) + 1)]
+        for module_name in self._load_order:
+            grouped[levels[module_name]].append(module_name)
+        return grouped
 
     def query_param(self, param_name=""):
         val = None
@@ -260,47 +487,51 @@ class CFX():
                 val = self.model
             elif param_name == "DebugCBTs":
                 val = self._config["CFx"].get("DebugCBTs", False)
+            elif param_name == "CBTLeakAges":
+                val = self._config["CFx"]["CBTLeakAges"]
+            elif param_name == "CBTLeakBucketWidth":
+                val = self._config["CFx"]["CBTLeakBucketWidth"]
             elif param_name == "RequestTimeout":
                 val = self._config["CFx"]["RequestTimeout"]
+            elif param_name == "QueueAgingLimit":
+                val = self._config["CFx"]["QueueAgingLimit"]
+            elif param_name == "Runtime":
+                val = self._config["CFx"]["Runtime"]
+            elif param_name == "CBTPoolSize":
+                val = self._config["CFx"]["CBTPoolSize"]
+            elif param_name in ("QueueCapacity", "QueueHighWatermark", "QueueLowWatermark",
+                                "QueueBlockTimeout"):
+                val = self._config["CFx"][param_name]
         except KeyError as err:
             print("Exception occurred while querying paramater:{0}, key:{1}"
                   .format(param_name, str(err)))
         return val
 
     # Caller is the subscription source
-    def publish_subscription(self, owner_name, subscription_name, owner):
-        sub = CFxSubscription(owner_name, subscription_name)
+    def publish_subscription(self, owner_name, subscription_name, owner, notify=False):
+        sub = CFxSubscription(owner_name, subscription_name, notify)
         sub._owner = owner
-        if sub._owner_name not in self._subscriptions:
-            self._subscriptions[sub._owner_name] = []
-        self._subscriptions[sub._owner_name].append(sub)
+        self._subscriptions[(owner_name, subscription_name)] = sub
         return sub
 
     def remove_subscription(self, sub):
         sub.post_update("SUBSCRIPTION_SOURCE_TERMINATED")
-        if sub._owner_name not in self._subscriptions:
+        if self._subscriptions.pop((sub._owner_name, sub._subscription_name), None) is None:
             raise NameError("Failed to remove subscription source \"{}\"."
                             " No such provider name exists."
                             .format(sub._owner_name))
-        self._subscriptions[sub._owner_name].remove(sub)
 
     def find_subscription(self, owner_name, subscription_name):
-        sub = None
-        if owner_name not in self._subscriptions:
-            raise NameError("The specified subscription provider {} was not found."
-                            .format(owner_name))
-        for sub in self._subscriptions[owner_name]:
-            if sub._subscription_name == subscription_name:
-                return sub
-        return None
+        return self._subscriptions.get((owner_name, subscription_name))
 
     # Caller is the subscription sink
-    def start_subscription(self, owner_name, subscription_name, Sink):
+    def start_subscription(self, owner_name, subscription_name, Sink, msg_filter=None):
         sub = self.find_subscription(owner_name, subscription_name)
         if sub is not None:
-            sub.add_subscriber(Sink)
+            sub.add_subscriber(Sink, msg_filter)
         else:
-            raise NameError("The specified subscription name was not found")
+            raise NameError("The specified subscription {0}:{1} was not found"
+                            .format(owner_name, subscription_name))
 
     def end_subscription(self, owner_name, subscription_name, sink):
         sub = self.find_subscription(owner_name, subscription_name)
@@ -0,0 +1,232 @@
+# ipop-project
+# Copyright 2016, University of Florida
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import asyncio
+import concurrent.futures
+import threading
+import time
+import controller.framework.fxlib as fxlib
+from controller.framework.CFx import CFX
+from controller.framework.CFxHandle import CFxHandle
+from controller.framework.CFxQueue import AsyncCBTQueue
+from controller.framework.CFxTimer import CFxTimer
+
+# pylint: disable=protected-access
+class AsyncCFxHandle(CFxHandle):
+    """
+    Handle for a controller module running on the CFx event loop. The module's workers are
+    tasks on the loop instead of threads and its timers are scheduled with call_later. The
+    synchronous process_cbt and timer_method of the module are called on the loop, a
+    process_cbt that returns a coroutine is awaited. Modules configured as Blocking have
+    their process_cbt and timer_method run on the loop's executor, one call at a time.
+    """
+    def __init__(self, CFxObject):
+        self._loop = CFxObject._loop
+        self._async_cfx = CFxObject
+        super(AsyncCFxHandle, self).__init__(CFxObject)
+        self._tasks = []
+        self._timers_stopped = False
+        self._blocking = False
+
+    def _new_queue(self):
+        return AsyncCBTQueue(self.query_param("QueueAgingLimit"))
+
+    def get_event_loop(self):
+        return self._loop
+
+    def enqueue_cbt(self, prio, cbt):
+        # CBTs submitted from threads other than the loop's, such as the XMPP threads, are
+        # handed over to the loop
+        que = self._select_queue(cbt)
+        if threading.get_ident() == self._async_cfx._loop_thread_id:
+            self._offer_cbt(que, prio, cbt)
+        else:
+            self._loop.call_soon_threadsafe(self._offer_cbt, que, prio, cbt)
+
+    def initialize(self):
+        self._cm_instance.initialize()
+        self._blocking = bool(self._cm_config.get("Blocking", False))
+        for que in self._cm_queues:
+            self._tasks.append(self._loop.create_task(self._worker(que)))
+        self._active_workers = len(self._tasks)
+
+        self._timer_interval = int(self._cm_config.get("TimerInterval", 0))
+        if self._timer_interval > 0:
+            self._interval_timer = self.schedule_timer(self._timer_interval,
+                                                       self._on_timer_interval,
+                                                       self._timer_interval)
+
+    def schedule_timer(self, delay, callback, period=0):
+        timer = CFxTimer(callback, period, self._dispatch_timer)
+        if threading.get_ident() == self._async_cfx._loop_thread_id:
+            self._arm_timer(timer, delay)
+        else:
+            self._loop.call_soon_threadsafe(self._arm_timer, timer, delay)
+        return timer
+
+    def _arm_timer(self, timer, delay):
+        if not timer.cancelled and not self._timers_stopped:
+            timer.due = time.monotonic() + delay
+            self._loop.call_later(delay, self._expire_timer, timer)
+
+    def _expire_timer(self, timer):
+        if timer.cancelled or self._timers_stopped:
+            return
+        timer.last_due = timer.due
+        timer.dispatch(timer)
+        if timer.period:
+            self._arm_timer(timer, timer.period)
+
+    def _dispatch_timer(self, timer):
+        if self._timer_queued(timer):
+            return
+        self._cm_queue.put_nowait((fxlib.CBT_PRIO_LINK, timer))
+
+    def _stop_timers(self):
+        self._timers_stopped = True
+
+    async def _worker(self, que):
+        while True:
+            cbt = await que.get()
+            if cbt is None:
+                self._active_workers -= 1
+                if self._active_workers == 0:
+                    self._cm_instance.terminate()
+                    self._stop_time = time.monotonic()
+                break
+            if isinstance(cbt, CFxTimer):
+                if self._blocking:
+                    await self._loop.run_in_executor(None, self._run_timer, cbt)
+                else:
+                    self._run_timer(cbt)
+                continue
+            # read before the handler can free the CBT, see CFxHandle.__worker
+            op_type, tag, initiator = cbt.op_type, cbt.tag, cbt.request.initiator
+            try:
+                if op_type == "Request":
+                    self._add_pending(cbt)
+                if self._blocking:
+                    await self._loop.run_in_executor(None, self._process_cbt, cbt)
+                else:
+                    ret = self._process_cbt(cbt)
+                    if asyncio.iscoroutine(ret):
+                        await ret
+            except Exception as err:
+                self._abort_cbt(cbt, err, op_type, tag, initiator)
+            if op_type == "Notify":
+                self.free_cbt(cbt)
+
+
+class AsyncCFX(CFX):
+    """
+    CFx runtime that runs all the controller modules on a single asyncio event loop. CBTs are
+    delivered through asyncio queues, module timers use call_later and the Tincan control link
+    is read by a datagram protocol. The loop runs on its own thread so the controller's main
+    thread still waits for the shutdown signal.
+    """
+    handle_class = AsyncCFxHandle
+    # the handles create their worker tasks on the loop so they are initialized from it in turn
+    parallel_init = False
+
+    def __init__(self, config=None, config_file=None):
+        self._loop = asyncio.new_event_loop()
+        self._loop_thread = None
+        self._loop_thread_id = None
+        super(AsyncCFX, self).__init__(config, config_file)
+        # timers are scheduled on the event loop
+        self._timer_wheel = None
+
+    def _run_loop(self):
+        self._loop_thread_id = threading.get_ident()
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_forever()
+
+    def _call_in_loop(self, func, *args):
+        # run func on the event loop and wait for its result
+        fut = concurrent.futures.Future()
+        def call():
+            try:
+                fut.set_result(func(*args))
+            except BaseException as err:
+                fut.set_exception(err)
+        self._loop.call_soon_threadsafe(call)
+        return fut.result()
+
+    def initialize(self):
+        self._loop_thread = threading.Thread(target=self._run_loop, name="CFx::__loop",
+                                             daemon=True)
+        self._loop_thread.start()
+        # the modules are loaded and initialized on the loop
+        self._call_in_loop(super(AsyncCFX, self).initialize)
+
+    async def _shutdown(self, deadline):
+        # the levels are stopped as in CFX.terminate, the worker tasks of a module that misses
+        # its deadline are cancelled
+        stopped = True
+        for handle in self._cfx_handle_dict.values():
+            handle._stop_timers()
+        levels = self._dependency_levels()
+        for idx, level in enumerate(reversed(levels)):
+            level_start = time.monotonic()
+            budget = max(deadline - level_start, 0) / (len(levels) - idx)
+            tasks = []
+            for module_name in level:
+                handle = self._cfx_handle_dict[module_name]
+                for que in handle._cm_queues:
+                    que.put_nowait((fxlib.CBT_PRIO_CONTROL, None))
+                tasks.extend(handle._tasks)
+            if tasks:
+                _, pending = await asyncio.wait(tasks, timeout=budget)
+                for task in pending:
+                    task.cancel()
+            for module_name in level:
+                stopped = self._report_stop(module_name, self._cfx_handle_dict[module_name],
+                                            level_start) and stopped
+        try:
+            await asyncio.wait_for(self._loop.shutdown_default_executor(),
+                                   max(deadline - time.monotonic(), 0.01))
+        except asyncio.TimeoutError:
+            print("Blocking handlers did not exit before the shutdown deadline")
+            stopped = False
+        return stopped
+
+    def terminate(self):
+        start = time.monotonic()
+        timeout = self._config["CFx"]["ShutdownTimeout"]
+        if self._config_watcher is not None:
+            self._config_watcher.stop()
+        print("waiting for modules to exit ...")
+        fut = asyncio.run_coroutine_threadsafe(self._shutdown(start + timeout), self._loop)
+        try:
+            # a handler blocking the loop keeps the shutdown itself from running
+            stopped = fut.result(timeout + 1)
+        except concurrent.futures.TimeoutError:
+            print("The event loop is blocked, abandoning it")
+            stopped = False
+        if self._metrics is not None:
+            self._metrics.stop()
+        if stopped:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._loop_thread.join()
+            self._loop.close()
+        print("Shutdown {0} in {1:.3f}s".format("completed" if stopped else "timed out",
+                                                time.monotonic() - start))
+        return stopped
@@ -0,0 +1,270 @@
+# ipop-project
+# Copyright 2016, University of Florida
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import copy
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+# a changed config value, path is the sequence of keys to it within the module's section and
+# old or new is None when the key is absent
+ConfigChange = namedtuple("ConfigChange", ["path", "old", "new"])
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+INOTIFY_EVENT = struct.Struct("iIII")   # wd, mask, cookie, len, followed by the name
+
+
+def diff_config(running, loaded):
+    """
+    The changes from the running config to the loaded one as an OrderedDict of module name to
+    a list of ConfigChange. Sections are compared key by key and lists as a whole.
+    """
+    changes = OrderedDict()
+    for module_name in _merged_keys(running, loaded):
+        module_changes = []
+        _diff_value(running.get(module_name), loaded.get(module_name), (), module_changes)
+        if module_changes:
+            changes[module_name] = module_changes
+    return changes
+
+
+def _merged_keys(old, new):
+    return list(old) + [key for key in new if key not in old]
+
+
+def _diff_value(old, new, path, changes):
+    if isinstance(old, dict) and isinstance(new, dict):
+        for key in _merged_keys(old, new):
+            _diff_value(old.get(key), new.get(key), path + (key,), changes)
+    elif old != new:
+        changes.append(ConfigChange(path, old, new))
+
+
+def validate_config(config, schema, module_schema):
+    """
+    Check the config against the schema of fxlib. Returns the errors, values of the wrong type
+    and missing required keys, and the warnings about keys the schema does not know. The
+    sections of disabled modules and of modules outside the schema are not checked.
+    """
+    errors, warnings = [], []
+    for module_name, section in config.items():
+        spec = schema.get(module_name)
+        if spec is None or (isinstance(section, dict) and section.get("Enabled") is False):
+            continue
+        if module_name != "CFx":
+            spec = dict(module_schema)
+            spec.update(schema[module_name])
+        _check_value(section, spec, module_name, errors, warnings)
+    return errors, warnings
+
+
+def _check_value(value, spec, name, errors, warnings):
+    if isinstance(spec, dict):
+        if not isinstance(value, dict):
+            errors.append("{0} must be a section, not {1!r}".format(name, value))
+            return
+        for key in spec.get(None, ()):
+            if key not in value:
+                errors.append("{0}.{1} is required".format(name, key))
+        for key, item in value.items():
+            item_spec = spec.get(key, spec.get("*"))
+            if item_spec is None:
+                warnings.append("{0}.{1} is not a known setting".format(name, key))
+            else:
+                _check_value(item, item_spec, "{0}.{1}".format(name, key), errors, warnings)
+    elif isinstance(spec, list):
+        if not isinstance(value, list):
+            errors.append("{0} must be a list, not {1!r}".format(name, value))
+            return
+        for idx, item in enumerate(value):
+            _check_value(item, spec[0], "{0}[{1}]".format(name, idx), errors, warnings)
+    elif isinstance(spec, set):
+        if not any(value == allowed for allowed in spec):
+            errors.append("{0} is {1!r}, expected one of {2}".format(
+                name, value, ", ".join(sorted(map(str, spec)))))
+    else:
+        types = spec if isinstance(spec, tuple) else (spec,)
+        # bool is an int, but true is not a valid port or interval
+        if not isinstance(value, types) or (isinstance(value, bool) and bool not in types):
+            errors.append("{0} is {1!r}, expected {2}".format(
+                name, value, " or ".join(t.__name__ for t in types)))
+
+
+def apply_config_change(config, change):
+    """Set the new value of the change in the module's config, None removes the key"""
+    *parents, key = change.path
+    for name in parents:
+        config = config.setdefault(name, {})
+    if change.new is None:
+        config.pop(key, None)
+    else:
+        config[key] = copy.deepcopy(change.new)
+
+
+def report_config_changes(module_name, applied, pending):
+    lines = []
+    for change in applied:
+        lines.append("Config {0} changed from {1!r} to {2!r}\n".format(
+            ".".join((module_name,) + change.path), change.old, change.new))
+    for change in pending:
+        lines.append("Config {0} changed to {1!r}, it takes effect when the controller is "
+                     "restarted\n".format(".".join((module_name,) + change.path), change.new))
+    # a single write, the modules report from their own workers
+    print("".join(lines), end="")
+
+
+def _inotify_watch(dirname):
+    """An inotify descriptor for the files written or moved into dirname, None if unavailable"""
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        # IN_CLOEXEC and IN_NONBLOCK have the values of the open() flags
+        fd = libc.inotify_init1(os.O_CLOEXEC | os.O_NONBLOCK)
+    except (OSError, AttributeError):
+        return None
+    if fd < 0:
+        return None
+    if libc.inotify_add_watch(fd, os.fsencode(dirname), IN_CLOSE_WRITE | IN_MOVED_TO) < 0:
+        os.close(fd)
+        return None
+    return fd
+
+
+def _read_inotify_names(fd):
+    """The names of the files in the events read from the inotify descriptor"""
+    names = set()
+    try:
+        data = os.read(fd, 65536)
+    except BlockingIOError:
+        return names
+    pos = 0
+    while pos + INOTIFY_EVENT.size <= len(data):
+        name_len = INOTIFY_EVENT.unpack_from(data, pos)[3]
+        pos += INOTIFY_EVENT.size
+        names.add(os.fsdecode(data[pos:pos + name_len].rstrip(b"\0")))
+        pos += name_len
+    return names
+
+
+def _file_signature(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_ino, st.st_size, st.st_mtime_ns
+
+
+def wait_for_file(path, poll_interval):
+    """Block until the file exists, woken by inotify or polling every poll_interval seconds"""
+    if os.path.isfile(path):
+        return
+    print("Waiting on config file {0}".format(path))
+    fd = _inotify_watch(os.path.dirname(path) or ".")
+    try:
+        while not os.path.isfile(path):
+            if fd is None:
+                time.sleep(poll_interval)
+            else:
+                # the timeout covers a file created before the watch was added
+                select.select([fd], [], [], poll_interval)
+                _read_inotify_names(fd)
+    finally:
+        if fd is not None:
+            os.close(fd)
+
+
+class CFxConfigWatcher():
+    """
+    Calls on_change on its own thread after the config file is written. The file's directory
+    is watched with inotify, which also catches editors replacing the file, and a burst of
+    events is coalesced until settle_time passes without another. Without inotify the file's
+    signature is polled every poll_interval seconds.
+    """
+    def __init__(self, path, on_change, poll_interval=2, settle_time=0.2):
+        self._path = path
+        self._name = os.path.basename(path)
+        self._on_change = on_change
+        self._poll_interval = poll_interval
+        self._settle_time = settle_time
+        self._fd = None
+        self._wake_fds = None
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @property
+    def uses_inotify(self):
+        return self._fd is not None
+
+    def start(self):
+        self._fd = _inotify_watch(os.path.dirname(self._path) or ".")
+        if self._fd is not None:
+            self._wake_fds = os.pipe()
+        self._thread = threading.Thread(target=self._watch, name="CFx::__config_watch",
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._wake_fds is not None:
+            os.write(self._wake_fds[1], b"\0")
+        if self._thread is not None:
+            self._thread.join()
+        for fd in (self._fd,) + (self._wake_fds or ()):
+            if fd is not None:
+                os.close(fd)
+        self._fd = self._wake_fds = None
+
+    def _watch(self):
+        signature = _file_signature(self._path)
+        while not self._stop_event.is_set():
+            if self._fd is None:
+                if self._stop_event.wait(self._poll_interval):
+                    return
+                current = _file_signature(self._path)
+                changed = current is not None and current != signature
+                signature = current
+            else:
+                changed = self._wait_inotify()
+            if changed and not self._stop_event.is_set():
+                try:
+                    self._on_change()
+                except Exception as err:
+                    print("Config reload failed: {0}".format(err))
+
+    def _wait_inotify(self):
+        # editors write in several steps, reload once the events have settled
+        changed = False
+        timeout = None
+        while True:
+            ready, _, _ = select.select([self._fd, self._wake_fds[0]], [], [], timeout)
+            if self._wake_fds[0] in ready:
+                return False
+            if not ready:
+                return changed
+            if self._name in _read_inotify_names(self._fd):
+                changed = True
+                timeout = self._settle_time
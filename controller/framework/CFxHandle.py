@@ -19,44 +19,140 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
 
-import copy
+import heapq
+import sys
 import threading
 import traceback
-import queue as Queue
 import time
+import controller.framework.fxlib as fxlib
 from controller.framework.CBT import CBT
+from controller.framework.CFxConfig import apply_config_change, report_config_changes
+from controller.framework.CFxLeakDetector import CFxLeakDetector
+from controller.framework.CFxQueue import CBTQueue
+from controller.framework.CFxRegistry import CBTRegistry
+from controller.framework.CFxTimer import CFxTimer
 
 class CFxHandle():
     def __init__(self, CFxObject):
-        self._cm_queue = Queue.Queue()  # CBT queue
+        self.__cfx_object = CFxObject  # CFx object reference
+        self._cm_queue = self._new_queue()  # CBT queue
+        self._cm_queues = [self._cm_queue]  # one queue per worker thread
         self._cm_instance = None
-        self._cm_thread = None  # CM worker thread
+        self._cm_threads = []  # CM worker threads
+        self._worker_idents = set()  # thread idents of the workers, which are never blocked
+        self._block_timeout = 0  # max wait of a producer on an overloaded queue
+        self._overload_cnts = (0, 0)  # dropped and coalesced CBTs at the last report
+        self._active_workers = 0
+        self._worker_lock = threading.Lock()
+        self._stop_time = None  # time.monotonic() when the module finished terminating
         self._cm_config = None
-        self.__cfx_object = CFxObject  # CFx object reference
-        self._exit_event = threading.Event()
-        self._timer_thread = None
         self._timer_interval = 0
+        self._interval_timer = None
         self._timer_loop_cnt = 1
-        self._pending_cbts = {}
-        self._owned_cbts = {}
+        self._free_cbts = []  # released CBTs available for reuse
+        self._cbt_pool_size = CFxObject.query_param("CBTPoolSize") or 0
+        self._metrics = None  # CFxModuleMetrics when CFx metrics are enabled
+        self._tracer = None  # CFxTracer when CBT tracing is enabled
+        self._leaks = None  # CFxLeakDetector when DebugCBTs is enabled
+        if CFxObject.query_param("DebugCBTs"):
+            self._leaks = CFxLeakDetector(CFxObject.query_param("CBTLeakAges"),
+                                          CFxObject.query_param("CBTLeakBucketWidth"))
+        # requests received and not yet completed, and CBTs created and not yet freed
+        self._pending_cbts = CBTRegistry("pending", self._leaks and self._leaks.pending)
+        self._owned_cbts = CBTRegistry("owned", self._leaks and self._leaks.owned)
+        self._cbt_lock = threading.Lock()  # serializes updates to linked CBTs across workers
+        self._deadlines = []  # min-heap of (deadline, tag, CBT) for the pending CBTs
+        self._deadline_lock = threading.Lock()
+        self._expiry_timer = None
+        self._expiry_deadline = None
+        self._request_timeout = CFxObject.query_param("RequestTimeout")
+        self._log_channel = CFxObject._log_channel
+
+    def log(self, level, msg, *args):
+        """
+        Write a record to the log channel if level is enabled. When args are given msg is a
+        format string and it is only formatted if the record is written.
+        """
+        if not self._log_channel.is_enabled(level):
+            return
+        if args:
+            msg = msg.format(*args)
+        self._log_channel.write(level, self._cm_instance.__class__.__name__, msg)
 
     def submit_cbt(self, cbt):
         # submit CBT to the CFx
         cbt.time_submit = time.time()
+        if self._tracer is not None:
+            self._tracer.record("submit", self._cm_instance._module_name, cbt)
         self.__cfx_object.submit_cbt(cbt)
 
+    def enqueue_cbt(self, prio, cbt):
+        """
+        Place the CBT on the queue of the worker that processes it. When the module has more
+        than one worker the CBT key selected by the module determines the worker, so CBTs with
+        the same key are processed in the order they were submitted. CBTs without a key are
+        processed by the first worker.
+        """
+        block_timeout = self._block_timeout
+        if block_timeout and threading.get_ident() in self._worker_idents:
+            block_timeout = 0
+        self._offer_cbt(self._select_queue(cbt), prio, cbt, block_timeout)
+
+    def _offer_cbt(self, que, prio, cbt, block_timeout=0):
+        queued, evicted = que.offer(prio, cbt, block_timeout)
+        if not queued:
+            self._refuse_cbt(cbt)
+        for victim in evicted:
+            self._refuse_cbt(victim)
+
+    def _refuse_cbt(self, cbt):
+        # a CBT dropped or coalesced by the overloaded queue is released, a request is failed
+        if cbt.op_type == "Notify":
+            self.free_cbt(cbt)
+        else:
+            # a refused request was never pending, no other thread can complete it
+            cbt.set_response("The request was dropped, {0} is overloaded"
+                             .format(self._cm_instance._module_name), False)
+            self.complete_cbt(cbt, claimed=True)
+
+    def _select_queue(self, cbt):
+        que = self._cm_queue
+        if len(self._cm_queues) > 1:
+            key = self._cm_instance.cbt_key(cbt)
+            if key is not None:
+                que = self._cm_queues[hash(key) % len(self._cm_queues)]
+        return que
+
     def create_cbt(self, initiator=None, recipient=None, action=None, params=None):
-        # create and return a CBT with optional parameters
-        cbt = CBT(initiator, recipient, action, params)
-        self._owned_cbts[cbt.tag] = cbt
+        # create and return a CBT with optional parameters, reusing a released one if available
+        if isinstance(action, str):
+            # actions received from peers are not interned like the ones in the source
+            action = sys.intern(action)
+        try:
+            cbt = self._free_cbts.pop()
+            cbt.reuse(initiator, recipient, action, params)
+        except IndexError:
+            cbt = CBT(initiator, recipient, action, params)
         cbt.time_create = time.time()
+        self._owned_cbts.add(cbt)
+        if self._tracer is not None:
+            self._tracer.record("create", self._cm_instance._module_name, cbt)
         return cbt
 
+    def notify(self, initiator, action, data):
+        """
+        Deliver a one-way notification to this handle's module. The CBT is created from this
+        handle's pool and is freed by the worker once the module has processed it.
+        """
+        cbt = self.create_cbt(initiator, self._cm_instance._module_name, action, data)
+        cbt.op_type = "Notify"
+        self.submit_cbt(cbt)
+
     def create_linked_cbt(self, parent):
         cbt = self.create_cbt()
         cbt.parent = parent
-        parent.child_count = parent.child_count + 1
-        cbt.time_create = time.time()
+        with self._cbt_lock:
+            parent.child_count = parent.child_count + 1
         return cbt
 
     #def get_parent_cbt(self, cbt):
@@ -66,140 +162,352 @@ class CFxHandle():
         cbt.time_free = time.time()
         if not cbt.child_count == 0:
             raise RuntimeError("Invalid attempt to free a linked CBT")
+        if self._tracer is not None:
+            self._tracer.record("free", self._cm_instance._module_name, cbt)
         if not cbt.parent is None:
-            cbt.parent.child_count = cbt.parent.child_count - 1
+            with self._cbt_lock:
+                cbt.parent.child_count = cbt.parent.child_count - 1
             cbt.parent = None
-        # explicitly deallocate CBT
-        self._owned_cbts.pop(cbt.tag, None)
-        del cbt
+        self._pending_cbts.discard(cbt)
+        # Only a CBT created by this handle and released for the first time is recycled. An
+        # expired CBT is not, as its recipient may still complete it.
+        if (self._owned_cbts.discard(cbt) and not cbt.expired and
+                len(self._free_cbts) < self._cbt_pool_size):
+            cbt.request.params = None
+            if cbt.response is not None:
+                cbt.response.data = None
+            self._free_cbts.append(cbt)
 
-    def complete_cbt(self, cbt):
-        cbt.time_complete = time.time()
-        cbt.completed = True
-        self._pending_cbts.pop(cbt.tag, None)
+    def claim_pending_cbt(self, tag):
+        """
+        Take the right to complete the pending request with tag, for threads other than the
+        worker handling it such as transport listeners. Returns the CBT, or None if it was
+        completed or expired first. Only the caller given the CBT sets its response and passes
+        it to complete_cbt() with claimed=True.
+        """
+        return self._pending_cbts.pop(tag)
+
+    def complete_cbt(self, cbt, claimed=False):
+        """
+        Complete a request received by the module and send its response to the initiator. A
+        request is completed once, by whoever removes it from the pending CBTs: the worker
+        handling it does so here, other threads claim it first. A completion that loses to
+        another, such as the expiry of the request, is discarded.
+        """
         if not cbt.child_count == 0:
             raise RuntimeError("Invalid attempt to complete a CBT with outstanding dependencies")
+        if not claimed and not self._pending_cbts.discard(cbt):
+            self.log("LOG_DEBUG", "A late completion of a completed CBT was discarded: {0}", cbt)
+            return
+        cbt.time_complete = time.time()
+        cbt.completed = True
+        if self._tracer is not None:
+            self._tracer.record("complete", self._cm_instance._module_name, cbt)
         self.__cfx_object.submit_cbt(cbt)
 
+    def _create_worker_queues(self):
+        # called by CFx when the module is loaded so that no CBT is queued before all the
+        # worker queues exist
+        num_workers = max(1, int(self._cm_config.get("Workers", 1)))
+        for _ in range(1, num_workers):
+            self._cm_queues.append(self._new_queue())
+        # the module's capacity is shared by its worker queues
+        capacity = int(self._module_param("QueueCapacity") or 0)
+        if capacity > 0:
+            capacity = max(1, capacity // num_workers)
+            for que in self._cm_queues:
+                que.set_bounds(capacity, self._module_param("QueueHighWatermark"),
+                               self._module_param("QueueLowWatermark"))
+            self._block_timeout = self._module_param("QueueBlockTimeout") or 0
+
+    def _module_param(self, param_name):
+        # a module's own setting takes precedence over the CFx one
+        val = self._cm_config.get(param_name)
+        if val is None:
+            val = self.query_param(param_name)
+        return val
+
+    def _new_queue(self):
+        return CBTQueue(self.query_param("QueueAgingLimit"))
+
+    def get_event_loop(self):
+        # the event loop the module runs on, None when each module has its own threads
+        # pylint: disable=no-self-use
+        return None
+
     def initialize(self):
         # intialize the Controller Module and start it's threads
         self._cm_instance.initialize()
 
-        # create the worker thread, which is started by CFx
-        thread_name = self._cm_instance.__class__.__name__ + "::__worker"
-        self._cm_thread = threading.Thread(target=self.__worker, name=thread_name,
-                                           daemon=False)
+        # create the worker threads, which are started by CFx
+        for idx, que in enumerate(self._cm_queues):
+            thread_name = self._cm_instance.__class__.__name__ + "::__worker"
+            if idx > 0:
+                thread_name += str(idx)
+            self._cm_threads.append(threading.Thread(target=self.__worker, args=(que,),
+                                                     name=thread_name, daemon=True))
+        self._active_workers = len(self._cm_threads)
 
         # enable the timer event if the timer_interval is specified
         self._timer_interval = int(self._cm_config.get("TimerInterval", 0))
         if self._timer_interval > 0:
-            # create the timer worker thread, which is started by CFx
-            thread_name = self._cm_instance.__class__.__name__ + "::__timer"
-            self._timer_thread = threading.Thread(target=self.__timer_worker,
-                                                  name=thread_name, daemon=False)
+            self._interval_timer = self.schedule_timer(self._timer_interval,
+                                                       self._on_timer_interval,
+                                                       self._timer_interval)
 
     def update_timer_interval(self, interval):
         self._timer_interval = interval
+        if self._interval_timer is not None:
+            self._interval_timer.cancel()
+            self._interval_timer = None
+        if interval > 0:
+            self._interval_timer = self.schedule_timer(interval, self._on_timer_interval,
+                                                       interval)
 
-    def __worker(self):
-        # get CBT from the local queue and call process_cbt() of the
+    def reload_config(self, changes):
+        """Apply the list of ConfigChange to the module on its worker, where its timers run"""
+        self.schedule_timer(0, lambda: self._reload_config(changes))
+
+    def _reload_config(self, changes):
+        # the framework applies TimerInterval, the module is offered the other changes
+        applied, pending = [], []
+        for change in changes:
+            if change.path == ("TimerInterval",) and isinstance(change.new, (int, float)):
+                apply_config_change(self._cm_config, change)
+                self.update_timer_interval(int(change.new))
+                applied.append(change)
+            else:
+                pending.append(change)
+        if pending:
+            rejected = self._cm_instance.on_config_reload(pending)
+            applied.extend(change for change in pending if change not in rejected)
+            pending = rejected
+        report_config_changes(self._cm_instance.__class__.__name__, applied, pending)
+
+    def schedule_timer(self, delay, callback, period=0):
+        """
+        Call callback on the module's worker after delay seconds, and then every period seconds
+        if a period is given. Returns the timer, call its cancel() method to stop it.
+        """
+        if delay <= 0 and not period:
+            # queued right away instead of on the next tick of the wheel
+            timer = CFxTimer(callback, dispatch=self._dispatch_timer)
+            timer.due = timer.last_due = time.monotonic()
+            self._dispatch_timer(timer)
+            return timer
+        return self.__cfx_object._timer_wheel.schedule(delay, callback, period,
+                                                       self._dispatch_timer)
+
+    def _dispatch_timer(self, timer):
+        # called on the timer wheel thread, timers are always run by the first worker
+        if self._timer_queued(timer):
+            return
+        self._cm_queue.put((fxlib.CBT_PRIO_LINK, timer))
+
+    def _timer_queued(self, timer):
+        """
+        True if the timer is still queued from its last expiry, the expiry is then skipped and
+        counted as an overrun. Otherwise the timer is marked queued until the worker runs it.
+        """
+        if timer.queued:
+            if self._metrics is not None:
+                self._metrics.observe_timer_skip()
+            return True
+        timer.queued = True
+        return False
+
+    def _run_timer(self, timer):
+        start = time.monotonic()
+        try:
+            timer.run()
+        except Exception as err:
+            self.log("LOG_WARNING", "Timer Method exception:{0}\n{1}"
+                     .format(err, traceback.format_exc()))
+        if self._metrics is not None:
+            self._metrics.observe_timer(start - timer.last_due, time.monotonic() - start,
+                                        timer.period)
+
+    def _process_cbt(self, cbt):
+        if self._metrics is None and self._tracer is None:
+            return self._cm_instance.process_cbt(cbt)
+        # the handler may complete or free the CBT so its identity is read first
+        op_type, action, tag = cbt.op_type, cbt.request.action, cbt.tag
+        parent_tag = cbt.parent.tag if cbt.parent is not None else None
+        queued = cbt.time_complete if op_type == "Response" else cbt.time_submit
+        if self._tracer is not None:
+            self._tracer.record("dequeue", self._cm_instance._module_name, cbt)
+        start = time.perf_counter()
+        wait = time.time() - queued if queued else 0.0
+        try:
+            return self._cm_instance.process_cbt(cbt)
+        finally:
+            end = time.perf_counter()
+            if self._metrics is not None:
+                self._metrics.observe_cbt(op_type, action, wait, end - start)
+            if self._tracer is not None:
+                self._tracer.record_handler(self._cm_instance._module_name, tag, action,
+                                            parent_tag, start, end)
+
+    def queue_depths(self):
+        """
+        The current and peak depth of each priority class summed over the module's queues,
+        the peaks are reset on each call.
+        """
+        depths = [que.depths() for que in self._cm_queues]
+        peaks = [que.take_peaks() for que in self._cm_queues]
+        return [(sum(cur), sum(high)) for cur, high in zip(zip(*depths), zip(*peaks))]
+
+    def queue_overloads(self):
+        """The CBTs dropped and coalesced by each priority class of the module's queues"""
+        dropped, coalesced = zip(*[que.overload_counts() for que in self._cm_queues])
+        return list(zip(map(sum, zip(*dropped)), map(sum, zip(*coalesced))))
+
+    def _on_timer_interval(self):
+        self._check_container_bounds()
+        self._cm_instance.timer_method()
+
+    def __worker(self, que):
+        # get CBT from the worker's queue and call process_cbt() of the
         # CBT recipient and passing the CBT as an argument
+        self._worker_idents.add(threading.get_ident())
         while True:
-            cbt = self._cm_queue.get()
-            # Terminate when CBT is None
+            cbt = que.get()
+            # Terminate when CBT is None, the last worker to exit terminates the module
             if cbt is None:
-                self._cm_instance.terminate()
+                with self._worker_lock:
+                    self._active_workers -= 1
+                    is_last = self._active_workers == 0
+                if is_last:
+                    self._cm_instance.terminate()
+                    self._stop_time = time.monotonic()
                 break
+            elif isinstance(cbt, CFxTimer):
+                self._run_timer(cbt)
             else:
+                # the handler may free the CBT, which another thread can then reuse at once,
+                # so its identity is read before it is dispatched
+                op_type, tag, initiator = cbt.op_type, cbt.tag, cbt.request.initiator
                 try:
-                    if not cbt.completed:
-                        self._pending_cbts[cbt.tag] = cbt
-                    self._cm_instance.process_cbt(cbt)
+                    if op_type == "Request":
+                        self._add_pending(cbt)
+                    self._process_cbt(cbt)
                 except Exception as err:
-                    log_cbt = self.create_cbt(
-                        initiator=self._cm_instance.__class__.__name__,
-                        recipient="Logger", action="LOG_WARNING",
-                        params="Process CBT exception:{0}\n{1}\n{2}"
-                        .format(err, cbt, traceback.format_exc()))
-                    self.submit_cbt(log_cbt)
-                    if cbt.request.initiator == self._cm_instance.__class__.__name__:
-                        self.free_cbt(cbt)
-                    else:
-                        cbt.set_response(None, False)
-                        self.complete_cbt(cbt)
-                finally:
-                    self._cm_queue.task_done()
-
-    def __timer_worker(self):
-        # call the timer_method of each CM every timer_interval seconds
-        while not self._exit_event.wait(self._timer_interval):
-            try:
-                self._check_container_bounds()
-                self._cm_instance.timer_method()
-            except Exception as err:
-                log_cbt = self.create_cbt(
-                    initiator=self._cm_instance.__class__.__name__,
-                    recipient="Logger", action="LOG_WARNING",
-                    params="Timer Method exception:{0}\n{1}"
-                    .format(err, traceback.format_exc()))
-                self.submit_cbt(log_cbt)
+                    self._abort_cbt(cbt, err, op_type, tag, initiator)
+                if op_type == "Notify":
+                    self.free_cbt(cbt)
+
+    def _abort_cbt(self, cbt, err, op_type, tag, initiator):
+        # release or fail a CBT whose processing raised an exception, the worker releases
+        # notifications. op_type, tag and initiator are those read before the CBT was
+        # dispatched, the handler may have released it since.
+        self.log("LOG_WARNING", "Process CBT exception:{0}\n{1} {2} tag={3}\n{4}"
+                 .format(err, op_type, initiator, tag, traceback.format_exc()))
+        if op_type == "Notify":
+            return
+        if initiator == self._cm_instance.__class__.__name__:
+            if cbt.tag == tag:
+                self.free_cbt(cbt)
+        elif self._pending_cbts.discard(cbt, tag):
+            # unless the handler completed it, or it expired, before the exception
+            cbt.set_response(None, False)
+            self.complete_cbt(cbt, claimed=True)
 
     def query_param(self, param_name=""):
         pv = self.__cfx_object.query_param(param_name)
         return pv
 
     # Caller is the subscription source
-    def publish_subscription(self, subscription_name):
+    def publish_subscription(self, subscription_name, notify=False):
         return self.__cfx_object.publish_subscription(self._cm_instance.__class__.__name__,
-                                                      subscription_name, self._cm_instance)
+                                                      subscription_name, self._cm_instance,
+                                                      notify)
 
     def remove_subscription(self, sub):
         self.__cfx_object.RemoveSubscriptionPublisher(sub)
 
     # Caller is the subscription sink
-    def start_subscription(self, owner_name, subscription_name):
-        self.__cfx_object.start_subscription(owner_name, subscription_name, self._cm_instance)
+    def start_subscription(self, owner_name, subscription_name, msg_filter=None):
+        """
+        Subscribe to the owner's events. msg_filter maps event message keys to the values that
+        are accepted, events that do not match are not delivered.
+        """
+        self.__cfx_object.start_subscription(owner_name, subscription_name, self._cm_instance,
+                                             msg_filter)
 
     def end_subscription(self, owner_name, subscription_name):
         self.__cfx_object.end_subscription(owner_name, subscription_name, self._cm_instance)
 
+    def _add_pending(self, cbt):
+        """
+        Track a request until the module completes it. The request is given a deadline from its
+        own timeout, the action's timeout or the default request timeout, and is completed with a
+        failure response if it is still pending when the deadline passes.
+        """
+        self._pending_cbts.add(cbt)
+        timeout = self._get_timeout(cbt)
+        if timeout:
+            self._push_deadline((cbt.time_submit or time.time()) + timeout, cbt)
+
+    def _get_timeout(self, cbt):
+        if cbt.timeout is not None:
+            return cbt.timeout
+        return fxlib.CBT_TIMEOUTS.get(cbt.request.action, self._request_timeout)
+
+    def _push_deadline(self, deadline, cbt):
+        with self._deadline_lock:
+            heapq.heappush(self._deadlines, (deadline, cbt.tag, cbt))
+            if self._expiry_deadline is None or deadline < self._expiry_deadline:
+                self._arm_expiry(deadline)
+
+    def _arm_expiry(self, deadline):
+        # one timer is armed for the earliest deadline, called with the deadline lock held
+        if self._expiry_timer is not None:
+            self._expiry_timer.cancel()
+        self._expiry_deadline = deadline
+        self._expiry_timer = self.schedule_timer(max(deadline - time.time(), 0),
+                                                 self._expire_pending_cbts)
+
+    def _expire_pending_cbts(self):
+        now = time.time()
+        expired = []
+        with self._deadline_lock:
+            self._expiry_timer = None
+            self._expiry_deadline = None
+            while self._deadlines and self._deadlines[0][0] <= now:
+                expired.append(heapq.heappop(self._deadlines))
+            if self._deadlines:
+                self._arm_expiry(self._deadlines[0][0])
+        for _, tag, cbt in expired:
+            if self._pending_cbts.get(tag) is not cbt:
+                continue  # completed before its deadline
+            if cbt.child_count != 0:
+                # its dependencies expire first and fail the request through its module
+                self._push_deadline(now + self._get_timeout(cbt), cbt)
+                continue
+            if not self._pending_cbts.discard(cbt):
+                continue  # completed by another thread since it was checked
+            self.log("LOG_DEBUG", "Pending CBT expired: {0}", cbt)
+            cbt.expired = True
+            cbt.set_response("The request has expired", False)
+            self.complete_cbt(cbt, claimed=True)
+
     def _check_container_bounds(self):
         if self._timer_loop_cnt % 10 == 0:
             plen = len(self._pending_cbts)
             if plen >= 50:
-                log_cbt = self.create_cbt(initiator=self._cm_instance.__class__.__name__,
-                                          recipient="Logger", action="LOG_WARNING",
-                                          params="_pending_cbts length={0}".format(plen))
-                self.submit_cbt(log_cbt)
+                self.log("LOG_WARNING", "_pending_cbts length={0}".format(plen))
             olen = len(self._owned_cbts)
             if olen >= 50:
-                log_cbt = self.create_cbt(initiator=self._cm_instance.__class__.__name__,
-                                          recipient="Logger", action="LOG_WARNING",
-                                          params="_owned_cbts length={0}".format(olen))
-                self.submit_cbt(log_cbt)
+                self.log("LOG_WARNING", "_owned_cbts length={0}".format(olen))
+            overloads = self.queue_overloads()
+            cnts = (sum(cnt[0] for cnt in overloads), sum(cnt[1] for cnt in overloads))
+            if cnts != self._overload_cnts:
+                self.log("LOG_WARNING", "Overloaded queue dropped {0} and coalesced {1} CBTs"
+                         .format(cnts[0] - self._overload_cnts[0],
+                                 cnts[1] - self._overload_cnts[1]))
+                self._overload_cnts = cnts
         self._timer_loop_cnt = self._timer_loop_cnt + 1
-        if not self.query_param("DebugCBTs"):
+        if self._leaks is None:
             return
-
-        olen = len(self._owned_cbts)
-        plen = len(self._pending_cbts)
-        ownd = copy.deepcopy(self._owned_cbts)
-        pend = copy.deepcopy(self._pending_cbts)
-        log_cbt = self.create_cbt(initiator=self._cm_instance.__class__.__name__,
-                                  recipient="Logger", action="LOG_DEBUG",
-                                  params="_pending_cbts length={0}".format(plen))
-        self.submit_cbt(log_cbt)
-        log_cbt = self.create_cbt(initiator=self._cm_instance.__class__.__name__,
-                                  recipient="Logger", action="LOG_DEBUG",
-                                  params="_owned_cbts length={0}".format(olen))
-        self.submit_cbt(log_cbt)
-        for cbt in ownd.values():
-            log_cbt = self.create_cbt(initiator=self._cm_instance.__class__.__name__,
-                                      recipient="Logger", action="LOG_DEBUG",
-                                      params="Owned CBT={0}".format(cbt))
-            self.submit_cbt(log_cbt)
-        for cbt in pend.values():
-            log_cbt = self.create_cbt(initiator=self._cm_instance.__class__.__name__,
-                                      recipient="Logger", action="LOG_DEBUG",
-                                      params="Pending CBT={0}".format(cbt))
-            self.submit_cbt(log_cbt)
+        for msg in self._leaks.report():
+            self.log("LOG_WARNING", msg)
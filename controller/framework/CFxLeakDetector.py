@@ -0,0 +1,109 @@
+# ipop-project
+# Copyright 2016, University of Florida
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import threading
+import time
+
+
+class CBTAgeBuckets():
+    """
+    CBTs grouped by their creation time into buckets of width seconds. Adding and removing a
+    CBT touches a single bucket, and finding the CBTs older than an age only visits the buckets
+    before the cutoff, so the young CBTs that make up most of the container are never looked at.
+    """
+    def __init__(self, width):
+        self._width = width
+        self._buckets = {}  # bucket index -> {tag: CBT}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(bucket) for bucket in self._buckets.values())
+
+    def add(self, cbt):
+        key = int(cbt.time_create // self._width)
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = {}
+            bucket[cbt.tag] = cbt
+
+    def remove(self, cbt):
+        key = int(cbt.time_create // self._width)
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is not None and bucket.pop(cbt.tag, None) is not None and not bucket:
+                del self._buckets[key]
+
+    def older_than(self, age, now):
+        # whole buckets before the cutoff are taken, the one it falls in is filtered
+        cutoff = now - age
+        last = int(cutoff // self._width)
+        old = []
+        with self._lock:
+            for key, bucket in self._buckets.items():
+                if key < last:
+                    old.extend(bucket.values())
+                elif key == last:
+                    old.extend(cbt for cbt in bucket.values() if cbt.time_create <= cutoff)
+        return old
+
+
+class CFxLeakDetector():
+    """
+    Tracks the CBTs owned by a module and the requests pending on it by age. The report only
+    covers the CBTs that outlived the age thresholds, summarised by the threshold, the initiator
+    and the action, so it stays short and cheap however many CBTs have leaked.
+    """
+    def __init__(self, thresholds, width):
+        self._thresholds = sorted(thresholds, reverse=True)
+        self.owned = CBTAgeBuckets(width)
+        self.pending = CBTAgeBuckets(width)
+
+    def report(self, now=None):
+        if now is None:
+            now = time.time()
+        msgs = []
+        for name, buckets in (("owned", self.owned), ("pending", self.pending)):
+            msg = self._summarize(name, buckets.older_than(self._thresholds[-1], now), now)
+            if msg:
+                msgs.append(msg)
+        return msgs
+
+    def _summarize(self, name, cbts, now):
+        if not cbts:
+            return None
+        groups = {}     # (threshold, initiator, action) -> [count, oldest age]
+        for cbt in cbts:
+            age = now - cbt.time_create
+            limit = next(lim for lim in self._thresholds if age >= lim)
+            key = (limit, cbt.request.initiator, cbt.request.action)
+            grp = groups.get(key)
+            if grp is None:
+                groups[key] = [1, age]
+            else:
+                grp[0] += 1
+                grp[1] = max(grp[1], age)
+        items = sorted(groups.items(), key=lambda i: (-i[0][0], -i[1][0]))
+        return "{0} {1} CBTs outlived their age thresholds: {2}".format(
+            len(cbts), name, "; ".join("[>{0}s] {1}:{2} x{3} (oldest {4:.0f}s)"
+                                       .format(lim, init, act, cnt, oldest)
+                                       for (lim, init, act), (cnt, oldest) in items))
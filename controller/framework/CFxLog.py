@@ -0,0 +1,78 @@
+# ipop-project
+# Copyright 2016, University of Florida
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import logging
+import threading
+import time
+from collections import deque
+
+# maps the Logger CBT actions to the python logging levels
+LOG_LEVELS = {
+    "LOG_DEBUG": logging.DEBUG, "debug": logging.DEBUG,
+    "LOG_INFO": logging.INFO, "info": logging.INFO,
+    "LOG_WARNING": logging.WARNING, "warning": logging.WARNING,
+    "LOG_ERROR": logging.ERROR, "error": logging.ERROR,
+}
+
+
+class CFxLogChannel():
+    """
+    Ring buffer of log records written directly by the controller modules and drained by the
+    Logger module. Writing a record does not allocate a CBT or wait on a queue lock, and when
+    the buffer is full the oldest record is overwritten. The level is the effective level of
+    the Logger, records below it are discarded by the writers before they are formatted.
+    """
+    def __init__(self, capacity, level=logging.NOTSET):
+        self.level = level
+        self._records = deque(maxlen=capacity)
+        self._capacity = capacity
+        self._avail = threading.Event()
+        self._closed = False
+        self.dropped = 0
+
+    def is_enabled(self, level):
+        return LOG_LEVELS.get(level, logging.WARNING) >= self.level
+
+    def write(self, level, initiator, msg):
+        if len(self._records) == self._capacity:
+            self.dropped += 1
+        self._records.append((level, initiator, msg, time.time()))
+        if not self._avail.is_set():
+            self._avail.set()
+
+    def read(self, timeout=None):
+        """
+        Wait for records to become available and remove all of them from the buffer. Returns
+        None once the channel is closed and has been drained.
+        """
+        if not self._closed:
+            self._avail.wait(timeout)
+        self._avail.clear()
+        records = []
+        while self._records:
+            records.append(self._records.popleft())
+        if not records and self._closed:
+            return None
+        return records
+
+    def close(self):
+        self._closed = True
+        self._avail.set()
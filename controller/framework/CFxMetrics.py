@@ -0,0 +1,198 @@
+# ipop-project
+# Copyright 2016, University of Florida
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import os
+import threading
+
+
+class CFxHistogram():
+    """
+    Histogram of durations with power of two buckets. Bucket i counts the observations below
+    2**i microseconds and the last bucket counts everything above, so observing a value costs a
+    bit_length() and two additions.
+    """
+    __slots__ = ("counts", "total")
+    BUCKETS = 27    # the last bound is 2**25 us, about 34 seconds
+
+    def __init__(self):
+        self.counts = [0] * self.BUCKETS
+        self.total = 0.0
+
+    def observe(self, seconds):
+        idx = int(seconds * 1000000).bit_length()
+        self.counts[min(idx, self.BUCKETS - 1)] += 1
+        self.total += seconds
+
+    def bounds(self):
+        return [repr((1 << idx) / 1000000) for idx in range(self.BUCKETS - 1)] + ["+Inf"]
+
+
+class CFxModuleMetrics():
+    """
+    The metrics of one controller module: the queue wait time per action, the handler time per
+    op type and action, and the lateness and overruns of its timers. They are updated by the
+    module's workers and read by the exporter.
+    """
+    def __init__(self, module_name, handle):
+        self.module_name = module_name
+        self.handle = handle
+        self.lock = threading.Lock()
+        self.queue_wait = {}        # action -> CFxHistogram
+        self.handler_time = {}      # (op_type, action) -> CFxHistogram
+        self.timer_lateness = CFxHistogram()
+        self.timer_overruns = 0
+
+    def observe_cbt(self, op_type, action, wait, duration):
+        with self.lock:
+            hist = self.queue_wait.get(action)
+            if hist is None:
+                hist = self.queue_wait[action] = CFxHistogram()
+            hist.observe(wait)
+            hist = self.handler_time.get((op_type, action))
+            if hist is None:
+                hist = self.handler_time[(op_type, action)] = CFxHistogram()
+            hist.observe(duration)
+
+    def observe_timer(self, lateness, duration, period):
+        # a periodic timer overruns when it runs for longer than its period, or when it is
+        # still queued at its next expiry, see observe_timer_skip()
+        with self.lock:
+            self.timer_lateness.observe(max(lateness, 0.0))
+            if period and duration > period:
+                self.timer_overruns += 1
+
+    def observe_timer_skip(self):
+        with self.lock:
+            self.timer_overruns += 1
+
+
+class CFxMetrics():
+    """
+    Collects the per module metrics and periodically writes them to a file in the OpenMetrics
+    text format. The file is replaced atomically so it can be read by a textfile collector at
+    any time.
+    """
+    def __init__(self, path, interval):
+        self._path = path
+        self._interval = interval
+        self._modules = []
+        self._exit = threading.Event()
+        self._thread = threading.Thread(target=self.__exporter, name="CFx::__metrics",
+                                        daemon=True)
+
+    def add_module(self, module_name, handle):
+        metrics = CFxModuleMetrics(module_name, handle)
+        self._modules.append(metrics)
+        return metrics
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._exit.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        self.write()
+
+    def __exporter(self):
+        while not self._exit.wait(self._interval):
+            self.write()
+
+    def write(self):
+        tmp_path = self._path + ".tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                f.write(self.render())
+            os.replace(tmp_path, self._path)
+        except OSError as err:
+            print("Failed to write the CFx metrics to {0}: {1}".format(self._path, err))
+
+    @staticmethod
+    def _labels(**labels):
+        return ",".join("{0}=\"{1}\"".format(key, val) for key, val in labels.items())
+
+    def _histogram(self, lines, name, labels, hist):
+        cumulative = 0
+        for bound, count in zip(hist.bounds(), hist.counts):
+            cumulative += count
+            lines.append("{0}_bucket{{{1},le=\"{2}\"}} {3}".format(name, labels, bound,
+                                                                    cumulative))
+        lines.append("{0}_sum{{{1}}} {2}".format(name, labels, hist.total))
+        lines.append("{0}_count{{{1}}} {2}".format(name, labels, cumulative))
+
+    def render(self):
+        depth, peak, wait, handler, lateness, overruns = [], [], [], [], [], []
+        reg_size, reg_ins, dropped, coalesced = [], [], [], []
+        for mod in self._modules:
+            name = mod.module_name
+            # pylint: disable=protected-access
+            for reg in (mod.handle._owned_cbts, mod.handle._pending_cbts):
+                stats = reg.stats()
+                labels = self._labels(module=name, registry=reg.name)
+                reg_size.append("ipop_cbt_registry_size{{{0}}} {1}".format(labels, stats["Size"]))
+                reg_ins.append("ipop_cbt_registry_inserts_total{{{0}}} {1}"
+                               .format(labels, stats["Inserted"]))
+            for prio, (cur, high) in enumerate(mod.handle.queue_depths()):
+                labels = self._labels(module=name, priority=prio)
+                depth.append("ipop_queue_depth{{{0}}} {1}".format(labels, cur))
+                peak.append("ipop_queue_depth_peak{{{0}}} {1}".format(labels, high))
+            for prio, (drp, coal) in enumerate(mod.handle.queue_overloads()):
+                labels = self._labels(module=name, priority=prio)
+                dropped.append("ipop_queue_dropped_total{{{0}}} {1}".format(labels, drp))
+                coalesced.append("ipop_queue_coalesced_total{{{0}}} {1}".format(labels, coal))
+            with mod.lock:
+                for action, hist in sorted(mod.queue_wait.items(), key=lambda i: str(i[0])):
+                    self._histogram(wait, "ipop_cbt_queue_wait_seconds",
+                                    self._labels(module=name, action=action), hist)
+                for (op_type, action), hist in sorted(mod.handler_time.items(),
+                                                      key=lambda i: str(i[0])):
+                    self._histogram(handler, "ipop_cbt_handler_seconds",
+                                    self._labels(module=name, op=op_type, action=action), hist)
+                self._histogram(lateness, "ipop_timer_lateness_seconds",
+                                self._labels(module=name), mod.timer_lateness)
+                overruns.append("ipop_timer_overruns_total{{{0}}} {1}"
+                                .format(self._labels(module=name), mod.timer_overruns))
+        lines = ["# TYPE ipop_queue_depth gauge",
+                 "# HELP ipop_queue_depth CBTs waiting in the module's queues"] + depth
+        lines += ["# TYPE ipop_queue_depth_peak gauge",
+                  "# HELP ipop_queue_depth_peak Highest queue depth since the last export"] + peak
+        lines += ["# TYPE ipop_queue_dropped counter",
+                  "# HELP ipop_queue_dropped CBTs refused or evicted by an overloaded queue"]
+        lines += dropped
+        lines += ["# TYPE ipop_queue_coalesced counter",
+                  "# HELP ipop_queue_coalesced Notifications merged by an overloaded queue"]
+        lines += coalesced
+        lines += ["# TYPE ipop_cbt_queue_wait_seconds histogram",
+                  "# HELP ipop_cbt_queue_wait_seconds Time from submit to dequeue"] + wait
+        lines += ["# TYPE ipop_cbt_handler_seconds histogram",
+                  "# HELP ipop_cbt_handler_seconds Time spent in process_cbt"] + handler
+        lines += ["# TYPE ipop_timer_lateness_seconds histogram",
+                  "# HELP ipop_timer_lateness_seconds Delay from a timer's due time to its run"]
+        lines += lateness
+        lines += ["# TYPE ipop_timer_overruns counter",
+                  "# HELP ipop_timer_overruns Periodic timers that fell a period behind"]
+        lines += overruns
+        lines += ["# TYPE ipop_cbt_registry_size gauge",
+                  "# HELP ipop_cbt_registry_size CBTs owned or pending in the module"] + reg_size
+        lines += ["# TYPE ipop_cbt_registry_inserts counter",
+                  "# HELP ipop_cbt_registry_inserts CBTs added to the registry"] + reg_ins
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,283 @@
+# ipop-project
+# Copyright 2016, University of Florida
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import asyncio
+import queue as Queue
+import time
+from collections import deque
+import controller.framework.fxlib as fxlib
+from controller.framework.CBT import CBT
+
+
+class CBTPriorityClasses():
+    """
+    Holds one FIFO per priority class and selects the next item to be served. The highest class
+    (lowest value) with work is served first. Every time a lower class is passed over while it
+    has work its skip count is incremented, and once it reaches the aging limit the head of that
+    class is served ahead of the higher classes so it is never starved.
+
+    When bounds are set the queue is overloaded from the time its size reaches the high
+    watermark until it drains to the low watermark, and offer() applies the overload policy of
+    the item's class: Admit accepts it, Block accepts it once the caller has waited for the
+    overload to clear, DropOldest evicts the oldest CBT of the class to make room, and Coalesce
+    discards a notification equal to one already queued. Past that, only Admit class items are
+    queued once the capacity is reached. Responses and items that are not CBTs, such as timers,
+    are always admitted.
+    """
+    def __init__(self, num_classes, aging_limit):
+        self._classes = [deque() for _ in range(num_classes)]
+        self._skips = [0] * num_classes
+        self._peaks = [0] * num_classes
+        self._aging_limit = aging_limit
+        self._size = 0
+        self._capacity = 0  # unbounded
+        self._high = self._low = 0
+        self._policies = [fxlib.CBT_OVERLOAD_ADMIT] * num_classes
+        self.overloaded = False
+        self._keys = {}     # coalesce key -> number of queued notifications with it
+        self.dropped = [0] * num_classes
+        self.coalesced = [0] * num_classes
+
+    def __len__(self):
+        return self._size
+
+    def set_bounds(self, capacity, high, low):
+        self._capacity = capacity
+        self._high = max(1, int(capacity * high))
+        self._low = min(int(capacity * low), self._high - 1)
+        self._policies = [fxlib.CBT_OVERLOAD_POLICIES.get(prio, fxlib.CBT_OVERLOAD_ADMIT)
+                          for prio in range(len(self._classes))]
+
+    def blocks(self, prio, item):
+        # whether a producer of item is made to wait while the queue is overloaded
+        return (self.overloaded and self._policies[prio] == fxlib.CBT_OVERLOAD_BLOCK and
+                isinstance(item, CBT) and item.op_type != "Response")
+
+    @staticmethod
+    def _coalesce_key(item):
+        fields = fxlib.CBT_COALESCE_KEYS.get(item.request.action)
+        if fields is None or item.op_type != "Notify":
+            return None
+        params = item.request.params
+        return (item.request.action,) + tuple(params.get(field) for field in fields)
+
+    def append(self, prio, item):
+        que = self._classes[prio]
+        que.append(item)
+        if len(que) > self._peaks[prio]:
+            self._peaks[prio] = len(que)
+        self._size += 1
+        if self._capacity:
+            if self._size >= self._high:
+                self.overloaded = True
+            if self._policies[prio] == fxlib.CBT_OVERLOAD_COALESCE and isinstance(item, CBT):
+                key = self._coalesce_key(item)
+                if key is not None:
+                    self._keys[key] = self._keys.get(key, 0) + 1
+
+    def offer(self, prio, item):
+        """
+        Queue item subject to the overload policy of its class. Returns whether item was
+        queued and the CBTs that were evicted to make room for it.
+        """
+        policy = self._policies[prio]
+        if (not self.overloaded or policy == fxlib.CBT_OVERLOAD_ADMIT or
+                not isinstance(item, CBT) or item.op_type == "Response"):
+            self.append(prio, item)
+            return True, ()
+        if policy == fxlib.CBT_OVERLOAD_COALESCE:
+            key = self._coalesce_key(item)
+            if key is not None and key in self._keys:
+                self.coalesced[prio] += 1
+                return False, ()
+        elif policy == fxlib.CBT_OVERLOAD_DROP_OLDEST:
+            victim = self._evict(prio)
+            if victim is not None:
+                self.dropped[prio] += 1
+                self.append(prio, item)
+                return True, (victim,)
+        if self._size >= self._capacity:
+            self.dropped[prio] += 1
+            return False, ()
+        self.append(prio, item)
+        return True, ()
+
+    def _evict(self, prio):
+        # the oldest CBT of the class that can be discarded, responses are never dropped
+        que = self._classes[prio]
+        for idx, item in enumerate(que):
+            if isinstance(item, CBT) and item.op_type != "Response":
+                del que[idx]
+                self._removed(prio, item)
+                return item
+        return None
+
+    def _removed(self, prio, item):
+        self._size -= 1
+        if self._capacity:
+            if self.overloaded and self._size <= self._low:
+                self.overloaded = False
+            if self._keys and isinstance(item, CBT):
+                key = self._coalesce_key(item)
+                cnt = self._keys.get(key)
+                if cnt is not None:
+                    if cnt == 1:
+                        del self._keys[key]
+                    else:
+                        self._keys[key] = cnt - 1
+
+    def popleft(self):
+        selected = None
+        for prio, que in enumerate(self._classes):
+            if not que:
+                continue
+            if selected is None:
+                selected = prio
+            elif self._skips[prio] >= self._aging_limit:
+                selected = prio
+                break
+        for prio in range(selected + 1, len(self._classes)):
+            if self._classes[prio]:
+                self._skips[prio] += 1
+        self._skips[selected] = 0
+        item = self._classes[selected].popleft()
+        self._removed(selected, item)
+        return item
+
+    def depths(self):
+        return [len(que) for que in self._classes]
+
+    def take_peaks(self):
+        # the highest depth of each class since the last call
+        peaks = self._peaks
+        self._peaks = self.depths()
+        return peaks
+
+    def overload_counts(self):
+        return list(self.dropped), list(self.coalesced)
+
+
+class CBTQueue(Queue.Queue):
+    """
+    Module CBT queue with priority classes. Items are put as (priority class, CBT) tuples and
+    get() returns only the CBT. The blocking and thread synchronization semantics are those of
+    queue.Queue, put() always admits the item and offer() applies the overload policies.
+    """
+    def __init__(self, aging_limit, num_classes=fxlib.CBT_PRIO_CLASSES):
+        self._num_classes = num_classes
+        self._aging_limit = aging_limit
+        super(CBTQueue, self).__init__(maxsize=0)
+
+    def _init(self, maxsize):
+        self.queue = CBTPriorityClasses(self._num_classes, self._aging_limit)
+
+    def _qsize(self):
+        return len(self.queue)
+
+    def _put(self, item):
+        self.queue.append(item[0], item[1])
+
+    def _get(self):
+        overloaded = self.queue.overloaded
+        item = self.queue.popleft()
+        if overloaded and not self.queue.overloaded:
+            self.not_full.notify_all()
+        return item
+
+    def set_bounds(self, capacity, high, low):
+        with self.mutex:
+            self.queue.set_bounds(capacity, high, low)
+
+    def offer(self, prio, item, block_timeout=0):
+        """
+        Queue item subject to the overload policies. A producer of a Block class item waits up
+        to block_timeout seconds for the overload to clear, and the item is refused if the queue
+        is still at capacity. Returns whether item was queued and the CBTs evicted to make room for it.
+        """
+        with self.not_full:
+            if block_timeout and self.queue.blocks(prio, item):
+                end = time.monotonic() + block_timeout
+                while self.queue.overloaded:
+                    remaining = end - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.not_full.wait(remaining)
+            queued, evicted = self.queue.offer(prio, item)
+            if queued:
+                self.unfinished_tasks += 1
+                self.not_empty.notify()
+            return queued, evicted
+
+    def depths(self):
+        with self.mutex:
+            return self.queue.depths()
+
+    def take_peaks(self):
+        with self.mutex:
+            return self.queue.take_peaks()
+
+    def overload_counts(self):
+        with self.mutex:
+            return self.queue.overload_counts()
+
+
+class AsyncCBTQueue(asyncio.Queue):
+    """
+    Module CBT queue with priority classes for the asyncio runtime. Items are put as
+    (priority class, CBT) tuples and get() returns only the CBT. It must only be accessed from
+    the thread running the event loop, which cannot wait for an overload to clear so Block
+    class items are only refused once the queue is at capacity.
+    """
+    def __init__(self, aging_limit, num_classes=fxlib.CBT_PRIO_CLASSES):
+        self._num_classes = num_classes
+        self._aging_limit = aging_limit
+        super(AsyncCBTQueue, self).__init__(maxsize=0)
+
+    def _init(self, maxsize):
+        self._queue = CBTPriorityClasses(self._num_classes, self._aging_limit)
+
+    def _put(self, item):
+        self._queue.append(item[0], item[1])
+
+    def _get(self):
+        return self._queue.popleft()
+
+    def set_bounds(self, capacity, high, low):
+        self._queue.set_bounds(capacity, high, low)
+
+    def offer(self, prio, item, block_timeout=0):
+        # the bookkeeping of put_nowait() for an item that was queued
+        # pylint: disable=unused-argument
+        queued, evicted = self._queue.offer(prio, item)
+        if queued:
+            self._unfinished_tasks += 1
+            self._finished.clear()
+            self._wakeup_next(self._getters)
+        return queued, evicted
+
+    def depths(self):
+        return self._queue.depths()
+
+    def take_peaks(self):
+        return self._queue.take_peaks()
+
+    def overload_counts(self):
+        return self._queue.overload_counts()
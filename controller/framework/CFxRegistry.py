@@ -0,0 +1,126 @@
+# ipop-project
+# Copyright 2016, University of Florida
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import threading
+
+
+class CBTRegistryShard():
+    __slots__ = ("lock", "cbts", "inserted", "removed")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.cbts = {}
+        self.inserted = 0
+        self.removed = 0
+
+
+class CBTRegistry():
+    """
+    The CBTs a module owns or has pending, indexed by tag. The tags are spread over lock striped
+    shards so the module's workers, its timers and the threads of its transports can insert,
+    look up and remove CBTs concurrently, each operation locking one shard. Removal is by
+    identity so a CBT is only released by the caller holding it, and each shard counts its
+    inserts and removals. When age buckets are given they are kept in step with the registry.
+
+    A successful pop() or discard() is what gives the caller ownership of the CBT. For the
+    pending CBTs it is the right to complete the request: a CBT found with get() or in may be
+    completed by another thread at any time, and is only read.
+    """
+    SHARDS = 16     # a power of two
+
+    def __init__(self, name, age_buckets=None):
+        self.name = name
+        self._shards = [CBTRegistryShard() for _ in range(self.SHARDS)]
+        # tags are ints, hash() covers the ones received from peers in case they are not
+        self._mask = self.SHARDS - 1
+        self._ages = age_buckets
+
+    def add(self, cbt):
+        shard = self._shards[hash(cbt.tag) & self._mask]
+        with shard.lock:
+            shard.cbts[cbt.tag] = cbt
+            shard.inserted += 1
+        if self._ages is not None:
+            self._ages.add(cbt)
+
+    def get(self, tag, default=None):
+        shard = self._shards[hash(tag) & self._mask]
+        with shard.lock:
+            return shard.cbts.get(tag, default)
+
+    def __getitem__(self, tag):
+        shard = self._shards[hash(tag) & self._mask]
+        with shard.lock:
+            return shard.cbts[tag]
+
+    def __contains__(self, tag):
+        shard = self._shards[hash(tag) & self._mask]
+        with shard.lock:
+            return tag in shard.cbts
+
+    def __len__(self):
+        return sum(len(shard.cbts) for shard in self._shards)
+
+    def pop(self, tag, default=None):
+        """Remove and return the CBT registered under tag, only one caller is given it"""
+        shard = self._shards[hash(tag) & self._mask]
+        with shard.lock:
+            cbt = shard.cbts.pop(tag, None)
+            if cbt is None:
+                return default
+            shard.removed += 1
+        if self._ages is not None:
+            self._ages.remove(cbt)
+        return cbt
+
+    def discard(self, cbt, tag=None):
+        """
+        Remove cbt if it is the CBT registered under tag, by default its current tag. Returns
+        True if it was. A tag read earlier keeps a CBT that was since reused from being removed.
+        """
+        if tag is None:
+            tag = cbt.tag
+        shard = self._shards[hash(tag) & self._mask]
+        with shard.lock:
+            if shard.cbts.get(tag) is not cbt:
+                return False
+            del shard.cbts[tag]
+            shard.removed += 1
+        if self._ages is not None:
+            self._ages.remove(cbt)
+        return True
+
+    def values(self):
+        # a snapshot, the registry can change as soon as a shard is unlocked
+        cbts = []
+        for shard in self._shards:
+            with shard.lock:
+                cbts.extend(shard.cbts.values())
+        return cbts
+
+    def stats(self):
+        size = inserted = removed = 0
+        for shard in self._shards:
+            with shard.lock:
+                size += len(shard.cbts)
+                inserted += shard.inserted
+                removed += shard.removed
+        return dict(Size=size, Inserted=inserted, Removed=removed)
@@ -19,24 +19,72 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
 
+from collections.abc import Mapping
+from types import MappingProxyType
+
+
+def _freeze(value):
+    # read-only copy of a message, nested dicts and lists included
+    if isinstance(value, dict):
+        return MappingProxyType({key: _freeze(val) for key, val in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(val) for val in value)
+    return value
+
 
 class CFxSubscription():
-    def __init__(self, owner_name, subscription_name):
+    """
+    An event published by a controller module. Each sink may subscribe with a filter, a dict
+    that maps a key of the event message to the values the sink accepts, eg
+    {"UpdateType": ("CONNECTED", "REMOVED")}. The filter is evaluated when the event is posted
+    and no CBT is created for a sink that does not accept the event. Messages that are not
+    dicts are delivered to every sink.
+    A notify subscription delivers events as one-way notification CBTs that need no response,
+    its dict messages are shared by all the sinks as a read-only copy, in which nested dicts
+    are read-only mappings as well and lists are tuples. Otherwise each sink
+    gets a request it must complete.
+    """
+    def __init__(self, owner_name, subscription_name, notify=False):
         self._owner_name = owner_name
         self._owner = None
         self._subscription_name = subscription_name
-        self._subscribers = []
+        self._notify = notify
+        # replaced rather than modified so post_update can iterate it without a lock
+        self._subscribers = ()
 
     """
     sink must be an instance of a controller module
     """
 
-    def add_subscriber(self, sink):
-        self._subscribers.append(sink)
+    def add_subscriber(self, sink, msg_filter=None):
+        if msg_filter is not None:
+            msg_filter = {key: frozenset(values) for key, values in msg_filter.items()}
+        self._subscribers = self._subscribers + ((sink, msg_filter),)
 
     def remove_subscriber(self, sink):
-        self._subscribers.remove(sink)
+        subscribers = tuple(entry for entry in self._subscribers if entry[0] is not sink)
+        if len(subscribers) == len(self._subscribers):
+            raise ValueError("{0} is not a subscriber of {1}"
+                             .format(sink.__class__.__name__, self._subscription_name))
+        self._subscribers = subscribers
+
+    @staticmethod
+    def _accepts(msg_filter, msg):
+        if msg_filter is None or not isinstance(msg, Mapping):
+            return True
+        for key, values in msg_filter.items():
+            if msg.get(key) not in values:
+                return False
+        return True
 
     def post_update(self, msg):
-        for sink in self._subscribers:
-            self._owner.register_cbt(sink.__class__.__name__, self._subscription_name, msg)
+        if self._notify and isinstance(msg, dict):
+            msg = _freeze(msg)
+        for sink, msg_filter in self._subscribers:
+            if not self._accepts(msg_filter, msg):
+                continue
+            if self._notify:
+                # pylint: disable=protected-access
+                sink._cfx_handle.notify(self._owner_name, self._subscription_name, msg)
+            else:
+                self._owner.register_cbt(sink.__class__.__name__, self._subscription_name, msg)
@@ -0,0 +1,181 @@
+# ipop-project
+# Copyright 2016, University of Florida
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import math
+import threading
+import time
+
+
+class CFxTimer():
+    """
+    A one-shot or periodic timer. When it expires the timer is passed to its dispatch function,
+    which for controller modules places it on the module's queue, and the module's worker then
+    calls run(). A cancelled timer is never run, even if it had already been dispatched. A
+    periodic timer is queued once at a time, an expiry while it is still queued is skipped.
+    """
+    def __init__(self, callback, period=0, dispatch=None):
+        self.callback = callback
+        self.period = period
+        self.dispatch = dispatch
+        self.expires = 0
+        self.due = 0        # monotonic time the timer is next due
+        self.last_due = 0   # due time of the expiry that was last dispatched
+        self.cancelled = False
+        self.queued = False     # dispatched and not yet run
+
+    def cancel(self):
+        self.cancelled = True
+
+    def run(self):
+        self.queued = False
+        if not self.cancelled:
+            self.callback()
+
+
+class CFxTimerWheel():
+    """
+    Hierarchical timing wheel that serves the timers of all the controller modules from a
+    single thread. Each level has a fixed number of slots, a slot on level 0 covers one tick
+    and a slot on level n covers all the slots of level n-1. Timers far in the future are held
+    in the higher levels and are cascaded down as the wheel turns, so scheduling, cancelling
+    and expiring a timer are constant time operations. While level 0 has no timers the thread
+    sleeps until the next cascade instead of waking on every tick.
+    """
+    def __init__(self, resolution=0.1, slot_bits=6, levels=4):
+        self._resolution = resolution
+        self._slot_bits = slot_bits
+        self._slot_mask = (1 << slot_bits) - 1
+        self._max_ticks = (1 << (slot_bits * levels)) - 1
+        self._wheels = [[[] for _ in range(1 << slot_bits)] for _ in range(levels)]
+        self._level0_cnt = 0
+        self._tick = 0
+        self._start_time = time.monotonic()
+        self._cv = threading.Condition()
+        self._exit = False
+        # a daemon, so a controller that fails to start is not kept alive by the wheel
+        self._thread = threading.Thread(target=self.__timer_wheel, name="CFx::__timer",
+                                        daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        with self._cv:
+            self._exit = True
+            self._cv.notify()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def schedule(self, delay, callback, period=0, dispatch=None):
+        """
+        Schedule callback to be dispatched after delay seconds, and every period seconds after
+        that if a period is given. Returns the timer which is used to cancel it.
+        """
+        timer = CFxTimer(callback, period, dispatch)
+        with self._cv:
+            # the first tick at or after the deadline, the wheel itself may lag behind the
+            # clock while its thread sleeps
+            timer.due = time.monotonic() + delay
+            timer.expires = max(math.ceil((timer.due - self._start_time) / self._resolution),
+                                self._tick + 1)
+            self._insert(timer)
+            self._cv.notify()
+        return timer
+
+    def _clock_tick(self):
+        return int((time.monotonic() - self._start_time) / self._resolution)
+
+    def _insert(self, timer):
+        delta = min(max(timer.expires - self._tick, 0), self._max_ticks)
+        expires = self._tick + delta
+        level = 0
+        while delta >= (1 << (self._slot_bits * (level + 1))):
+            level += 1
+        slot = (expires >> (self._slot_bits * level)) & self._slot_mask
+        self._wheels[level][slot].append(timer)
+        if level == 0:
+            self._level0_cnt += 1
+
+    def _advance(self):
+        # move the wheel forward by one tick and return the timers that expired on it
+        self._tick += 1
+        for level in range(1, len(self._wheels)):
+            if self._tick & ((1 << (self._slot_bits * level)) - 1):
+                break
+            slot = (self._tick >> (self._slot_bits * level)) & self._slot_mask
+            timers = self._wheels[level][slot]
+            self._wheels[level][slot] = []
+            for timer in timers:
+                if not timer.cancelled:
+                    self._insert(timer)
+        slot = self._tick & self._slot_mask
+        timers = self._wheels[0][slot]
+        self._wheels[0][slot] = []
+        self._level0_cnt -= len(timers)
+        expired = []
+        for timer in timers:
+            if timer.cancelled:
+                continue
+            if timer.expires > self._tick:
+                # beyond the range of the wheel when it was scheduled
+                self._insert(timer)
+                continue
+            expired.append(timer)
+            timer.last_due = timer.due
+            if timer.period:
+                # the next due time follows from the previous one so the period does not drift,
+                # the periods missed while the wheel was stalled are skipped, not caught up
+                timer.due += timer.period
+                now = time.monotonic()
+                if timer.due <= now:
+                    timer.due += (math.floor((now - timer.due) / timer.period) + 1) * timer.period
+                timer.expires = max(math.ceil((timer.due - self._start_time) / self._resolution),
+                                    self._tick + 1)
+                self._insert(timer)
+        return expired
+
+    def _next_wakeup(self):
+        # the next tick with timers on level 0, or the next cascade
+        boundary = (self._tick | self._slot_mask) + 1
+        if self._level0_cnt:
+            for tick in range(self._tick + 1, boundary):
+                if self._wheels[0][tick & self._slot_mask]:
+                    return tick
+        return boundary
+
+    def __timer_wheel(self):
+        while True:
+            with self._cv:
+                if self._exit:
+                    break
+                now_tick = self._clock_tick()
+                expired = []
+                while self._tick < now_tick:
+                    expired.extend(self._advance())
+                if not expired:
+                    wakeup = self._start_time + self._next_wakeup() * self._resolution
+                    self._cv.wait(max(wakeup - time.monotonic(), 0))
+                    continue
+            for timer in expired:
+                if timer.dispatch is not None:
+                    timer.dispatch(timer)
+                else:
+                    timer.run()
@@ -0,0 +1,88 @@
+# ipop-project
+# Copyright 2016, University of Florida
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import json
+import threading
+import time
+from collections import deque
+
+
+class CFxTracer():
+    """
+    Records the life cycle of CBTs into a bounded ring buffer shared by all the modules. Each
+    event is a tuple appended to a deque, which is thread safe, and the oldest events are
+    dropped once the buffer is full. export() writes the buffer in the Chrome trace event
+    format, which can be opened in chrome://tracing or Perfetto. Every CBT is an async span
+    from create to free, named by its action and linked to its parent, with instant events for
+    submit, dequeue and complete. Handler executions are slices on the thread that ran them.
+    """
+    def __init__(self, capacity):
+        self._events = deque(maxlen=capacity)
+
+    def record(self, phase, module, cbt):
+        parent = cbt.parent
+        self._events.append((time.perf_counter(), phase, module, cbt.tag, cbt.request.action,
+                             parent.tag if parent is not None else None,
+                             threading.get_ident(), 0.0))
+
+    def record_handler(self, module, tag, action, parent_tag, start, end):
+        self._events.append((start, "handler", module, tag, action, parent_tag,
+                             threading.get_ident(), end - start))
+
+    def export(self, path):
+        events = list(self._events)
+        # a linked CBT is created before its action and parent are set, so the span takes them
+        # from any of its events
+        actions, parents = {}, {}
+        for _, _, _, tag, action, parent_tag, _, _ in events:
+            if action:
+                actions[tag] = action
+            if parent_tag is not None:
+                parents[tag] = parent_tag
+        pids = {}
+        trace = []
+        for ts, phase, module, tag, action, _, tid, dur in events:
+            pid = pids.get(module)
+            if pid is None:
+                pid = pids[module] = len(pids) + 1
+                trace.append(dict(ph="M", name="process_name", pid=pid, tid=0,
+                                  args=dict(name=module)))
+            usec = ts * 1000000
+            action = actions.get(tag, action)
+            args = dict(tag=tag, parent=parents.get(tag))
+            if phase == "handler":
+                trace.append(dict(ph="X", name=str(action), cat="handler", ts=usec,
+                                  dur=dur * 1000000, pid=pid, tid=tid, args=args))
+                continue
+            # the ids are global as a CBT's events are recorded by more than one module
+            event = dict(name=str(action), cat="cbt", id2={"global": hex(tag)}, ts=usec,
+                         pid=pid, tid=tid, args=args)
+            if phase == "create":
+                event["ph"] = "b"
+            elif phase == "free":
+                event["ph"] = "e"
+            else:
+                event["ph"] = "n"
+                event["name"] = "{0} {1}".format(phase, action)
+            trace.append(event)
+        with open(path, "w") as f:
+            json.dump(dict(traceEvents=trace, displayTimeUnit="ms"), f)
+        return len(events)
@@ -19,29 +19,83 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
 
+import sys
 from abc import ABCMeta, abstractmethod
 
 
+def request_handler(*actions):
+    """Register the decorated method as the handler of request CBTs with the given actions"""
+    def register(func):
+        func.cbt_handles = getattr(func, "cbt_handles", ()) + tuple(
+            ("Request", sys.intern(action)) for action in actions)
+        return func
+    return register
+
+
+def response_handler(*actions):
+    """Register the decorated method as the handler of responses to the given actions"""
+    def register(func):
+        func.cbt_handles = getattr(func, "cbt_handles", ()) + tuple(
+            ("Response", sys.intern(action)) for action in actions)
+        return func
+    return register
+
+
+def notification_handler(*actions):
+    """Register the decorated method as the handler of notifications with the given actions"""
+    def register(func):
+        func.cbt_handles = getattr(func, "cbt_handles", ()) + tuple(
+            ("Notify", sys.intern(action)) for action in actions)
+        return func
+    return register
+
+
 # abstract ControllerModule (CM) class
 # all CM implementations inherit the variables declared here
 # all CM implementations must override the abstract methods declared here
 class ControllerModule():
 
     __metaclass__ = ABCMeta
+    _cbt_handlers = {}
+
+    def __init_subclass__(cls, **kwargs):
+        # collect the methods registered with request_handler/response_handler, including the
+        # inherited ones, into a table keyed by (op_type, action)
+        super().__init_subclass__(**kwargs)
+        handlers = {}
+        for klass in reversed(cls.__mro__):
+            for name, attr in vars(klass).items():
+                for key in getattr(attr, "cbt_handles", ()):
+                    handlers[key] = name
+        cls._cbt_handlers = handlers
 
     def __init__(self, cfx_handle, module_config, module_name):
         #self._pending_cbt = {}
         self._cfx_handle = cfx_handle
         self._cm_config = module_config
         self._module_name = module_name
+        self._cbt_dispatch = {key: getattr(self, name)
+                              for key, name in self._cbt_handlers.items()}
 
     @abstractmethod
     def initialize(self):
         pass
 
-    @abstractmethod
     def process_cbt(self, cbt):
-        pass
+        self.dispatch_cbt(cbt)
+
+    def dispatch_cbt(self, cbt):
+        """
+        Call the handler registered for the CBT's op_type and action, or req_handler_default or
+        resp_handler_default if there is none. Notifications without a handler are ignored.
+        """
+        handler = self._cbt_dispatch.get((cbt.op_type, cbt.request.action))
+        if handler is not None:
+            handler(cbt)
+        elif cbt.op_type == "Request":
+            self.req_handler_default(cbt)
+        elif cbt.op_type == "Response":
+            self.resp_handler_default(cbt)
 
     @abstractmethod
     def timer_method(self):
@@ -51,12 +105,58 @@ class ControllerModule():
     def terminate(self):
         pass
 
+    def on_config_reload(self, changes):
+        """
+        Called on the module's worker with the ConfigChanges to its section of the reloaded
+        config file. Apply the supported changes, including to the module's config with
+        apply_config_change(), and return the ones that require a restart.
+        """
+        # pylint: disable=no-self-use
+        return changes
+
+    def cbt_key(self, cbt):
+        """
+        Return the key used to order CBTs when the module is configured with more than one
+        worker. CBTs with equal keys are processed by the same worker in submission order,
+        None selects the first worker.
+        """
+        # pylint: disable=unused-argument,no-self-use
+        return None
+
     def req_handler_default(self, cbt):
         log = "Unsupported CBT action {0}".format(cbt)
-        self.register_cbt("Logger", "LOG_WARNING", log)
+        self.log("LOG_WARNING", log)
         cbt.set_response(log, False)
         self.complete_cbt(cbt)
 
+    def resp_handler_default(self, cbt):
+        # pass the response on to the parent CBT once its last child completes
+        parent_cbt = cbt.parent
+        cbt_data = cbt.response.data
+        cbt_status = cbt.response.status
+        self.free_cbt(cbt)
+        if parent_cbt is not None and parent_cbt.child_count == 0:
+            parent_cbt.set_response(cbt_data, cbt_status)
+            self.complete_cbt(parent_cbt)
+
+    def log(self, level, msg, *args):
+        """Write msg to the log channel at level, one of LOG_DEBUG/INFO/WARNING/ERROR"""
+        self._cfx_handle.log(level, msg, *args)
+
+    # Level specific log methods. The message is a str.format() string which is formatted
+    # with args only when the level is enabled in the Logger.
+    def log_debug(self, fmt, *args):
+        self._cfx_handle.log("LOG_DEBUG", fmt, *args)
+
+    def log_info(self, fmt, *args):
+        self._cfx_handle.log("LOG_INFO", fmt, *args)
+
+    def log_warning(self, fmt, *args):
+        self._cfx_handle.log("LOG_WARNING", fmt, *args)
+
+    def log_error(self, fmt, *args):
+        self._cfx_handle.log("LOG_ERROR", fmt, *args)
+
     # create and submit CBT mask method
     def register_cbt(self, _recipient, _action, _params=None):
         cbt = self._cfx_handle.create_cbt(
@@ -68,14 +168,24 @@ class ControllerModule():
         self._cfx_handle.submit_cbt(cbt)
         return cbt
 
+    def schedule_timer(self, delay, callback, period=0):
+        """
+        Call callback on the module's worker after delay seconds, and every period seconds after
+        that if a period is given. Returns the timer, call its cancel() method to stop it.
+        """
+        return self._cfx_handle.schedule_timer(delay, callback, period)
+
     def create_cbt(self, initiator, recipient, action, params=None):
         return self._cfx_handle.create_cbt(initiator, recipient, action, params)
 
     def create_linked_cbt(self, parent):
         return self._cfx_handle.create_linked_cbt(parent)
 
-    def complete_cbt(self, cbt):
-        self._cfx_handle.complete_cbt(cbt)
+    def claim_pending_cbt(self, tag):
+        return self._cfx_handle.claim_pending_cbt(tag)
+
+    def complete_cbt(self, cbt, claimed=False):
+        self._cfx_handle.complete_cbt(cbt, claimed)
 
     def free_cbt(self, cbt):
         self._cfx_handle.free_cbt(cbt)
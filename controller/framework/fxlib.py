@@ -32,7 +32,27 @@ CONFIG = {
         "NodeId": "",  # Single unique node Id for all overlays
         "IpopVersion": IPOP_VER_REL,
         "Model": "Default",
-        "RequestTimeout": 29
+        "Runtime": "Threads",       # Run modules on <Threads> or on a single <Asyncio> event loop
+        "RequestTimeout": 29,
+        "ShutdownTimeout": 10,      # Seconds the modules are given to stop
+        "TimerResolution": 0.1,     # Seconds per tick of the timer wheel
+        "QueueAgingLimit": 8,       # Times a low priority CBT can be passed over before it is served
+        "LogBufferSize": 4096,      # Log records buffered for the Logger before the oldest is dropped
+        "CBTPoolSize": 128,         # Released CBTs kept by each module for reuse
+        "QueueCapacity": 8192,      # CBTs queued for a module before its overload policies
+                                    # refuse more, 0 is unbounded. Modules can set their own
+        "QueueHighWatermark": 0.75, # Fraction of the capacity at which a queue is overloaded
+        "QueueLowWatermark": 0.5,   # Fraction of the capacity at which the overload clears
+        "QueueBlockTimeout": 2,     # Max seconds a producer waits on an overloaded queue
+        "DebugCBTs": False,         # Report the CBTs each module has held for too long
+        "CBTLeakAges": [60, 300, 1800],     # Ages in seconds at which held CBTs are reported
+        "CBTLeakBucketWidth": 10,   # Seconds of creation time grouped in a leak detector bucket
+        "MetricsFile": None,        # OpenMetrics file for queue and handler metrics, None disables
+        "MetricsInterval": 15,      # Seconds between writes of the metrics file
+        "TraceBufferSize": 0,       # CBT trace events kept in memory, 0 disables tracing
+        "TraceFile": "./logs/cbt_trace.json",   # Chrome trace written on SIGUSR1
+        "ConfigWatch": True,        # Apply the changes made to the config file while running
+        "ConfigPollInterval": 2     # Seconds between checks of the config file without inotify
     },
     "Logger": {
         "Enabled": True,
@@ -62,6 +82,9 @@ CONFIG = {
         "SndServiceAddress6": "::1",
         "CtrlRecvPort": 5801,               # Controller Listening Port
         "CtrlSendPort": 5800,               # Tincan Listening Port
+        "ReadyProbeTimeout": 0.1,           # Seconds to wait on Tincan's answer to the first
+                                            # readiness probe, doubled for each retry
+        "ReadyProbeMaxTimeout": 10,         # Max seconds to wait on a readiness probe
         "Dependencies": ["Logger"]
     },
     "Signal": {
@@ -79,23 +102,215 @@ CONFIG = {
         "Enabled": True,
         "TimerInterval": 60,
         "PeerDiscoveryCoalesce": 3,
-        "MaxSuccessor": 1,
+        "MaxSuccessors": 1,
         "MaxLongDistEdges": 4,
         "Dependencies": ["Logger", "TincanInterface", "LinkManager"]
     },
     "UsageReport": {
         "Enabled": False,
         "TimerInterval": 200,
+        "Blocking": True,           # Asyncio runtime: run the handlers on the loop's executor
         "ServerAddress": "metrics.ipop-project.org",
         "ServerPort": 8081,
         "Dependencies": ["Logger", "Signal"]
     },
     "BridgeController": {
         "Enabled": True,
+        "Workers": 1,               # Worker threads, CBTs for the same TapName stay in order
+        "Blocking": True,           # Asyncio runtime: run the handlers on the loop's executor
         "Dependencies": ["Logger", "LinkManager"]
     }
 }
 
+# The schema the merged config is validated against when it is loaded. A value is described by
+# a type or tuple of types, a set of the allowed values, a list holding the type of the items,
+# or a dict for a nested section. In a section the "*" entry matches any key, such as an
+# overlay id, and the None entry names the required keys. The keys in MODULE_SCHEMA apply to
+# every module, keys that are not in the schema are reported but accepted.
+NUMBER = (int, float)
+LOG_LEVEL = {"CRITICAL", "ERROR", "WARNING", "INFO", "DEBUG", "NOTSET"}
+MODULE_SCHEMA = {
+    "Enabled": bool,
+    "Dependencies": [str],
+    "TimerInterval": NUMBER,
+    "Workers": int,
+    "Blocking": bool,
+    "QueueCapacity": int,
+    "QueueHighWatermark": NUMBER,
+    "QueueLowWatermark": NUMBER,
+    "QueueBlockTimeout": NUMBER,
+    "NodeId": str,
+}
+CONFIG_SCHEMA = {
+    "CFx": {
+        None: ("Overlays",),
+        "NodeId": str,
+        "Overlays": [str],
+        "IpopVersion": str,
+        "Model": str,
+        "Runtime": {"Threads", "Asyncio"},
+        "RequestTimeout": NUMBER,
+        "ShutdownTimeout": NUMBER,
+        "TimerResolution": NUMBER,
+        "QueueAgingLimit": int,
+        "LogBufferSize": int,
+        "CBTPoolSize": int,
+        "QueueCapacity": int,
+        "QueueHighWatermark": NUMBER,
+        "QueueLowWatermark": NUMBER,
+        "QueueBlockTimeout": NUMBER,
+        "DebugCBTs": bool,
+        "CBTLeakAges": [NUMBER],
+        "CBTLeakBucketWidth": NUMBER,
+        "MetricsFile": (str, type(None)),
+        "MetricsInterval": NUMBER,
+        "TraceBufferSize": int,
+        "TraceFile": str,
+        "ConfigWatch": bool,
+        "ConfigPollInterval": NUMBER,
+        "NidFileName": str,
+    },
+    "Logger": {
+        "LogLevel": LOG_LEVEL,
+        "Device": {"File", "Console", "All"},
+        "Directory": str,
+        "CtrlLogFileName": str,
+        "TincanLogFileName": str,
+        "MaxFileSize": int,
+        "MaxArchives": int,
+        "ConsoleLevel": (str, type(None)),
+    },
+    "OverlayVisualizer": {
+        "WebServiceAddress": str,
+        "NodeName": str,
+    },
+    "TincanInterface": {
+        "MaxReadSize": int,
+        "SocketReadWaitTime": NUMBER,
+        "RcvServiceAddress": str,
+        "SndServiceAddress": str,
+        "RcvServiceAddress6": str,
+        "SndServiceAddress6": str,
+        "CtrlRecvPort": int,
+        "CtrlSendPort": int,
+        "ReadyProbeTimeout": NUMBER,
+        "ReadyProbeMaxTimeout": NUMBER,
+    },
+    "Signal": {
+        None: ("Overlays",),
+        "CacheExpiry": NUMBER,
+        "Overlays": {"*": {
+            None: ("HostAddress", "Port"),
+            "HostAddress": str,
+            "Port": (int, str),
+            "Username": str,
+            "Password": str,
+            "AuthenticationMethod": str,
+            "TrustStore": str,
+            "CertDirectory": str,
+            "CertFile": str,
+            "Keyfile": str,
+        }},
+    },
+    "LinkManager": {
+        None: ("Overlays", "Stun"),
+        "Stun": [str],
+        "Turn": [{
+            "Address": str,
+            "User": str,
+            "Password": str,
+        }],
+        "Overlays": {"*": {
+            None: ("Type", "TapName"),
+            "Type": str,
+            "TapName": str,
+            "IP4": str,
+            "MTU4": int,
+            "IP4PrefixLen": int,
+            "IgnoredNetInterfaces": [str],
+        }},
+    },
+    "Topology": {
+        None: ("Overlays",),
+        "PeerDiscoveryCoalesce": int,
+        "MaxSuccessors": int,
+        "MaxLongDistEdges": int,
+        "Overlays": {"*": {
+            "EnforcedLinks": dict,
+            "ManualTopology": bool,
+        }},
+    },
+    "UsageReport": {
+        "ServerAddress": str,
+        "ServerPort": int,
+    },
+    "BridgeController": {
+        "Overlays": {"*": {
+            None: ("Type", "BridgeName", "IP4", "PrefixLen"),
+            "Type": {"LXBR", "OVS"},
+            "BridgeName": str,
+            "IP4": str,
+            "PrefixLen": int,
+            "MTU": int,
+            "STP": bool,
+            "AutoDelete": bool,
+            "SDNController": {
+                "ConnectionType": str,
+                "HostName": str,
+                "Port": (int, str),
+            },
+        }},
+    },
+}
+
+# CBT priority classes used by the module queues, lower values are served first
+CBT_PRIO_CONTROL = 0    # responses to control requests
+CBT_PRIO_LINK = 1       # link, tunnel and signalling events
+CBT_PRIO_QUERY = 2      # queries, presence notifications and other requests
+CBT_PRIO_LOG = 3        # logging requests and their responses
+CBT_PRIO_CLASSES = 4
+# actions that are not classified by their prefix
+CBT_PRIO_ACTIONS = {
+    "SIG_REMOTE_ACTION": CBT_PRIO_LINK,
+    "TOP_INCOMING_TUNNEL_REQ": CBT_PRIO_LINK,
+    "LNK_QUERY_LINK_INFO": CBT_PRIO_QUERY,
+    "TCI_QUERY_TUNNEL_INFO": CBT_PRIO_QUERY,
+}
+CBT_PRIO_PREFIXES = {
+    "LOG_": CBT_PRIO_LOG,
+    "LNK_": CBT_PRIO_LINK,
+    "TCI_": CBT_PRIO_LINK,
+    "ICC_": CBT_PRIO_LINK,
+}
+
+# what a module queue does with the CBTs of a priority class while it is overloaded
+CBT_OVERLOAD_ADMIT = "Admit"            # queue them regardless
+CBT_OVERLOAD_BLOCK = "Block"            # make the producer wait for the overload to clear
+CBT_OVERLOAD_DROP_OLDEST = "DropOldest" # evict the oldest CBT of the class
+CBT_OVERLOAD_COALESCE = "Coalesce"      # discard notifications equal to a queued one
+CBT_OVERLOAD_POLICIES = {
+    CBT_PRIO_CONTROL: CBT_OVERLOAD_ADMIT,
+    CBT_PRIO_LINK: CBT_OVERLOAD_BLOCK,
+    CBT_PRIO_QUERY: CBT_OVERLOAD_COALESCE,
+    CBT_PRIO_LOG: CBT_OVERLOAD_DROP_OLDEST,
+}
+# the parameters that identify equal notifications of an action
+CBT_COALESCE_KEYS = {
+    "SIG_PEER_PRESENCE_NOTIFY": ("OverlayId", "PeerId"),
+}
+
+# seconds a module has to complete a request of the given action, CFx RequestTimeout is used for
+# other actions and a CBT's own timeout takes precedence over both
+CBT_TIMEOUTS = {
+    "SIG_REMOTE_ACTION": 30,
+    "TCI_CREATE_CTRL_LINK": 10,
+    "TCI_CREATE_TUNNEL": 15,
+    "TCI_CREATE_LINK": 15,
+    "LNK_CREATE_TUNNEL": 75,
+    "LNK_REQ_LINK_ENDPT": 45,
+    "LNK_ADD_PEER_CAS": 45,
+}
+
 
 def gen_ip6(uid, ip6=None):
     if ip6 is None:
@@ -19,7 +19,7 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
 
-from distutils import spawn
+import shutil
 import subprocess
 import sys
 
@@ -311,7 +311,7 @@ def runshell(cmd):
     return p
 
 def runshell_su(cmd):
-    sudoexe = spawn.find_executable("sudo")
+    sudoexe = shutil.which("sudo")
     cmd = [sudoexe]+cmd
     p = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
     if p.returncode != 0:
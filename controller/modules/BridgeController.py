@@ -22,9 +22,11 @@
 
 from abc import ABCMeta, abstractmethod
 import threading
-from distutils import spawn
+from collections.abc import Mapping
+import shutil
 import controller.framework.ipoplib as ipoplib
-from controller.framework.ControllerModule import ControllerModule
+from controller.framework.ControllerModule import (ControllerModule, request_handler,
+                                                   notification_handler)
 
 
 
@@ -32,7 +34,7 @@ class BridgeABC():
     __metaclass__ = ABCMeta
 
     bridge_type = NotImplemented
-    iptool = spawn.find_executable("ip")
+    iptool = shutil.which("ip")
 
     def __init__(self, name, ip_addr, prefix_len, mtu):
         self.name = name
@@ -68,7 +70,7 @@ class BridgeABC():
 
 
 class OvsBridge(BridgeABC):
-    brctl = spawn.find_executable("ovs-vsctl")
+    brctl = shutil.which("ovs-vsctl")
     bridge_type = "OVS"
 
     def __init__(self, name, ip_addr, prefix_len, mtu, stp_enable, sdn_ctrl_cfg=None):
@@ -138,6 +140,15 @@ class OvsBridge(BridgeABC):
         if port_name in self.ports:
             self.ports.remove(port_name)
 
+    def del_ports(self, port_names):
+        # removes the ports with a single ovs-vsctl transaction
+        cmd = [OvsBridge.brctl]
+        for port_name in port_names:
+            cmd += ["--if-exists", "del-port", self.name, port_name, "--"]
+        if len(cmd) > 1:
+            ipoplib.runshell(cmd[:-1])
+        self.ports.difference_update(port_names)
+
     def stp(self, enable):
         if enable:
             ipoplib.runshell([OvsBridge.brctl,
@@ -150,7 +161,7 @@ class OvsBridge(BridgeABC):
 
 
 class LinuxBridge(BridgeABC):
-    brctl = spawn.find_executable("brctl")
+    brctl = shutil.which("brctl")
     bridge_type = "LXBR"
 
     def __init__(self, name, ip_addr, prefix_len, mtu, stp_enable):
@@ -254,19 +265,24 @@ class BridgeController(ControllerModule):
             self._cfx_handle.start_subscription("OverlayVisualizer", "VIS_DATA_REQ")
         except NameError as err:
             if "OverlayVisualizer" in str(err):
-                self.register_cbt("Logger", "LOG_WARNING",
-                                  "OverlayVisualizer module not loaded."
-                                  " Visualization data will not be sent.")
+                self.log("LOG_WARNING",
+                         "OverlayVisualizer module not loaded."
+                         " Visualization data will not be sent.")
 
-        self._cfx_handle.start_subscription("LinkManager", "LNK_TUNNEL_EVENTS")
-        self.register_cbt("Logger", "LOG_INFO", "Module Loaded")
+        self._cfx_handle.start_subscription(
+            "LinkManager", "LNK_TUNNEL_EVENTS",
+            {"UpdateType": ("CONNECTED", "REMOVED"), "OverlayId": self._overlays})
+        self.log("LOG_INFO", "Module Loaded")
 
+    @request_handler("BRG_ADD_PORT")
     def req_handler_add_port(self, cbt):
         pass
 
+    @request_handler("BRG_DEL_PORT")
     def req_handler_del_port(self, cbt):
         pass
 
+    @notification_handler("LNK_TUNNEL_EVENTS")
     def req_handler_manage_bridge(self, cbt):
         try:
             olid = cbt.request.params["OverlayId"]
@@ -274,45 +290,26 @@ class BridgeController(ControllerModule):
             if cbt.request.params["UpdateType"] == "CONNECTED":
                 port_name = cbt.request.params["TapName"]
                 br.add_port(port_name)
-                self.register_cbt(
-                    "Logger", "LOG_INFO", "Port {0} added to bridge {1}"
-                    .format(port_name, str(br)))
+                self.log("LOG_INFO", "Port {0} added to bridge {1}"
+                         .format(port_name, str(br)))
             elif cbt.request.params["UpdateType"] == "REMOVED":
                 if br.bridge_type == OvsBridge.bridge_type:
                     port_name = cbt.request.params.get("TapName")
                     if port_name:
                         br.del_port(port_name)
-                        self.register_cbt(
-                            "Logger", "LOG_INFO", "Port {0} removed from bridge {1}"
-                            .format(port_name, str(br)))
+                        self.log("LOG_INFO", "Port {0} removed from bridge {1}"
+                                 .format(port_name, str(br)))
         except RuntimeError as err:
-            self.register_cbt("Logger", "LOG_WARNING", str(err))
-        cbt.set_response(None, True)
-        self.complete_cbt(cbt)
+            self.log("LOG_WARNING", str(err))
 
     def resp_handler_(self, cbt):
         pass
 
-    def process_cbt(self, cbt):
-        if cbt.op_type == "Request":
-            if cbt.request.action == "BRG_ADD_PORT":
-                self.req_handler_add_port(cbt)
-            elif cbt.request.action == "BRG_DEL_PORT":
-                self.req_handler_del_port(cbt)
-            elif cbt.request.action == "LNK_TUNNEL_EVENTS":
-                self.req_handler_manage_bridge(cbt)
-            elif cbt.request.action == "VIS_DATA_REQ":
-                self.req_handler_vis_data(cbt)
-            else:
-                self.req_handler_default(cbt)
-        elif cbt.op_type == "Response":
-            parent_cbt = cbt.parent
-            cbt_data = cbt.response.data
-            cbt_status = cbt.response.status
-            self.free_cbt(cbt)
-            if (parent_cbt is not None and parent_cbt.child_count == 1):
-                parent_cbt.set_response(cbt_data, cbt_status)
-                self.complete_cbt(parent_cbt)
+    def cbt_key(self, cbt):
+        # CBTs for the same tap device are processed in order
+        if isinstance(cbt.request.params, Mapping):
+            return cbt.request.params.get("TapName")
+        return None
 
     def timer_method(self):
         pass
@@ -326,11 +323,11 @@ class BridgeController(ControllerModule):
                     br.del_br()
                 else:
                     if br.bridge_type == OvsBridge.bridge_type:
-                        for port in br.ports:
-                            br.del_port(port)
+                        br.del_ports(list(br.ports))
         except RuntimeError as err:
-            self.register_cbt("Logger", "LOG_WARNING", str(err))
+            self.log("LOG_WARNING", str(err))
 
+    @request_handler("VIS_DATA_REQ")
     def req_handler_vis_data(self, cbt):
         br_data = dict()
         is_data_available = False
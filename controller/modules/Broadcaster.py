@@ -22,7 +22,8 @@
 
 import threading
 
-from controller.framework.ControllerModule import ControllerModule
+from controller.framework.ControllerModule import (ControllerModule, request_handler,
+                                                   response_handler)
 
 
 class Broadcaster(ControllerModule):
@@ -41,8 +42,8 @@ class Broadcaster(ControllerModule):
         self._overlay_peers_lock = threading.Lock()
 
     def initialize(self):
-        self.register_cbt("Logger", "LOG_INFO", "{} module"
-                          " loaded".format(self._module_name))
+        self.log("LOG_INFO", "{} module"
+                 " loaded".format(self._module_name))
 
     def _bcast_on_icc(self, bcast_data):
         for recipient_id in self._overlay_peers[bcast_data["overlay_id"]]:
@@ -59,6 +60,7 @@ class Broadcaster(ControllerModule):
             self.register_cbt("Icc",
                               "ICC_REMOTE_ACTION", icc_req)
 
+    @request_handler("BDC_BROADCAST")
     def req_handler_broadcast(self, cbt):
         if self._overlay_peers:
             self._bcast_on_icc(cbt.request.params)
@@ -69,16 +71,19 @@ class Broadcaster(ControllerModule):
                              "TOP_QUERY_PEER_IDS", "BuildCache")
             self.submit_cbt(lcbt)
 
+    @response_handler("ICC_REMOTE_ACTION")
     def resp_handler_remote_act(self, cbt):
         if not cbt.response.status:
             self._overlay_peers = None
             self.register_cbt("Topology", "TOP_QUERY_PEER_IDS", "RefreshCache")
         parent_cbt = cbt.parent
+        cbt_status = cbt.response.status
         self.free_cbt(cbt)
         if parent_cbt:
-            parent_cbt.set_response(None, cbt.response.status)
+            parent_cbt.set_response(None, cbt_status)
             self.complete_cbt(parent_cbt)
 
+    @response_handler("TOP_QUERY_PEER_IDS")
     def resp_handler_query_peers(self, cbt):
         if cbt.request.params == "RefreshCache":
             with self._overlay_peers_lock:
@@ -96,26 +101,6 @@ class Broadcaster(ControllerModule):
             # then complete parent
             self.complete_cbt(parent_cbt)
 
-    def process_cbt(self, cbt):
-        if cbt.op_type == "Request":
-            if cbt.request.action == "BDC_BROADCAST":
-                self.req_handler_broadcast(cbt)
-            else:
-                self.req_handler_default(cbt)
-        elif cbt.op_type == "Response":
-            if cbt.request.action == "TOP_QUERY_PEER_IDS":
-                self.resp_handler_query_peers(cbt)
-            elif cbt.request.action == "ICC_REMOTE_ACTION":
-                self.resp_handler_remote_act(cbt)
-            else:
-                parent_cbt = cbt.parent
-                cbt_data = cbt.response.data
-                cbt_status = cbt.response.status
-                self.free_cbt(cbt)
-                if (parent_cbt is not None and parent_cbt.child_count == 1):
-                    parent_cbt.set_response(cbt_data, cbt_status)
-                    self.complete_cbt(parent_cbt)
-
     def timer_method(self):
         self.register_cbt("Topology", "TOP_QUERY_PEER_IDS", "RefreshCache")
 
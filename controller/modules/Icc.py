@@ -20,7 +20,8 @@
 # THE SOFTWARE.
 
 import json
-from controller.framework.ControllerModule import ControllerModule
+from controller.framework.ControllerModule import (ControllerModule, request_handler,
+                                                   response_handler, notification_handler)
 
 class Icc(ControllerModule):
     def __init__(self, cfx_handle, module_config, module_name):
@@ -31,17 +32,19 @@ class Icc(ControllerModule):
         self._remote_acts = {}
 
     def initialize(self):
-        self.register_cbt("Logger", "LOG_INFO",
-                          "Module loaded")
+        self.log("LOG_INFO", "Module loaded")
 
        # Subscribe for link updates from LinkManager
         self._cfx_handle.start_subscription("LinkManager",
-                                            "LNK_TUNNEL_EVENTS")
+                                            "LNK_TUNNEL_EVENTS",
+                                            {"UpdateType": ("ADDED", "REMOVED")})
 
         # Subscribe for messages from TincanInterface
         self._cfx_handle.start_subscription("TincanInterface",
-                                            "TCI_TINCAN_MSG_NOTIFY")
+                                            "TCI_TINCAN_MSG_NOTIFY",
+                                            {"Command": ("ICC",)})
 
+    @notification_handler("LNK_TUNNEL_EVENTS")
     def update_links(self, cbt):
         """ Update the self._links dict based on
             updates from the LinkManager """
@@ -65,10 +68,9 @@ class Icc(ControllerModule):
                     if not self._links[overlayid]["Peers"]:
                         del self._links[overlayid]
                     break
-        self.register_cbt("Logger", "LOG_INFO", "Received Link Updates")
-        cbt.set_response(None, True)
-        self.complete_cbt(cbt)
+        self.log("LOG_INFO", "Received Link Updates")
 
+    @request_handler("ICC_SEND_DATA")
     def send_icc_data(self, cbt):
         """
             rem_data  = dict(OverlayId = "",
@@ -80,8 +82,7 @@ class Icc(ControllerModule):
                              InitiatorCM="",
                              ActionTag="")
         """
-        self.register_cbt("Logger", "LOG_DEBUG", "Send data request {0} from {1}"
-                          .format(cbt.tag, cbt.request.initiator))
+        self.log_debug("Send data request {0} from {1}", cbt.tag, cbt.request.initiator)
         rem_data = cbt.request.params
         peerid = rem_data["RecipientId"]
         overlayid = rem_data["OverlayId"]
@@ -99,6 +100,7 @@ class Icc(ControllerModule):
 
         self.register_cbt("TincanInterface", "TCI_ICC", icc_msg)
 
+    @request_handler("ICC_BROADCAST_DATA")
     def broadcast_icc_data(self, cbt):
         """ Module to send broadcast requests to all
             Controllers. Currently broadcast operation
@@ -114,6 +116,7 @@ class Icc(ControllerModule):
             lcbt.set_request("TincanInterface", "TCI_ICC", param)
             self.submit_cbt(lcbt)
 
+    @request_handler("ICC_REMOTE_ACTION")
     def send_icc_remote_action(self, cbt):
         """
         rem_act = dict(OverlayId="",
@@ -129,8 +132,7 @@ class Icc(ControllerModule):
                           Data="",
                           Status="")
         """
-        self.register_cbt("Logger", "LOG_DEBUG", "Send remote action {0} from {1}"
-                          .format(cbt.tag, cbt.request.initiator))
+        self.log_debug("Send remote action {0} from {1}", cbt.tag, cbt.request.initiator)
         rem_act = cbt.request.params
         peerid = rem_act["RecipientId"]
         overlayid = rem_act["OverlayId"]
@@ -154,13 +156,12 @@ class Icc(ControllerModule):
             }
         self.register_cbt("TincanInterface", "TCI_ICC", icc_msg)
 
+    @notification_handler("TCI_TINCAN_MSG_NOTIFY")
     def recieve_icc(self, cbt):
         """ This module recieves all the incoming Icc requests.
             Forwards the requests or responses to the
             correct recipient module"""
         if cbt.request.params["Command"] != "ICC":
-            cbt.set_response(None, False)
-            self.complete_cbt(cbt)
             return
 
         rem_act = json.loads(cbt.request.params["Data"])
@@ -168,16 +169,14 @@ class Icc(ControllerModule):
         # The field "Action" will not be present in rem_act
         # to differentiate Data Delivery & Remote action requests
         if "Action" not in rem_act:
-            self.register_cbt("Logger", "LOG_DEBUG", "Incoming remote data {0}"
-                              .format(rem_act["ActionTag"]))
+            self.log_debug("Incoming remote data {0}", rem_act["ActionTag"])
             target_module_name = rem_act["RecipientCM"]
             opaque_msg = rem_act["Params"]
             self.register_cbt(target_module_name, "ICC_DELIVER_DATA", opaque_msg)
 
         # New incoming Remote action requests received via Tincan
         elif rem_act["ActionTag"] not in self._cfx_handle._pending_cbts:
-            self.register_cbt("Logger", "LOG_DEBUG", "Incoming remote action {0}"
-                              .format(rem_act["ActionTag"]))
+            self.log_debug("Incoming remote action {0}", rem_act["ActionTag"])
             target_module_name = rem_act["RecipientCM"]
             remote_action_code = rem_act["Action"]
             opaque_msg = rem_act["Params"]
@@ -190,25 +189,22 @@ class Icc(ControllerModule):
 
         # Handle response to the remote action
         else:
-            self.register_cbt("Logger", "LOG_DEBUG", "Remote action response {0}"
-                              .format(rem_act["ActionTag"]))
-            rcbt = self._cfx_handle._pending_cbts[rem_act["ActionTag"]]
+            self.log_debug("Remote action response {0}", rem_act["ActionTag"])
+            rcbt = self.claim_pending_cbt(rem_act["ActionTag"])
+            if rcbt is None:
+                return  # expired since it was checked
             rem_act = json.loads(cbt.request.params["Data"])
             resp_data = rem_act["Data"]
             status = rem_act["Status"]
             rcbt.set_response(resp_data, status)
-            self.complete_cbt(rcbt)
-        # Complete notification
-        cbt.set_response(None, True)
-        self.complete_cbt(cbt)
+            self.complete_cbt(rcbt, claimed=True)
 
     def complete_remote_action(self, cbt):
         """ Complete the remote action by sending back the responses
             from the modules via Tincan """
         if cbt.tag in self._remote_acts:
             rem_act = self._remote_acts[cbt.tag]
-            self.register_cbt("Logger", "LOG_DEBUG", "Remote action complete"
-                              " {0}".format(rem_act["ActionTag"]))
+            self.log_debug("Remote action complete {0}", rem_act["ActionTag"])
             overlayid = rem_act["OverlayId"]
             peerid = rem_act["InitiatorId"]
             if peerid in self._links[overlayid]["Peers"]:
@@ -224,52 +220,34 @@ class Icc(ControllerModule):
                 self.register_cbt("TincanInterface", "TCI_ICC", icc_msg)
         self.free_cbt(cbt)
 
+    @response_handler("TCI_ICC")
     def resp_handler_tc_icc(self, cbt):
         """ Handling responses for CBTs sent to TCI """
         cbt_data = json.loads(cbt.request.params["Data"])
         # Failure responses from TincanInterface
         # Common for both Data delivery & Remote Action requests
         if not cbt.response.status:
-            pcbt = self._cfx_handle._pending_cbts[cbt_data["ActionTag"]]
-            pcbt.set_response("Failed to send ICC", False)
-            self.complete_cbt(pcbt)
+            pcbt = self.claim_pending_cbt(cbt_data["ActionTag"])
+            if pcbt is not None:
+                pcbt.set_response("Failed to send ICC", False)
+                self.complete_cbt(pcbt, claimed=True)
 
         # Successful responses from TincanInterface
         # for Data delivery Requests
-        if "Action" not in cbt_data:
-            rcbt = self._cfx_handle._pending_cbts[cbt_data["ActionTag"]]
-            rcbt.set_response("Icc Send Data Successful", True)
-            self.complete_cbt(rcbt)
+        elif "Action" not in cbt_data:
+            rcbt = self.claim_pending_cbt(cbt_data["ActionTag"])
+            if rcbt is not None:
+                rcbt.set_response("Icc Send Data Successful", True)
+                self.complete_cbt(rcbt, claimed=True)
 
         self.free_cbt(cbt)
 
-    def process_cbt(self, cbt):
-        if cbt.op_type == "Request":
-            if cbt.request.action == "LNK_TUNNEL_EVENTS":
-                self.update_links(cbt)
-
-            elif cbt.request.action == "ICC_SEND_DATA":
-                self.send_icc_data(cbt)
-
-            elif cbt.request.action == "ICC_BROADCAST_DATA":
-                self.broadcast_icc_data(cbt)
-
-            elif cbt.request.action == "ICC_REMOTE_ACTION":
-                self.send_icc_remote_action(cbt)
-
-            elif cbt.request.action == "TCI_TINCAN_MSG_NOTIFY":
-                self.recieve_icc(cbt)
-            else:
-                self.req_handler_default(cbt)
-        elif cbt.op_type == "Response":
-            if cbt.request.action == "TCI_ICC":
-                self.resp_handler_tc_icc(cbt)
-
-            elif cbt.request.action == "ICC_DELIVER_DATA":
-                self.free_cbt(cbt)
+    @response_handler("ICC_DELIVER_DATA")
+    def resp_handler_deliver_data(self, cbt):
+        self.free_cbt(cbt)
 
-            else:
-                self.complete_remote_action(cbt)
+    def resp_handler_default(self, cbt):
+        self.complete_remote_action(cbt)
 
     def terminate(self):
         pass
@@ -23,8 +23,28 @@ import os
 import threading
 import uuid
 import time
-from collections import defaultdict
-from controller.framework.ControllerModule import ControllerModule
+from collections import defaultdict, namedtuple
+from controller.framework.CFxConfig import apply_config_change
+from controller.framework.ControllerModule import (ControllerModule, request_handler,
+                                                   response_handler, notification_handler)
+
+# the settings of an overlay's tunnels, taken from the validated config when it is loaded
+TunnelConfig = namedtuple("TunnelConfig", ["type", "tap_name", "tap_name_prefix", "ip4", "mtu4",
+                                           "ip4_prefix_len", "ignored_net_interfaces",
+                                           "stun_servers", "turn_servers"])
+
+
+def tunnel_config(cm_config, overlay_id):
+    ol_cfg = cm_config["Overlays"][overlay_id]
+    return TunnelConfig(type=ol_cfg["Type"],
+                        tap_name=ol_cfg["TapName"],
+                        tap_name_prefix=ol_cfg["TapName"][:8],
+                        ip4=ol_cfg.get("IP4"),
+                        mtu4=ol_cfg.get("MTU4"),
+                        ip4_prefix_len=ol_cfg.get("IP4PrefixLen"),
+                        ignored_net_interfaces=frozenset(ol_cfg.get("IgnoredNetInterfaces", ())),
+                        stun_servers=tuple(cm_config["Stun"]),
+                        turn_servers=tuple(cm_config.get("Turn") or ()))
 
 
 class LinkManager(ControllerModule):
@@ -35,7 +55,8 @@ class LinkManager(ControllerModule):
         self._peers = {}     # maps overlay id to peers map, which maps peer id to link id
         self._lock = threading.Lock()  # serializes access to _overlays, _links
         self._link_updates_publisher = None
-        self._ignored_net_interfaces = defaultdict(set)
+        self._ignored_net_interfaces = defaultdict(set)   # added with LNK_ADD_IGN_INF
+        self._tunnel_cfgs = {}  # overlay id -> TunnelConfig
 
     def __repr__(self):
         state = "<_peers: %s, _tunnels: %s>" % (self._peers, self._tunnels)
@@ -43,29 +64,27 @@ class LinkManager(ControllerModule):
 
     def initialize(self):
         self._link_updates_publisher = \
-            self._cfx_handle.publish_subscription("LNK_TUNNEL_EVENTS")
+            self._cfx_handle.publish_subscription("LNK_TUNNEL_EVENTS", notify=True)
         self._cfx_handle.start_subscription("TincanInterface",
-                                            "TCI_TINCAN_MSG_NOTIFY")
+                                            "TCI_TINCAN_MSG_NOTIFY",
+                                            {"Command": ("LinkStateChange",)})
         try:
             # Subscribe for data request notifications from OverlayVisualizer
             self._cfx_handle.start_subscription("OverlayVisualizer",
                                                 "VIS_DATA_REQ")
         except NameError as err:
             if "OverlayVisualizer" in str(err):
-                self.register_cbt("Logger", "LOG_WARNING",
-                                  "OverlayVisualizer module not loaded."
-                                  " Visualization data will not be sent.")
+                self.log("LOG_WARNING",
+                         "OverlayVisualizer module not loaded."
+                         " Visualization data will not be sent.")
         overlay_ids = self._cfx_handle.query_param("Overlays")
         for olid in overlay_ids:
             self._peers[olid] = dict()
 
         for overlay_id in self._cm_config["Overlays"]:
-            ol_cfg = self._cm_config["Overlays"][overlay_id]
-            if "IgnoredNetInterfaces" in ol_cfg:
-                for ign_inf in ol_cfg["IgnoredNetInterfaces"]:
-                    self._ignored_net_interfaces[overlay_id].add(ign_inf)
+            self._tunnel_cfgs[overlay_id] = tunnel_config(self._cm_config, overlay_id)
 
-        self.register_cbt("Logger", "LOG_INFO", "Module Loaded")
+        self.log("LOG_INFO", "Module Loaded")
 
     def _get_ignored_tap_names(self, overlay_id, new_inf_name=None):
         ign_tap_names = set()
@@ -78,10 +97,11 @@ class LinkManager(ControllerModule):
                 ign_tap_names.add(
                     self._tunnels[tnlid]["Descriptor"]["TapName"])
         # Overlay_id is only used to selectively ignore physical interfaces and bridges
-        ign_tap_names \
-            |= self._ignored_net_interfaces[overlay_id]
+        ign_tap_names |= self._tunnel_cfgs[overlay_id].ignored_net_interfaces
+        ign_tap_names |= self._ignored_net_interfaces[overlay_id]
         return ign_tap_names
 
+    @request_handler("LNK_ADD_IGN_INF")
     def req_handler_add_ign_inf(self, cbt):
         ign_inf_details = cbt.request.params
         for olid in ign_inf_details:
@@ -89,6 +109,7 @@ class LinkManager(ControllerModule):
         cbt.set_response(None, True)
         self.complete_cbt(cbt)
 
+    @request_handler("LNK_REMOVE_TUNNEL")
     def req_handler_remove_tnl(self, cbt):
         """Remove the tunnel and link given either the overlay id and peer id, or the tunnel id"""
         # not currently being used
@@ -122,7 +143,7 @@ class LinkManager(ControllerModule):
         self._tunnels[tnl_id]["Descriptor"]["MAC"] = tnl_desc["MAC"]
         self._tunnels[tnl_id]["Descriptor"]["TapName"] = tnl_desc["TapName"]
         self._tunnels[tnl_id]["Descriptor"]["FPR"] = tnl_desc["FPR"]
-        self.register_cbt("Logger", "LOG_DEBUG", "_tunnels:{}".format(self._tunnels))
+        self.log_debug("_tunnels:{}", self._tunnels)
 
     def _query_link_stats(self):
         """Query the status of links that have completed creation process"""
@@ -133,17 +154,18 @@ class LinkManager(ControllerModule):
         if params:
             self.register_cbt("TincanInterface", "TCI_QUERY_LINK_STATS", params)
 
+    @response_handler("TCI_QUERY_LINK_STATS")
     def resp_handler_query_link_stats(self, cbt):
         if not cbt.response.status:
-            self.register_cbt("Logger", "LOG_WARNING", "Link stats update error: {0}"
-                              .format(cbt.response.data))
+            self.log("LOG_WARNING", "Link stats update error: {0}"
+                     .format(cbt.response.data))
             self.free_cbt(cbt)
             return
         if not cbt.response.data:
             self.free_cbt(cbt)
             return
         data = cbt.response.data
-        #self.register_cbt("Logger", "LOG_INFO", "Tunnel stats: {0}".format(data))
+        #self.log("LOG_INFO", "Tunnel stats: {0}".format(data))
         # Handle any connection failures and update tracking data
         for tnl_id in data:
             for lnkid in data[tnl_id]:
@@ -177,8 +199,8 @@ class LinkManager(ControllerModule):
                         self._tunnels[lnkid]["Link"]["Stats"] = data[tnl_id][lnkid]["Stats"]
                         self._tunnels[lnkid]["Link"]["StatusRetry"] = 0
                     else:
-                        self.register_cbt("Logger", "LOG_WARNING", "Unrecognized tunnel state "
-                                          "{0}:{1}".format(lnkid, data[tnl_id][lnkid]["Status"]))
+                        self.log("LOG_WARNING", "Unrecognized tunnel state "
+                                 "{0}:{1}".format(lnkid, data[tnl_id][lnkid]["Status"]))
         self.free_cbt(cbt)
 
     def _cleanup_removed_tunnel(self, tnlid):
@@ -189,6 +211,7 @@ class LinkManager(ControllerModule):
             self._peers[olid].pop(peer_id, None)
 
 
+    @response_handler("TCI_REMOVE_TUNNEL")
     def resp_handler_remove_tunnel(self, rmv_tnl_cbt):
         """
         Clean up the tunnel meta data. Even of the CBT fails it is safe to discard
@@ -210,10 +233,11 @@ class LinkManager(ControllerModule):
         if parent_cbt is not None:
             parent_cbt.set_response("Tunnel removed", True)
             self.complete_cbt(parent_cbt)
-        self.register_cbt("Logger", "LOG_INFO", "Tunnel {0} removed: {1}:{2}<->{3}"
-                          .format(tnlid[:7], olid[:7], self._cm_config["NodeId"][:7], peer_id[:7]))
-        #self.register_cbt("Logger", "LOG_DEBUG", "State:\n" + str(self))
+        self.log("LOG_INFO", "Tunnel {0} removed: {1}:{2}<->{3}"
+                 .format(tnlid[:7], olid[:7], self._cm_config["NodeId"][:7], peer_id[:7]))
+        #self.log("LOG_DEBUG", "State:\n" + str(self))
 
+    @request_handler("LNK_QUERY_LINK_INFO")
     def req_handler_query_tunnels_info(self, cbt):
         results = {}
         for tnlid in self._tunnels:
@@ -225,28 +249,28 @@ class LinkManager(ControllerModule):
 
     def _create_tunnel(self, params, parent_cbt=None):
         overlay_id = params["OverlayId"]
-        ol_type = self._cm_config["Overlays"][overlay_id]["Type"]
+        tnl_cfg = self._tunnel_cfgs[overlay_id]
         lnkid = params["LinkId"]
         peer_id = params["PeerId"]
-        tap_name = self._cm_config["Overlays"][overlay_id]["TapName"][:8] + str(peer_id[:7])
+        tap_name = tnl_cfg.tap_name_prefix + str(peer_id[:7])
         if os.name == "nt":
-            tap_name = self._cm_config["Overlays"][overlay_id]["TapName"]
+            tap_name = tnl_cfg.tap_name
         create_tnl_params = {
             "OverlayId": overlay_id,
             "NodeId": self._cm_config["NodeId"],
             "TunnelId": lnkid,
             "LinkId": lnkid,
-            "StunServers": self._cm_config["Stun"],
-            "Type": ol_type,
+            "StunServers": tnl_cfg.stun_servers,
+            "Type": tnl_cfg.type,
             "TapName": tap_name,
-            "IP4": self._cm_config["Overlays"][overlay_id].get("IP4"),
-            "MTU4": self._cm_config["Overlays"][overlay_id].get("MTU4"),
-            "IP4PrefixLen": self._cm_config["Overlays"][overlay_id].get("IP4PrefixLen"),
+            "IP4": tnl_cfg.ip4,
+            "MTU4": tnl_cfg.mtu4,
+            "IP4PrefixLen": tnl_cfg.ip4_prefix_len,
             "IgnoredNetInterfaces": list(
                 self._get_ignored_tap_names(overlay_id, tap_name))
         }
-        if self._cm_config.get("Turn"):
-            create_tnl_params["TurnServers"] = self._cm_config["Turn"]
+        if tnl_cfg.turn_servers:
+            create_tnl_params["TurnServers"] = tnl_cfg.turn_servers
 
         if parent_cbt is not None:
             tnl_cbt = self.create_linked_cbt(parent_cbt)
@@ -306,10 +330,13 @@ class LinkManager(ControllerModule):
             params = {"OverlayId": olid, "PeerId": peer_id, "TunnelId": link_id, "LinkId": link_id}
             self.register_cbt("TincanInterface", "TCI_REMOVE_TUNNEL", params)
 
-            self.register_cbt("Logger", "LOG_INFO", "Initiated removal of incomplete link: "
-                              "PeerId:{2}, LinkId:{0}, CreateState:{1}"
-                              .format(link_id[:7], format(creation_state, "02X"), peer_id[:7]))
+            self.log("LOG_INFO", "Initiated removal of incomplete link: "
+                     "PeerId:{2}, LinkId:{0}, CreateState:{1}"
+                     .format(link_id[:7], format(creation_state, "02X"), peer_id[:7]))
 
+    # Create Link: Phase 1 Node A
+    # TOP wants a new link, first SIGnal peer to create endpt
+    @request_handler("LNK_CREATE_TUNNEL")
     def req_handler_create_tunnel(self, cbt):
         """
         Handle the request for capability LNK_CREATE_TUNNEL.
@@ -339,18 +366,21 @@ class LinkManager(ControllerModule):
                                      Descriptor=dict(),
                                      CreationStartTime=time.time(),
                                      Link=dict(CreationState=0xA1, Stats=dict()))
+        self._schedule_link_expiry(tnl_id)
 
-        self.register_cbt("Logger", "LOG_DEBUG", "Create Link:{} Phase 1/5 Node A"
-                          .format(tnl_id[:7]))
+        self.log_debug("Create Link:{} Phase 1/5 Node A", tnl_id[:7])
         lnkupd_param = {
             "UpdateType": "CREATING", "OverlayId": overlay_id, "PeerId": peerid,
             "TunnelId": tnl_id, "LinkId": tnl_id}
         self._link_updates_publisher.post_update(lnkupd_param)
 
         params = {"OverlayId": overlay_id, "TunnelId": tnl_id, "LinkId": tnl_id,
-                  "Type": self._cm_config["Overlays"][overlay_id]["Type"], "PeerId": peerid}
+                  "Type": self._tunnel_cfgs[overlay_id].type, "PeerId": peerid}
         self._create_tunnel(params, parent_cbt=cbt)
 
+    # Create Link: Phase 2 Node A
+    # Retrieved our node data for response
+    @response_handler("TCI_CREATE_TUNNEL")
     def resp_handler_create_tunnel(self, cbt):
         # Create Link: Phase 2 Node A
         parent_cbt = cbt.parent
@@ -361,21 +391,23 @@ class LinkManager(ControllerModule):
             self.free_cbt(cbt)
             parent_cbt.set_response(resp_data, False)
             self.complete_cbt(parent_cbt)
-            self.register_cbt("Logger", "LOG_WARNING", "The create tunnel operation failed:{}"
-                              .format(parent_cbt.response.data))
+            self.log("LOG_WARNING", "The create tunnel operation failed:{}"
+                     .format(parent_cbt.response.data))
             return
         # transistion connection connection state
         self._tunnels[lnkid]["Link"]["CreationState"] = 0xA2
         # store the overlay data
         overlay_id = cbt.request.params["OverlayId"]  # config overlay id
-        self.register_cbt("Logger", "LOG_DEBUG", "Create Link:{} Phase 2/5 Node A"
-                          .format(lnkid[:7]))
+        self.log_debug("Create Link:{} Phase 2/5 Node A", lnkid[:7])
         self._update_tunnel_descriptor(resp_data, lnkid)
         # create and send remote action to request endpoint from peer
         params = {"OverlayId": overlay_id, "TunnelId": lnkid, "LinkId": lnkid}
         self._request_peer_endpoint(params, parent_cbt)
         self.free_cbt(cbt)
 
+    # Create Link: Phase 3 Node B
+    # Rcvd peer req to create endpt, send to TCI
+    @request_handler("LNK_REQ_LINK_ENDPT")
     def req_handler_req_link_endpt(self, cbt):
         """
         Handle the request for capability LNK_REQ_LINK_ENDPT.
@@ -385,9 +417,9 @@ class LinkManager(ControllerModule):
         # Create Link: Phase 3 Node B
         params = cbt.request.params
         overlay_id = params["OverlayId"]
-        if overlay_id not in self._cm_config["Overlays"]:
-            self.register_cbt("Logger", "LOG_WARNING", "The requested overlay not specified in "
-                              "local config, it will not be created")
+        if overlay_id not in self._tunnel_cfgs:
+            self.log("LOG_WARNING", "The requested overlay not specified in "
+                     "local config, it will not be created")
             cbt.set_response("Unknown overlay id specified in request", False)
             self.complete_cbt(cbt)
             return
@@ -397,20 +429,19 @@ class LinkManager(ControllerModule):
         if peer_id in self._peers[overlay_id]:
             cbt.set_response("A tunnel already exists with this peer", False)
             self.complete_cbt(cbt)
-            self.register_cbt("Logger", "LOG_INFO", "A create link endpoint request from a "
-                              "paired peer was rejected {0}:{1}:{2}"
-                              .format(overlay_id[:7], peer_id[:7], lnkid[:7]))
+            self.log("LOG_INFO", "A create link endpoint request from a "
+                     "paired peer was rejected {0}:{1}:{2}"
+                     .format(overlay_id[:7], peer_id[:7], lnkid[:7]))
             return
         #if len(self._tunnels) > 10: # parameterize this
         #    cbt.set_response("No tunnels currently available", False)
         #    self.complete_cbt(cbt)
-        #    self.register_cbt("Logger", "LOG_INFO", "A create link endpoint request was "
-        #                      "discarded as the maximum number of tunnels has been reached. {0}"
-        #                      . format(cbt))
+        #    self.log("LOG_INFO", "A create link endpoint request was "
+        #             "discarded as the maximum number of tunnels has been reached. {0}"
+        #             . format(cbt))
         #    return
         # add to index for peer->link lookup
-        self.register_cbt("Logger", "LOG_DEBUG", "Create Link:{} Phase 1/4 Node B"
-                          .format(lnkid[:7]))
+        self.log_debug("Create Link:{} Phase 1/4 Node B", lnkid[:7])
         self._peers[overlay_id][peer_id] = lnkid
         self._tunnels[lnkid] = dict(OverlayId=overlay_id,
                                     PeerId=peer_id,
@@ -419,6 +450,7 @@ class LinkManager(ControllerModule):
                                     CreationStartTime=time.time(),
                                     Link=dict(CreationState=0xB1,
                                               Stats=dict()))
+        self._schedule_link_expiry(lnkid)
 
         # publish notification of link creation initiated Node B
         lnkupd_param = {
@@ -426,19 +458,19 @@ class LinkManager(ControllerModule):
             "TunnelId": lnkid, "LinkId": lnkid}
         self._link_updates_publisher.post_update(lnkupd_param)
         # Send request to Tincan
-        ol_type = self._cm_config["Overlays"][overlay_id]["Type"]
-        tap_name = self._cm_config["Overlays"][overlay_id]["TapName"][:8] + str(peer_id[:7])
+        tnl_cfg = self._tunnel_cfgs[overlay_id]
+        tap_name = tnl_cfg.tap_name_prefix + str(peer_id[:7])
         create_link_params = {
             "OverlayId": overlay_id,
             # overlay params
             "TunnelId": lnkid,
             "NodeId": self._cm_config["NodeId"],
-            "StunServers": self._cm_config["Stun"],
-            "Type": ol_type,
+            "StunServers": tnl_cfg.stun_servers,
+            "Type": tnl_cfg.type,
             "TapName": tap_name,
-            "IP4": self._cm_config["Overlays"][overlay_id].get("IP4"),
-            "MTU4": self._cm_config["Overlays"][overlay_id].get("MTU4"),
-            "IP4PrefixLen": self._cm_config["Overlays"][overlay_id].get("IP4PrefixLen"),
+            "IP4": tnl_cfg.ip4,
+            "MTU4": tnl_cfg.mtu4,
+            "IP4PrefixLen": tnl_cfg.ip4_prefix_len,
             "IgnoredNetInterfaces": list(
                 self._get_ignored_tap_names(overlay_id, tap_name)),
             # link params
@@ -447,8 +479,8 @@ class LinkManager(ControllerModule):
                 "FPR": node_data["FPR"],
                 "MAC": node_data["MAC"],
                 "UID": node_data["UID"]}}
-        if self._cm_config.get("Turn"):
-            create_link_params["TurnServers"] = self._cm_config["Turn"]
+        if tnl_cfg.turn_servers:
+            create_link_params["TurnServers"] = tnl_cfg.turn_servers
         lcbt = self.create_linked_cbt(cbt)
         lcbt.set_request(self._module_name, "TincanInterface",
                          "TCI_CREATE_LINK", create_link_params)
@@ -463,12 +495,11 @@ class LinkManager(ControllerModule):
             parent_cbt.set_response(resp_data, False)
             if parent_cbt.child_count == 1:
                 self.complete_cbt(parent_cbt)
-            self.register_cbt("Logger", "LOG_WARNING", "Create link endpoint failed :{}"
-                              .format(cbt.response.data))
+            self.log("LOG_WARNING", "Create link endpoint failed :{}"
+                     .format(resp_data))
             return
         lnkid = cbt.request.params["LinkId"]
-        self.register_cbt("Logger", "LOG_DEBUG", "Create Link:{} Phase 2/4 Node B"
-                          .format(lnkid[:7]))
+        self.log_debug("Create Link:{} Phase 2/4 Node B", lnkid[:7])
         # store the overlay data
         self._update_tunnel_descriptor(resp_data, lnkid)
         self._tunnels[lnkid]["Link"]["CreationState"] = 0xB2
@@ -497,8 +528,7 @@ class LinkManager(ControllerModule):
         rem_act = parent_cbt.request.params
         lnkid = rem_act["LinkId"]
         self._tunnels[lnkid]["Link"]["CreationState"] = 0xC0
-        self.register_cbt("Logger", "LOG_DEBUG", "Create Link:{} Phase 4/4 Node B"
-                          .format(lnkid[:7]))
+        self.log_debug("Create Link:{} Phase 4/4 Node B", lnkid[:7])
         peer_id = rem_act["NodeData"]["UID"]
         olid = rem_act["OverlayId"]
         resp_data = cbt.response.data
@@ -517,8 +547,8 @@ class LinkManager(ControllerModule):
         parent_cbt.set_response(data=data, status=True)
         self.free_cbt(cbt)
         self.complete_cbt(parent_cbt)
-        self.register_cbt("Logger", "LOG_INFO", "Tunnel {0} accepted: {1}:{2}<-{3}"
-                          .format(lnkid[:7], olid[:7], self._cm_config["NodeId"][:7], peer_id[:7]))
+        self.log("LOG_INFO", "Tunnel {0} accepted: {1}:{2}<-{3}"
+                 .format(lnkid[:7], olid[:7], self._cm_config["NodeId"][:7], peer_id[:7]))
 
     def _create_link_endpoint(self, rem_act, parent_cbt):
         """
@@ -532,8 +562,7 @@ class LinkManager(ControllerModule):
             self.complete_cbt(parent_cbt)
             return
         self._tunnels[lnkid]["Link"]["CreationState"] = 0xA3
-        self.register_cbt("Logger", "LOG_DEBUG", "Create Link:{} Phase 3/5 Node A"
-                          .format(lnkid[:7]))
+        self.log_debug("Create Link:{} Phase 3/5 Node A", lnkid[:7])
         node_data = rem_act["Data"]["NodeData"]
         olid = rem_act["OverlayId"]
         cbt_params = {"OverlayId": olid, "TunnelId": lnkid, "LinkId": lnkid, "Type": "TUNNEL",
@@ -550,8 +579,7 @@ class LinkManager(ControllerModule):
         # Create Link: Phase 6 Node A
         lnkid = cbt.request.params["LinkId"]
         self._tunnels[lnkid]["Link"]["CreationState"] = 0xA4
-        self.register_cbt("Logger", "LOG_DEBUG", "Create Link:{} Phase 4/5 Node A"
-                          .format(lnkid[:7]))
+        self.log_debug("Create Link:{} Phase 4/5 Node A", lnkid[:7])
         local_cas = cbt.response.data["CAS"]
         parent_cbt = cbt.parent
         olid = cbt.request.params["OverlayId"]
@@ -570,6 +598,9 @@ class LinkManager(ControllerModule):
         self.submit_cbt(lcbt)
         self.free_cbt(cbt)
 
+    # Create Link: Phase 7 Node B
+    # CAS rcvd from peer, sends to TCI to update link's peer CAS info
+    @request_handler("LNK_ADD_PEER_CAS")
     def req_handler_add_peer_cas(self, cbt):
         # Create Link: Phase 7 Node B
         params = cbt.request.params
@@ -578,26 +609,30 @@ class LinkManager(ControllerModule):
         peer_id = params["NodeData"]["UID"]
         if peer_id not in self._peers[olid] or lnkid not in self._tunnels:
             self._cleanup_removed_tunnel(lnkid)
-            self.register_cbt("Logger", "LOG_DEBUG",
-                              "A response to an aborted add peer CAS operation was discarded: {0}".
-                              format(str(cbt)))
+            self.log_debug("A response to an aborted add peer CAS operation was discarded: {0}",
+                           cbt)
 
         self._tunnels[lnkid]["Link"]["CreationState"] = 0xB3
-        self.register_cbt("Logger", "LOG_DEBUG", "Create Link: {} Phase 3/4 Node B"
-                          .format(lnkid[:7]))
+        self.log_debug("Create Link: {} Phase 3/4 Node B", lnkid[:7])
         lcbt = self.create_linked_cbt(cbt)
-        params["Type"] = self._cm_config["Overlays"][olid]["Type"]
+        params["Type"] = self._tunnel_cfgs[olid].type
         lcbt.set_request(self._module_name, "TincanInterface", "TCI_CREATE_LINK", params)
         self.submit_cbt(lcbt)
 
+    # Create Link: Phase 4 Node B
+    # Create Link: Phase 6 Node A
+    # SIGnal to peer to update CAS
+    # Create Link: Phase 8 Node B
+    # Complete setup
+    @response_handler("TCI_CREATE_LINK")
     def resp_handler_create_link_endpt(self, cbt):
         parent_cbt = cbt.parent
         resp_data = cbt.response.data
         if not cbt.response.status:
             link_id = cbt.request.params["LinkId"]
             self._rollback_link_creation_changes(link_id)
-            self.register_cbt("Logger", "LOG_WARNING", "Create link endpoint failed :{}"
-                              .format(cbt))
+            self.log("LOG_WARNING", "Create link endpoint failed :{}"
+                     .format(cbt))
             self.free_cbt(cbt)
             parent_cbt.set_response(resp_data, False)
             self.complete_cbt(parent_cbt)
@@ -631,19 +666,22 @@ class LinkManager(ControllerModule):
         olid = parent_cbt.request.params["OverlayId"]
         peer_id = parent_cbt.request.params["PeerId"]
         if peer_id not in self._peers[olid]:
-            self.register_cbt("Logger", "LOG_DEBUG",
-                              "A response to an aborted create link operation was discarded: {0}".
-                              format(parent_cbt))
+            self.log_debug("A response to an aborted create link operation was discarded: {0}",
+                           parent_cbt)
             return
         lnkid = self._peers[olid][peer_id]
         self._tunnels[lnkid]["Link"]["CreationState"] = 0xC0
-        self.register_cbt("Logger", "LOG_DEBUG", "Create Link:{} Phase 5/5 Node A"
-                          .format(lnkid[:7]))
+        self.log_debug("Create Link:{} Phase 5/5 Node A", lnkid[:7])
         parent_cbt.set_response(data={"LinkId": lnkid}, status=True)
         self.complete_cbt(parent_cbt)
-        self.register_cbt("Logger", "LOG_INFO", "Tunnel {0} created: {1}:{2}->{3}"
-                          .format(lnkid[:7], olid[:7], self._cm_config["NodeId"][:7], peer_id[:7]))
-
+        self.log("LOG_INFO", "Tunnel {0} created: {1}:{2}->{3}"
+                 .format(lnkid[:7], olid[:7], self._cm_config["NodeId"][:7], peer_id[:7]))
+
+    # Create Link: Phase 5 Node A
+    # Attempt to create our end of link
+    # Create Link: Phase 9 Node A
+    # Link created, notify others
+    @response_handler("SIG_REMOTE_ACTION")
     def resp_handler_remote_action(self, cbt):
         parent_cbt = cbt.parent
         resp_data = cbt.response.data
@@ -661,6 +699,7 @@ class LinkManager(ControllerModule):
             elif rem_act["Action"] == "LNK_ADD_PEER_CAS":
                 self._complete_create_link_request(parent_cbt)
 
+    @notification_handler("TCI_TINCAN_MSG_NOTIFY")
     def req_handler_tincan_msg(self, cbt):
         lts = time.time()
         if cbt.request.params["Command"] == "LinkStateChange":
@@ -687,102 +726,52 @@ class LinkManager(ControllerModule):
                 # if the lnk_status is TNL_OFFLINE the recconect event came in too late and the
                 # tear down has already been issued. This scenario is unlikely as the recheck time
                 # is long enough such that the webrtc reconnect attempts will have been abandoned.
-            cbt.set_response(data=None, status=True)
-        else:
-            cbt.set_response(data=None, status=True)
-        self.complete_cbt(cbt)
 
     def process_cbt(self, cbt):
+        # the handlers of different links share the peer maps and are serialized, more workers
+        # would add no concurrency so the module keeps the default of one
         with self._lock:
-            if cbt.op_type == "Request":
-                if cbt.request.action == "LNK_CREATE_TUNNEL":
-                    # Create Link: Phase 1 Node A
-                    # TOP wants a new link, first SIGnal peer to create endpt
-                    self.req_handler_create_tunnel(cbt)
-
-                elif cbt.request.action == "LNK_REQ_LINK_ENDPT":
-                    # Create Link: Phase 3 Node B
-                    # Rcvd peer req to create endpt, send to TCI
-                    self.req_handler_req_link_endpt(cbt)
-
-                elif cbt.request.action == "LNK_ADD_PEER_CAS":
-                    # Create Link: Phase 7 Node B
-                    # CAS rcvd from peer, sends to TCI to update link's peer CAS info
-                    self.req_handler_add_peer_cas(cbt)
-
-                elif cbt.request.action == "LNK_REMOVE_TUNNEL":
-                    self.req_handler_remove_tnl(cbt)
-
-                elif cbt.request.action == "LNK_QUERY_LINK_INFO":
-                    self.req_handler_query_tunnels_info(cbt)
+            self.dispatch_cbt(cbt)
 
-                elif cbt.request.action == "VIS_DATA_REQ":
-                    self.req_handler_query_viz_data(cbt)
+    def _schedule_link_expiry(self, link_id):
+        # remove the link if it is still incomplete when its creation deadline expires
+        start_time = self._tunnels[link_id]["CreationStartTime"]
+        self.schedule_timer(4 * self._cm_config["TimerInterval"],
+                            lambda: self._expire_incomplete_link(link_id, start_time))
 
-                elif cbt.request.action == "TCI_TINCAN_MSG_NOTIFY":
-                    self.req_handler_tincan_msg(cbt)
-
-                elif cbt.request.action == "LNK_ADD_IGN_INF":
-                    self.req_handler_add_ign_inf(cbt)
-                else:
-                    self.req_handler_default(cbt)
-            elif cbt.op_type == "Response":
-                if cbt.request.action == "SIG_REMOTE_ACTION":
-                    # Create Link: Phase 5 Node A
-                    # Attempt to create our end of link
-                    # Create Link: Phase 9 Node A
-                    # Link created, notify others
-                    self.resp_handler_remote_action(cbt)
-
-                elif cbt.request.action == "TCI_CREATE_LINK":
-                    # Create Link: Phase 4 Node B
-                    # Create Link: Phase 6 Node A
-                    # SIGnal to peer to update CAS
-                    # Create Link: Phase 8 Node B
-                    # Complete setup
-                    self.resp_handler_create_link_endpt(cbt)
-
-                elif cbt.request.action == "TCI_CREATE_TUNNEL":
-                    # Create Link: Phase 2 Node A
-                    # Retrieved our node data for response
-                    self.resp_handler_create_tunnel(cbt)
-
-                elif cbt.request.action == "TCI_QUERY_LINK_STATS":
-                    self.resp_handler_query_link_stats(cbt)
-
-                # elif cbt.request.action == "TCI_REMOVE_LINK":
-                #    self.resp_handler_remove_link(cbt)
-
-                elif cbt.request.action == "TCI_REMOVE_TUNNEL":
-                    self.resp_handler_remove_tunnel(cbt)
+    def _expire_incomplete_link(self, link_id, start_time):
+        with self._lock:
+            tnl = self._tunnels.get(link_id)
+            if (tnl is not None and tnl["CreationStartTime"] == start_time and
+                    tnl["Link"]["CreationState"] != 0xC0):
+                self._rollback_link_creation_changes(link_id)
 
+    def on_config_reload(self, changes):
+        # the servers and ignored interfaces are passed to Tincan for the tunnels created after
+        # the change, the existing ones keep theirs
+        pending = []
+        with self._lock:
+            for change in changes:
+                if (change.path in (("Stun",), ("Turn",))
+                        or (len(change.path) == 3 and change.path[0] == "Overlays"
+                            and change.path[1] in self._tunnel_cfgs
+                            and change.path[2] == "IgnoredNetInterfaces")):
+                    apply_config_change(self._cm_config, change)
                 else:
-                    parent_cbt = cbt.parent
-                    cbt_data = cbt.response.data
-                    cbt_status = cbt.response.status
-                    self.free_cbt(cbt)
-                    if (parent_cbt is not None and parent_cbt.child_count == 1):
-                        parent_cbt.set_response(cbt_data, cbt_status)
-                        self.complete_cbt(parent_cbt)
-
-    def _cleanup_expired_incomplete_links(self):
-        link_expire = 4*self._cm_config["TimerInterval"]
-        link_ids = list(self._tunnels.keys())
-        for link_id in link_ids:
-            tnl = self._tunnels[link_id]
-            if (tnl["Link"]["CreationState"] != 0xC0 and \
-                time.time() - tnl["CreationStartTime"] > link_expire):
-                self._rollback_link_creation_changes(link_id)
+                    pending.append(change)
+            for overlay_id in self._tunnel_cfgs:
+                self._tunnel_cfgs[overlay_id] = tunnel_config(self._cm_config, overlay_id)
+        return pending
 
     def timer_method(self):
         with self._lock:
-            self._cleanup_expired_incomplete_links()
             self._query_link_stats()
-            self.register_cbt("Logger", "LOG_DEBUG", "Timer LNK State:\n" + str(self))
+            self.log_debug("Timer LNK State:\n{}", self)
 
     def terminate(self):
         pass
 
+    @request_handler("VIS_DATA_REQ")
     def req_handler_query_viz_data(self, cbt):
         node_id = str(self._cm_config["NodeId"])
         tnls = dict()
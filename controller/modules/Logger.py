@@ -22,13 +22,18 @@
 import logging
 import logging.handlers as lh
 import os
-from controller.framework.ControllerModule import ControllerModule
+import threading
+from controller.framework.ControllerModule import ControllerModule, request_handler
+from controller.framework.CFxConfig import apply_config_change
+from controller.framework.CFxLog import LOG_LEVELS
 
 
 class Logger(ControllerModule):
     def __init__(self, cfx_handle, module_config, module_name):
         super(Logger, self).__init__(cfx_handle, module_config, module_name)
         self._logger = None
+        self._log_channel = None
+        self._drain_thread = None
 
     def initialize(self):
         # Extracts the controller Log Level from the ipop-config file,
@@ -99,33 +104,69 @@ class Logger(ControllerModule):
             self._logger.addHandler(file_handler)
 
         self._logger.info("Logger: Module loaded")
+        # drain the records written to the log channel by the other modules, and let them
+        # discard records below the effective level before formatting them
+        self._log_channel = self._cfx_handle._log_channel
+        self._log_channel.level = self._logger.getEffectiveLevel()
+        self._drain_thread = threading.Thread(target=self.__drain_log_channel,
+                                              name="Logger::__drain", daemon=True)
+        self._drain_thread.start()
 
-    def process_cbt(self, cbt):
-        if cbt.op_type == "Request":
-            # Extracting the logging level information from the CBT action tag
-            if cbt.request.action == "LOG_DEBUG" or cbt.request.action == "debug":
-                self._logger.debug("%s: %s", cbt.request.initiator, cbt.request.params)
-                cbt.set_response(None, True)
-            elif cbt.request.action == "LOG_INFO" or cbt.request.action == "info":
-                self._logger.info("%s: %s", cbt.request.initiator, cbt.request.params)
-                cbt.set_response(None, True)
-            elif cbt.request.action == "LOG_WARNING" or cbt.request.action == "warning":
-                self._logger.warning("%s: %s", cbt.request.initiator, cbt.request.params)
-                cbt.set_response(None, True)
-            elif cbt.request.action == "LOG_ERROR" or cbt.request.action == "error":
-                self._logger.error("%s: %s", cbt.request.initiator, cbt.request.params)
-                cbt.set_response(None, True)
-            elif cbt.request.action == "LOG_QUERY_CONFIG":
-                cbt.set_response(self._cm_config, True)
+    def __drain_log_channel(self):
+        while True:
+            records = self._log_channel.read()
+            if records is None:
+                break
+            for level, initiator, msg, created in records:
+                self._emit(LOG_LEVELS.get(level, logging.WARNING), initiator, msg, created)
+
+    def _emit(self, level, initiator, msg, created=None):
+        """
+        Emit a record with the same format as the Logger CBT handlers. The creation time is kept
+        from when the record was written to the channel instead of when it is drained.
+        """
+        if not self._logger.isEnabledFor(level):
+            return
+        record = self._logger.makeRecord(self._logger.name, level, "(log channel)", 0,
+                                         "%s: %s", (initiator, msg), None)
+        if created is not None:
+            record.created = created
+            record.msecs = (created - int(created)) * 1000
+        self._logger.handle(record)
+
+    @request_handler(*LOG_LEVELS)
+    def req_handler_log(self, cbt):
+        self._emit(LOG_LEVELS[cbt.request.action], cbt.request.initiator, cbt.request.params)
+        cbt.set_response(None, True)
+        self.complete_cbt(cbt)
+
+    @request_handler("LOG_QUERY_CONFIG")
+    def req_handler_query_config(self, cbt):
+        cbt.set_response(self._cm_config, True)
+        self.complete_cbt(cbt)
+
+    def req_handler_default(self, cbt):
+        # not written to the log channel, which this module drains
+        self._logger.warning("%s: Unsupported CBT action %s", self._module_name, str(cbt))
+        cbt.set_response("Unsupported CBT action", False)
+        self.complete_cbt(cbt)
+
+    def on_config_reload(self, changes):
+        pending = []
+        for change in changes:
+            if change.path == ("LogLevel",) and isinstance(getattr(logging, str(change.new),
+                                                                   None), int):
+                self._logger.setLevel(getattr(logging, change.new))
+                self._log_channel.level = self._logger.getEffectiveLevel()
+                apply_config_change(self._cm_config, change)
             else:
-                self._logger.warning("%s: Unsupported CBT action %s", self._module_name, str(cbt))
-                cbt.set_response("Unsupported CBT action", False)
-            self.complete_cbt(cbt)
-        elif cbt.op_type == "Response":
-            self.free_cbt(cbt)
+                pending.append(change)
+        return pending
 
     def timer_method(self):
         pass
 
     def terminate(self):
+        self._log_channel.close()
+        self._drain_thread.join()
         logging.shutdown()
@@ -50,11 +50,10 @@ class NetworkBuilder():
         the provide graph for refresh.
         """
         with self._lock:
-            self._top.top_log("New net graph:{0}\nCurrent adj list:{1}"
-                              .format(net_graph, self._current_adj_list))
+            self._top.log_debug("New net graph:{0}\nCurrent adj list:{1}", net_graph,
+                                self._current_adj_list)
             if self._pending_adj_list:
-                self._top.top_log("Pending adj list:{0}"
-                                  .format(self._pending_adj_list))
+                self._top.log_debug("Pending adj list:{0}", self._pending_adj_list)
             """
             This conditon is expected to be met on the timer invocation when no net_graph is
             supplied but when there is _pending_edges waiting to be applied.
@@ -107,8 +106,8 @@ class NetworkBuilder():
                 self._refresh_in_progress -= 1
             elif connection_event["UpdateType"] == "DISCONNECTED":
                 # the local topology did not request removal of the connection
-                self._top.top_log("CEStateDisconnected event recvd peer_id: {0}, link_id: {1}".
-                                  format(peer_id, link_id))
+                self._top.log_debug("CEStateDisconnected event recvd peer_id: {0}, link_id: {1}",
+                                    peer_id, link_id)
                 self._current_adj_list.conn_edges[peer_id].edge_state = "CEStateDisconnected"
                 self._refresh_in_progress += 1
                 self._top.top_remove_edge(overlay_id, peer_id)
@@ -116,8 +115,8 @@ class NetworkBuilder():
                 # leave the node in the adj list and marked for removal to be retried.
                 self._refresh_in_progress -= 1
             else:
-                self._top.top_log("Logger", "LOG_WARNING",
-                                  "Invalid UpdateType specified for connection update")
+                self._top.top_log("Invalid UpdateType specified for connection update",
+                                  "LOG_WARNING")
 
     def _mark_edges_for_removal(self):
         """ Anything edge the set (Active - Pending) is marked for deletion """
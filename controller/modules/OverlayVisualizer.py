@@ -25,8 +25,7 @@ except ImportError:
     import json
 import threading
 from collections import defaultdict
-import requests
-from controller.framework.ControllerModule import ControllerModule
+from controller.framework.ControllerModule import ControllerModule, response_handler
 
 
 class OverlayVisualizer(ControllerModule):
@@ -53,34 +52,22 @@ class OverlayVisualizer(ControllerModule):
         self._vis_req_publisher = \
             self._cfx_handle.publish_subscription("VIS_DATA_REQ")
 
-        self.register_cbt("Logger", "LOG_INFO", "Module loaded")
-
-    def process_cbt(self, cbt):
-        if cbt.op_type == "Response":
-            if cbt.request.action == "VIS_DATA_REQ":
-                msg = cbt.response.data
-
-                if cbt.response.status and msg:
-                    with self._vis_ds_lock:
-                        for mod_name in msg:
-                            for ovrl_id in msg[mod_name]:
-                                self._vis_ds["VizData"][ovrl_id][mod_name] = msg[mod_name][ovrl_id]
-                else:
-                    warn_msg = "Got no data in CBT response from module" \
-                        " {}".format(cbt.request.recipient)
-                    self.register_cbt("Logger", "LOG_WARNING", warn_msg)
-                self.free_cbt(cbt)
-            else:
-                parent_cbt = cbt.parent
-                cbt_data = cbt.response.data
-                cbt_status = cbt.response.status
-                self.free_cbt(cbt)
-                if (parent_cbt is not None and parent_cbt.child_count == 1):
-                    parent_cbt.set_response(cbt_data, cbt_status)
-                    self.complete_cbt(parent_cbt)
+        self.log("LOG_INFO", "Module loaded")
 
+    @response_handler("VIS_DATA_REQ")
+    def resp_handler_vis_data(self, cbt):
+        msg = cbt.response.data
+
+        if cbt.response.status and msg:
+            with self._vis_ds_lock:
+                for mod_name in msg:
+                    for ovrl_id in msg[mod_name]:
+                        self._vis_ds["VizData"][ovrl_id][mod_name] = msg[mod_name][ovrl_id]
         else:
-            self.req_handler_default(cbt)
+            warn_msg = "Got no data in CBT response from module" \
+                " {}".format(cbt.request.recipient)
+            self.log("LOG_WARNING", warn_msg)
+        self.free_cbt(cbt)
 
     def timer_method(self):
         with self._vis_ds_lock:
@@ -106,10 +93,11 @@ class OverlayVisualizer(ControllerModule):
 
             collector_msg["IpopVersion"] = self._ipop_version
             # data_log = "Submitting VizData {}".format(collector_msg)
-            # self.register_cbt("Logger", "LOG_DEBUG", data_log)
+            # self.log("LOG_DEBUG", data_log)
 
             req_url = "{}/IPOP/nodes/{}".format(self.vis_address, self.node_id)
-
+            # requests is only imported when there is data for the collector
+            import requests
             try:
                 resp = requests.put(req_url,
                                     data=json.dumps(collector_msg),
@@ -122,12 +110,12 @@ class OverlayVisualizer(ControllerModule):
                 err_msg = "Failed to send data to the IPOP Visualizer" \
                     " webservice({0}). Exception: {1}" \
                     .format(self.vis_address, str(err))
-                self.register_cbt("Logger", "LOG_WARNING", err_msg)
+                self.log("LOG_WARNING", err_msg)
         else:
             warn_msg = "Don't have enough data to send. Not forwarding" \
                     " anything to the collector service. Data:" \
                     " {}".format(collector_msg)
-            self.register_cbt("Logger", "LOG_WARNING", warn_msg)
+            self.log("LOG_WARNING", warn_msg)
 
         # Now that all the accumulated data has been dealt with, we request
         # more data
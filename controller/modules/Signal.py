@@ -19,7 +19,6 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
 
-import ssl
 import time
 import threading
 from queue import Queue
@@ -27,21 +26,8 @@ try:
     import simplejson as json
 except ImportError:
     import json
-import sleekxmpp
-from sleekxmpp.xmlstream.stanzabase import ElementBase, JID
-from sleekxmpp.xmlstream import register_stanza_plugin
-from sleekxmpp.xmlstream.handler.callback import Callback
-from sleekxmpp.xmlstream.matcher import StanzaPath
-from sleekxmpp.stanza.message import Message
-from controller.framework.ControllerModule import ControllerModule
-
-
-class IpopSignal(ElementBase):
-    """Representation of SIGNAL's custom message stanza"""
-    name = "ipop"
-    namespace = "signal"
-    plugin_attrib = "ipop"
-    interfaces = set(("type", "payload"))
+from controller.framework.CFxConfig import apply_config_change
+from controller.framework.ControllerModule import ControllerModule, request_handler
 
 
 class JidCache:
@@ -74,193 +60,6 @@ class JidCache:
         return jid
 
 
-class XmppTransport(sleekxmpp.ClientXMPP):
-    def __init__(self, jid, password, sasl_mech):
-        sleekxmpp.ClientXMPP.__init__(self, jid, password, sasl_mech=sasl_mech)
-        self._overlay_id = None
-        # self.overlay_descr = None
-        self._sig = None
-        self._node_id = None
-        self._presence_publisher = None
-        self._jid_cache = None
-        self._outgoing_rem_acts = None
-        self._cbt_to_action_tag = {}  # maps remote action tags to cbt tags
-        self._host = None
-        self._port = None
-
-    @staticmethod
-    def factory(overlay_id, overlay_descr, cm_mod, presence_publisher, jid_cache,
-                outgoing_rem_acts):
-        try:
-            keyring_installed = False
-            import keyring
-            keyring_installed = True
-        except ImportError as err:
-            cm_mod.sig_log("No key-ring found", "LOG_INFO")
-        host = overlay_descr["HostAddress"]
-        port = overlay_descr["Port"]
-        user = overlay_descr.get("Username", None)
-        pswd = overlay_descr.get("Password", None)
-        auth_method = overlay_descr.get("AuthenticationMethod", "Password")
-        if auth_method == "x509" and (user is not None or pswd is not None):
-            er_log = "x509 Authentication is enbabled but credentials " \
-                "exists in IPOP configuration file; x509 will be used."
-            cm_mod.sig_log(er_log, "LOG_WARNING")
-        if auth_method == "x509":
-            transport = XmppTransport(None, None, sasl_mech="EXTERNAL")
-            transport.ssl_version = ssl.PROTOCOL_TLSv1
-            transport.ca_certs = overlay_descr["TrustStore"]
-            transport.certfile = overlay_descr["CertDirectory"] + overlay_descr["CertFile"]
-            transport.keyfile = overlay_descr["CertDirectory"] + overlay_descr["Keyfile"]
-            transport.use_tls = True
-        elif auth_method == "PASSWORD":
-            if user is None:
-                raise RuntimeError("No username is provided in IPOP configuration file.")
-            if pswd is None and keyring_installed is True:
-                pswd = keyring.get_password("ipop", overlay_descr["Username"])
-            if pswd is None:
-                print("{0} XMPP Password: ".format(user))
-                pswd = str(input())
-                if keyring_installed is True:
-                    try:
-                        keyring.set_password("ipop", user, pswd)
-                    except keyring.errors.PasswordSetError as err:
-                        cm_mod.sig_log("Failed to store password in keyring. {0}".format(str(err)),
-                                       "LOG_ERROR")
-            transport = XmppTransport(user, pswd, sasl_mech="PLAIN")
-            transport.use_tls = True
-            del pswd
-        else:
-            raise RuntimeError("Invalid authentication method specified in configuration: {0}"
-                               .format(auth_method))
-        # pylint: disable=protected-access
-        transport._host = host
-        transport._port = port
-        transport._overlay_id = overlay_id
-        transport._sig = cm_mod
-        transport._node_id = cm_mod._cm_config["NodeId"]
-        transport._presence_publisher = presence_publisher
-        transport._jid_cache = jid_cache
-        transport._outgoing_rem_acts = outgoing_rem_acts
-        # event handler for session start and roster update
-        transport.add_event_handler("session_start", transport.start_event_handler)
-        return transport
-
-    def start_event_handler(self, event):
-        """Registers custom event handlers at the start of XMPP session"""
-        self._sig.sig_log("XMPP Signalling started for overlay: {0}".format(self._overlay_id))
-        # pylint: disable=broad-except
-        try:
-            # Notification of peer signon
-            self.add_event_handler("presence_available",
-                                   self.presence_event_handler)
-            # Register IPOP message with the server
-            register_stanza_plugin(Message, IpopSignal)
-            self.registerHandler(
-                Callback("ipop", StanzaPath("message/ipop"), self.message_listener))
-            # Get the friends list for the user
-            self.get_roster()
-            # Send sign-on presence
-            self.send_presence(pstatus="ident#" + self._node_id)
-        except Exception as err:
-            self._sig.sig_log("XmppTransport: Exception:{0} Event:{1}"
-                              .format(err, event), "LOG_ERROR")
-
-    def presence_event_handler(self, presence):
-        """
-        Handle peer presence event messages
-        """
-        try:
-            presence_sender = presence["from"]
-            presence_receiver_jid = JID(presence["to"])
-            presence_receiver = str(presence_receiver_jid.user) + "@" \
-                + str(presence_receiver_jid.domain)
-            status = presence["status"]
-            # self._sig.sig_log("Presence Overlay:{0} Local JID:{1} Msg:{2}".
-            #                   format(self._overlay_id, self.boundjid, presence))
-            if(presence_receiver == self.boundjid.bare and presence_sender != self.boundjid.full):
-                if (status != "" and "#" in status):
-                    pstatus, peer_id = status.split("#")
-                    if pstatus == "ident":
-                        if peer_id == self._sig._cm_config["NodeId"]:
-                            return
-                        # a notification of a peers node id to jid mapping
-                        pts = self._jid_cache.add_entry(node_id=peer_id, jid=presence_sender)
-                        self._presence_publisher.post_update(
-                            dict(PeerId=peer_id, OverlayId=self._overlay_id,
-                                 PresenceTimestamp=pts))
-                        self._sig.sig_log("Resolved {0}@{1}->{2}"
-                                          .format(peer_id[:7], self._overlay_id, presence_sender))
-                    elif pstatus == "uid?":
-                        # a request for our node id
-                        if self._node_id == peer_id:
-                            payload = self.boundjid.full + "#" + self._node_id
-                            self.send_msg(presence_sender, "uid!", payload)
-                    else:
-                        self._sig.sig_log("Unrecognized PSTATUS:{0} on overlay:{1}"
-                                          .format(pstatus, self._overlay_id), "LOG_WARNING")
-        except Exception as err:
-            self._sig.sig_log("XmppTransport:Exception:{0} overlay:{1} presence:{2}"
-                              .format(err, self._overlay_id, presence), "LOG_ERROR")
-
-    def message_listener(self, msg):
-        """
-        Listen for matched messages on the xmpp stream, extract the header
-        and payload, and takes suitable action.
-        """
-        try:
-            sender_jid = msg["from"]
-            # discard the message if it was initiated by this node
-            if sender_jid == self.boundjid.full:
-                return
-            # extract header and content
-            msg_type = msg["ipop"]["type"]
-            msg_payload = msg["ipop"]["payload"]
-            if msg_type == "uid!":
-                match_jid, matched_uid = msg_payload.split("#")
-                # put the learned JID in cache
-                self._jid_cache.add_entry(matched_uid, match_jid)
-                # send the remote actions that are waiting on JID refresh
-                rm_que = self._outgoing_rem_acts.get(matched_uid, Queue())
-                while not rm_que.empty():
-                    entry = rm_que.get()
-                    msg_type, msg_data = entry[0], entry[1]
-                    self.send_msg(match_jid, msg_type, json.dumps(msg_data))
-                    self._sig.sig_log("Sent remote action: {0}".format(msg_payload))
-            elif msg_type in ("invk", "cmpt"):
-                rem_act = json.loads(msg_payload)
-                self._sig.handle_remote_action(self._overlay_id, rem_act, msg_type)
-            else:
-                self._sig.sig_log("Invalid message type received {0}".format(str(msg)),
-                                  "LOG_WARNING")
-        except Exception as err:
-            self._sig.sig_log("XmppTransport:Exception:{0} msg:{1}".format(err, msg),
-                              "LOG_ERROR")
-
-    def send_msg(self, peer_jid, msg_type, payload):
-        """Send a message to Peer JID via XMPP server"""
-        msg = self.Message()
-        msg["to"] = peer_jid
-        msg["from"] = self.boundjid.full
-        msg["type"] = "chat"
-        msg["ipop"]["type"] = msg_type
-        msg["ipop"]["payload"] = payload
-        msg.send()
-
-    def connect_to_server(self,):
-        try:
-            if self.connect(address=(self._host, self._port)):
-                self.process(block=False)
-                self._sig.sig_log("Starting overlay {0} connection to XMPP server {1}:{2}"
-                                  .format(self._overlay_id, self._host, self._port))
-        except Exception as err:
-            self._sig.sig_log("Failed to initialize XMPP transport instanace {}".format(str(err)),
-                              "LOG_ERROR")
-
-    def shutdown(self,):
-        self.disconnect()
-
-
 class Signal(ControllerModule):
     def __init__(self, cfx_handle, module_config, module_name):
         super(Signal, self).__init__(cfx_handle, module_config, module_name)
@@ -272,13 +71,27 @@ class Signal(ControllerModule):
         self._timer_loop_cnt = 1
 
     def _create_transport_instance(self, overlay_id, overlay_descr, jid_cache, outgoing_rem_acts):
+        # sleekxmpp is only imported once an overlay needs an XMPP transport
+        from controller.modules.XmppTransport import XmppTransport
         xport = XmppTransport.factory(overlay_id, overlay_descr, self, self._presence_publisher,
                                       jid_cache, outgoing_rem_acts)
         xport.connect_to_server()
         return xport
 
+    def on_config_reload(self, changes):
+        pending = []
+        for change in changes:
+            if change.path == ("CacheExpiry",) and isinstance(change.new, (int, float)):
+                for circle in self._circles.values():
+                    circle["JidCache"]._expiry = change.new  # pylint: disable=protected-access
+                apply_config_change(self._cm_config, change)
+            else:
+                pending.append(change)
+        return pending
+
     def initialize(self):
-        self._presence_publisher = self._cfx_handle.publish_subscription("SIG_PEER_PRESENCE_NOTIFY")
+        self._presence_publisher = \
+            self._cfx_handle.publish_subscription("SIG_PEER_PRESENCE_NOTIFY", notify=True)
         for overlay_id in self._cm_config["Overlays"]:
             overlay_descr = self._cm_config["Overlays"][overlay_id]
             self._circles[overlay_id] = {}
@@ -290,6 +103,7 @@ class Signal(ControllerModule):
                                                 self._circles[overlay_id]["OutgoingRemoteActs"])
         self.sig_log("Module loaded", "LOG_INFO")
 
+    @request_handler("SIG_QUERY_REPORTING_DATA")
     def req_handler_query_reporting_data(self, cbt):
         rpt = {}
         for overlay_id in self._cm_config["Overlays"]:
@@ -335,11 +149,12 @@ class Signal(ControllerModule):
             return
         tag = rem_act["ActionTag"]
         cbt_status = rem_act["Status"]
-        pending_cbt = self._cfx_handle._pending_cbts.get(tag, None)
+        pending_cbt = self.claim_pending_cbt(tag)
         if pending_cbt:
             pending_cbt.set_response(data=rem_act, status=cbt_status)
-            self.complete_cbt(pending_cbt)
+            self.complete_cbt(pending_cbt, claimed=True)
 
+    @request_handler("SIG_REMOTE_ACTION")
     def req_handler_initiate_remote_action(self, cbt):
         """
         Create a new remote action from the received CBT and transmit it to the recepient
@@ -393,29 +208,15 @@ class Signal(ControllerModule):
         else:
             payload = json.dumps(rem_act)
             transport.send_msg(str(target_jid), act_type, payload)
-            self.sig_log("Sent remote act to peer ID: {0}\n Payload: {1}"
-                         .format(peer_id, payload))
+            self.log_debug("Sent remote act to peer ID: {0}\n Payload: {1}", peer_id, payload)
 
     def process_cbt(self, cbt):
         with self._lock:
-            if cbt.op_type == "Request":
-                if cbt.request.action == "SIG_REMOTE_ACTION":
-                    self.req_handler_initiate_remote_action(cbt)
-                elif cbt.request.action == "SIG_QUERY_REPORTING_DATA":
-                    self.req_handler_query_reporting_data(cbt)
-                else:
-                    self.req_handler_default(cbt)
-            elif cbt.op_type == "Response":
-                if cbt.tag in self._remote_acts:
-                    self.resp_handler_remote_action(cbt)
-                else:
-                    parent_cbt = cbt.parent
-                    cbt_data = cbt.response.data
-                    cbt_status = cbt.response.status
-                    self.free_cbt(cbt)
-                    if (parent_cbt is not None and parent_cbt.child_count == 1):
-                        parent_cbt.set_response(cbt_data, cbt_status)
-                        self.complete_cbt(parent_cbt)
+            # responses to remote actions are matched by tag, the rest by action
+            if cbt.op_type == "Response" and cbt.tag in self._remote_acts:
+                self.resp_handler_remote_action(cbt)
+            else:
+                self.dispatch_cbt(cbt)
 
     def timer_method(self):
         with self._lock:
@@ -426,25 +227,13 @@ class Signal(ControllerModule):
                     self._circles[overlay_id]["JidCache"].scavenge()
                     self.scavenge_jid_resolution_queue(self._circles[overlay_id]
                                                        ["OutgoingRemoteActs"])
-            self.scavenge_pending_cbts()
 
     def terminate(self):
         for overlay_id in self._circles:
             self._circles[overlay_id]["Transport"].shutdown()
 
     def sig_log(self, msg, level="LOG_DEBUG"):
-        self.register_cbt("Logger", level, msg)
-
-    def scavenge_pending_cbts(self):
-        scavenge_list = []
-        for item in self._cfx_handle._pending_cbts.items():
-            if time.time() - item[1].time_submit >= self.request_timeout:
-                scavenge_list.append(item[0])
-        for tag in scavenge_list:
-            pending_cbt = self._cfx_handle._pending_cbts.pop(tag, None)
-            if pending_cbt:
-                pending_cbt.set_response("The request has expired", False)
-                self.complete_cbt(pending_cbt)
+        self.log(level, msg)
 
     def scavenge_jid_resolution_queue(self, outgoing_rem_acts):
         # clear out the JID Refresh queue for a peer if the oldest entry age exceeds the limit
@@ -452,17 +241,17 @@ class Signal(ControllerModule):
         for peer_id in outgoing_rem_acts:
             peer_qlen = outgoing_rem_acts[peer_id].qsize()
             remact_descr = outgoing_rem_acts[peer_id].queue[0] # peek at the first/oldest entry
-            if time.time() - remact_descr[2] < self.request_timeout:
+            if time.time() - remact_descr[2] >= self.request_timeout:
                 peer_ids.append(peer_id)
-                self.sig_log("Remote acts scavenged for removal peer id {0} qlength {1}"
-                             .format(peer_id, peer_qlen))
+                self.log_debug("Remote acts scavenged for removal peer id {0} qlength {1}",
+                               peer_id, peer_qlen)
         for peer_id in peer_ids:
             rem_act_que = outgoing_rem_acts.pop(peer_id, Queue())
             while not rem_act_que.empty():
                 entry = rem_act_que.get()
                 if entry[0] == "invk":
                     tag = entry[1]["ActionTag"]
-                    pending_cbt = self._cfx_handle._pending_cbts.get(tag, None)
+                    pending_cbt = self.claim_pending_cbt(tag)
                     if pending_cbt:
                         pending_cbt.set_response("The specified recipient was not found", False)
-                        self.complete_cbt(pending_cbt)
+                        self.complete_cbt(pending_cbt, claimed=True)
@@ -19,51 +19,130 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
 
+import asyncio
 import socket
 import select
+import time
+import uuid
 try:
     import simplejson as json
 except ImportError:
     import json
 from threading import Thread
 import traceback
-from controller.framework.ControllerModule import ControllerModule
+from controller.framework.ControllerModule import (ControllerModule, request_handler,
+                                                   response_handler)
 import controller.framework.ipoplib as ipoplib
 
 
+def control_addresses(cfg):
+    """
+    The address family, the controller's listening address and Tincan's control address, with
+    a preference for an IPv6 control link
+    """
+    if socket.has_ipv6:
+        return (socket.AF_INET6, (cfg["RcvServiceAddress6"], cfg["CtrlRecvPort"]),
+                (cfg["SndServiceAddress6"], cfg["CtrlSendPort"]))
+    return (socket.AF_INET, (cfg["RcvServiceAddress"], cfg["CtrlRecvPort"]),
+            (cfg["SndServiceAddress"], cfg["CtrlSendPort"]))
+
+
+def create_ctrl_link_request(cfg, tag):
+    """The request that makes Tincan send its responses to the controller's listening address"""
+    ctl = ipoplib.CTL_CREATE_CTRL_LINK
+    ctl["IPOP"]["TransactionId"] = tag
+    if cfg["CtrlRecvPort"] is not None:
+        ctl["IPOP"]["Request"]["Port"] = cfg["CtrlRecvPort"]
+    if socket.has_ipv6 is False:
+        ctl["IPOP"]["Request"]["AddressFamily"] = "af_inet"
+        ctl["IPOP"]["Request"]["IP"] = cfg["RcvServiceAddress"]
+    else:
+        ctl["IPOP"]["Request"]["AddressFamily"] = "af_inetv6"
+        ctl["IPOP"]["Request"]["IP"] = cfg["RcvServiceAddress6"]
+    return ctl
+
+
+def wait_for_tincan(cfg):
+    """
+    Block until Tincan answers on its control port and return the seconds waited. The probe is
+    the CreateCtrlRespLink request TincanInterface sends when it is initialized, sent from the
+    controller's listening address, so it works wherever Tincan runs and leaves it pointing at
+    the controller. It is resent with a timeout that doubles up to ReadyProbeMaxTimeout.
+    """
+    family, rcv_addr, dest = control_addresses(cfg)
+    tag = uuid.uuid4().int & 0xFFFFFFFF
+    req = json.dumps(create_ctrl_link_request(cfg, tag)).encode("utf-8")
+    timeout = cfg["ReadyProbeTimeout"]
+    start = time.monotonic()
+    with socket.socket(family, socket.SOCK_DGRAM) as sock:
+        sock.bind(rcv_addr)
+        while True:
+            try:
+                sock.sendto(req, dest)
+            except OSError as err:
+                print("Tincan readiness probe failed: {0}".format(err))
+            deadline = time.monotonic() + timeout
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not select.select([sock], [], [], remaining)[0]:
+                    break
+                try:
+                    ctl = json.loads(sock.recv(cfg["MaxReadSize"]).decode("utf-8"))
+                    if (ctl["IPOP"]["ControlType"] == "TincanResponse" and
+                            ctl["IPOP"]["TransactionId"] == tag):
+                        return time.monotonic() - start
+                except (OSError, ValueError, KeyError, TypeError):
+                    pass
+            print("Waiting on IPOP Tincan to start...")
+            timeout = min(2 * timeout, cfg["ReadyProbeMaxTimeout"])
+
+
+class TincanProtocol(asyncio.DatagramProtocol):
+    """Reads the Tincan control link when the controller runs on an asyncio event loop"""
+    def __init__(self, tci):
+        self._tci = tci
+
+    def connection_made(self, transport):
+        self._tci._transport = transport
+
+    def datagram_received(self, data, addr):
+        try:
+            self._tci.process_tincan_msg(data)
+        except Exception as err:
+            self._tci.log("LOG_WARNING", "Tincan Listener exception:{0}\n"
+                          "{1}".format(err, traceback.format_exc()))
+
+
 class TincanInterface(ControllerModule):
     def __init__(self, cfx_handle, module_config, module_name):
         super(TincanInterface, self).__init__(cfx_handle, module_config, module_name)
         self._tincan_listener_thread = None    # UDP listener thread object
+        self._transport = None                 # UDP listener transport on the event loop
+        self._listener_task = None
         self._tci_publisher = None
-        # Preference for IPv6 control link
-        if socket.has_ipv6:
-            self._sock = socket.socket(socket.AF_INET6, socket.SOCK_DGRAM)
-            self._sock_svr = socket.socket(socket.AF_INET6, socket.SOCK_DGRAM)
-            # Controller UDP listening socket
-            self._sock_svr.bind((self._cm_config["RcvServiceAddress6"],
-                                 self._cm_config["CtrlRecvPort"]))
-            # Controller UDP sending socket
-            self._dest = (self._cm_config["SndServiceAddress6"], self._cm_config["CtrlSendPort"])
-        else:
-            self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            self._sock_svr = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            # Controller UDP listening socket
-            self._sock_svr.bind((self._cm_config["RcvServiceAddress"],
-                                 self._cm_config["CtrlRecvPort"]))
-            # Controller UDP sending socket
-            self._dest = (self._cm_config["SndServiceAddress"], self._cm_config["CtrlSendPort"])
+        family, rcv_addr, self._dest = control_addresses(self._cm_config)
+        # Controller UDP sending socket
+        self._sock = socket.socket(family, socket.SOCK_DGRAM)
+        # Controller UDP listening socket
+        self._sock_svr = socket.socket(family, socket.SOCK_DGRAM)
+        self._sock_svr.bind(rcv_addr)
         self._sock.bind(("", 0))
         self._sock_list = [self._sock_svr]
 
     def initialize(self):
-        self._tincan_listener_thread = Thread(target=self.__tincan_listener)
-        self._tincan_listener_thread.setDaemon(True)
-        self._tincan_listener_thread.start()
+        loop = self._cfx_handle.get_event_loop()
+        if loop is None:
+            self._tincan_listener_thread = Thread(target=self.__tincan_listener)
+            self._tincan_listener_thread.setDaemon(True)
+            self._tincan_listener_thread.start()
+        else:
+            self._listener_task = loop.create_task(
+                loop.create_datagram_endpoint(lambda: TincanProtocol(self), sock=self._sock_svr))
         self.create_control_link()
-        self._tci_publisher = self._cfx_handle.publish_subscription("TCI_TINCAN_MSG_NOTIFY")
+        self._tci_publisher = \
+            self._cfx_handle.publish_subscription("TCI_TINCAN_MSG_NOTIFY", notify=True)
         self.register_cbt("Logger", "LOG_QUERY_CONFIG")
-        self.register_cbt("Logger", "LOG_INFO", "Module loaded")
+        self.log("LOG_INFO", "Module loaded")
 
     def __tincan_listener(self):
         try:
@@ -74,43 +153,46 @@ class TincanInterface(ControllerModule):
                 for sock in socks:
                     if sock == self._sock_svr:
                         data = sock.recvfrom(self._cm_config["MaxReadSize"])
-                        ctl = json.loads(data[0].decode("utf-8"))
-                        if ctl["IPOP"]["ProtocolVersion"] != 5:
-                            raise ValueError("Invalid control version detected")
-                        # Get the original CBT if this is the response
-                        if ctl["IPOP"]["ControlType"] == "TincanResponse":
-                            cbt = self._cfx_handle._pending_cbts[ctl["IPOP"]["TransactionId"]]
-                            cbt.set_response(ctl["IPOP"]["Response"]["Message"],
-                                             ctl["IPOP"]["Response"]["Success"])
-                            self.complete_cbt(cbt)
-                        else:
-                            self._tci_publisher.post_update(ctl["IPOP"]["Request"])
+                        self.process_tincan_msg(data[0])
         except Exception as err:
-            log_cbt = self.register_cbt(
-                "Logger", "LOG_WARNING", "Tincan Listener exception:{0}\n"
-                "{1}".format(err, traceback.format_exc()))
-            self.submit_cbt(log_cbt)
+            self.log("LOG_WARNING", "Tincan Listener exception:{0}\n"
+                     "{1}".format(err, traceback.format_exc()))
+
+    def process_tincan_msg(self, data):
+        ctl = json.loads(data.decode("utf-8"))
+        if ctl["IPOP"]["ProtocolVersion"] != 5:
+            raise ValueError("Invalid control version detected")
+        # Get the original CBT if this is the response
+        if ctl["IPOP"]["ControlType"] == "TincanResponse":
+            cbt = self.claim_pending_cbt(ctl["IPOP"]["TransactionId"])
+            if cbt is None:
+                self.log_debug("A response to an expired Tincan request was discarded: {0}",
+                               ctl)
+                return
+            cbt.set_response(ctl["IPOP"]["Response"]["Message"],
+                             ctl["IPOP"]["Response"]["Success"])
+            self.complete_cbt(cbt, claimed=True)
+        else:
+            self._tci_publisher.post_update(ctl["IPOP"]["Request"])
 
     def create_control_link(self,):
-        self.register_cbt("Logger", "LOG_INFO", "Creating Tincan control link")
+        self.log("LOG_INFO", "Creating Tincan control link")
         cbt = self.create_cbt(self._module_name, self._module_name, "TCI_CREATE_CTRL_LINK")
-        ctl = ipoplib.CTL_CREATE_CTRL_LINK
-        ctl["IPOP"]["TransactionId"] = cbt.tag
-        if self._cm_config["CtrlRecvPort"] is not None:
-            ctl["IPOP"]["Request"]["Port"] = self._cm_config["CtrlRecvPort"]
-        if socket.has_ipv6 is False:
-            ctl["IPOP"]["Request"]["AddressFamily"] = "af_inet"
-            ctl["IPOP"]["Request"]["IP"] = self._cm_config["RcvServiceAddress"]
-        else:
-            ctl["IPOP"]["Request"]["AddressFamily"] = "af_inetv6"
-            ctl["IPOP"]["Request"]["IP"] = self._cm_config["RcvServiceAddress6"]
-        self._cfx_handle._pending_cbts[cbt.tag] = cbt
+        ctl = create_ctrl_link_request(self._cm_config, cbt.tag)
+        self._cfx_handle._add_pending(cbt)
         self.send_control(json.dumps(ctl))
 
+    @response_handler("TCI_CREATE_CTRL_LINK")
     def resp_handler_create_control_link(self, cbt):
         if cbt.response.status == "False":
             msg = "Failed to create Tincan response link: CBT={0}".format(cbt)
             raise RuntimeError(msg)
+        self.free_cbt(cbt)
+
+    @response_handler("LOG_QUERY_CONFIG")
+    def resp_handler_query_log_config(self, cbt):
+        self.configure_tincan_logging(cbt.response.data, not cbt.response.status)
+        self.free_cbt(cbt)
 
     def configure_tincan_logging(self, log_cfg, use_defaults=False):
         cbt = self.create_cbt(self._module_name, self._module_name, "TCI_CONFIGURE_LOGGING")
@@ -124,14 +206,17 @@ class TincanInterface(ControllerModule):
             ctl["IPOP"]["Request"]["MaxArchives"] = log_cfg["MaxArchives"]
             ctl["IPOP"]["Request"]["MaxFileSize"] = log_cfg["MaxFileSize"]
             ctl["IPOP"]["Request"]["ConsoleLevel"] = log_cfg["ConsoleLevel"]
-        self._cfx_handle._pending_cbts[cbt.tag] = cbt
+        self._cfx_handle._add_pending(cbt)
         self.send_control(json.dumps(ctl))
 
+    @response_handler("TCI_CONFIGURE_LOGGING")
     def resp_handler_configure_tincan_logging(self, cbt):
         if cbt.response.status == "False":
             msg = "Failed to configure Tincan logging: CBT={0}".format(cbt)
-            self.register_cbt("Logger", "LOG_WARNING", msg)
+            self.log("LOG_WARNING", msg)
+        self.free_cbt(cbt)
 
+    @request_handler("TCI_CREATE_LINK")
     def req_handler_create_link(self, cbt):
         msg = cbt.request.params
         ctl = ipoplib.CTL_CREATE_LINK
@@ -153,6 +238,7 @@ class TincanInterface(ControllerModule):
         req["IgnoredNetInterfaces"] = msg.get("IgnoredNetInterfaces")
         self.send_control(json.dumps(ctl))
 
+    @request_handler("TCI_CREATE_TUNNEL")
     def req_handler_create_tunnel(self, cbt):
         msg = cbt.request.params
         ctl = ipoplib.CTL_CREATE_TUNNEL
@@ -168,6 +254,7 @@ class TincanInterface(ControllerModule):
         req["IgnoredNetInterfaces"] = msg.get("IgnoredNetInterfaces")
         self.send_control(json.dumps(ctl))
 
+    @request_handler("TCI_INJECT_FRAME")
     def req_handler_inject_frame(self, cbt):
         msg = cbt.request.params
         ctl = ipoplib.INSERT_TAP_PACKET
@@ -177,6 +264,7 @@ class TincanInterface(ControllerModule):
         req["Data"] = msg["Data"]
         self.send_control(json.dumps(ctl))
 
+    @request_handler("TCI_QUERY_CAS")
     def req_handler_query_candidate_address_set(self, cbt):
         msg = cbt.request.params
         ctl = ipoplib.CTL_QUERY_CAS
@@ -186,6 +274,7 @@ class TincanInterface(ControllerModule):
         req["LinkId"] = msg["LinkId"]
         self.send_control(json.dumps(ctl))
 
+    @request_handler("TCI_QUERY_LINK_STATS")
     def req_handler_query_link_stats(self, cbt):
         msg = cbt.request.params
         ctl = ipoplib.CTL_QUERY_LINK_STATS
@@ -194,6 +283,7 @@ class TincanInterface(ControllerModule):
         req["TunnelIds"] = msg
         self.send_control(json.dumps(ctl))
 
+    @request_handler("TCI_QUERY_TUNNEL_INFO")
     def req_handler_query_tunnel_info(self, cbt):
         msg = cbt.request.params
         ctl = ipoplib.CTL_QUERY_TUNNEL_INFO
@@ -202,6 +292,7 @@ class TincanInterface(ControllerModule):
         req["OverlayId"] = msg["OverlayId"]
         self.send_control(json.dumps(ctl))
 
+    @request_handler("TCI_REMOVE_TUNNEL")
     def req_handler_remove_tunnel(self, cbt):
         msg = cbt.request.params
         ctl = ipoplib.CTL_REMOVE_TUNNEL
@@ -211,6 +302,7 @@ class TincanInterface(ControllerModule):
         req["TunnelId"] = msg["TunnelId"]
         self.send_control(json.dumps(ctl))
 
+    @request_handler("TCI_REMOVE_LINK")
     def req_handler_remove_link(self, cbt):
         msg = cbt.request.params
         ctl = ipoplib.CTL_REMOVE_LINK
@@ -221,6 +313,7 @@ class TincanInterface(ControllerModule):
         req["LinkId"] = msg["LinkId"]
         self.send_control(json.dumps(ctl))
 
+    @request_handler("TCI_ICC")
     def req_handler_send_icc(self, cbt):
         msg = cbt.request.params
         ctl = ipoplib.CTL_SEND_ICC
@@ -231,49 +324,8 @@ class TincanInterface(ControllerModule):
         req["Data"] = msg["Data"]
         self.send_control(json.dumps(ctl))
 
-    def process_cbt(self, cbt):
-        if cbt.op_type == "Request":
-            if cbt.request.action == "TCI_CREATE_LINK":
-                self.req_handler_create_link(cbt)
-
-            elif cbt.request.action == "TCI_REMOVE_LINK":
-                self.req_handler_remove_link(cbt)
-
-            elif cbt.request.action == "TCI_CREATE_TUNNEL":
-                self.req_handler_create_tunnel(cbt)
-
-            elif cbt.request.action == "TCI_ICC":
-                self.req_handler_send_icc(cbt)
-
-            elif cbt.request.action == "TCI_INJECT_FRAME":
-                self.req_handler_inject_frame(cbt)
-
-            elif cbt.request.action == "TCI_QUERY_CAS":
-                self.req_handler_query_candidate_address_set(cbt)
-
-            elif cbt.request.action == "TCI_QUERY_LINK_STATS":
-                self.req_handler_query_link_stats(cbt)
-
-            elif cbt.request.action == "TCI_QUERY_TUNNEL_INFO":
-                self.req_handler_query_tunnel_info(cbt)
-
-            elif cbt.request.action == "TCI_REMOVE_TUNNEL":
-                self.req_handler_remove_tunnel(cbt)
-
-            else:
-                self.req_handler_default(cbt)
-        elif cbt.op_type == "Response":
-            if cbt.request.action == "LOG_QUERY_CONFIG":
-                self.configure_tincan_logging(cbt.response.data,
-                                              not cbt.response.status)
-
-            elif cbt.request.action == "TCI_CREATE_CTRL_LINK":
-                self.resp_handler_create_control_link(cbt)
-
-            elif cbt.request.action == "TCI_CONFIGURE_LOGGING":
-                self.resp_handler_configure_tincan_logging(cbt)
-
-            self.free_cbt(cbt)
+    def resp_handler_default(self, cbt):
+        self.free_cbt(cbt)
 
     def send_control(self, msg):
         return self._sock.sendto(bytes(msg.encode("utf-8")), self._dest)
@@ -282,4 +334,5 @@ class TincanInterface(ControllerModule):
         pass
 
     def terminate(self):
-        pass
+        if self._transport is not None:
+            self._transport.close()
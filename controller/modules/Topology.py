@@ -20,12 +20,27 @@
 # THE SOFTWARE.
 import random
 import threading
-import time
+from collections import namedtuple
 from controller.framework.CFx import CFX
-from controller.framework.ControllerModule import ControllerModule
+from controller.framework.CFxConfig import apply_config_change
+from controller.framework.ControllerModule import (ControllerModule, request_handler,
+                                                   response_handler, notification_handler)
 from controller.modules.NetworkBuilder import NetworkBuilder
 from  controller.modules.GraphBuilder import GraphBuilder
 
+# the graph parameters of an overlay, taken from the validated config when it is loaded
+GraphConfig = namedtuple("GraphConfig", ["enforced_edges", "manual_topology", "max_successors",
+                                         "max_long_dist_edges"])
+
+
+def graph_config(cm_config, overlay_id):
+    ol_cfg = cm_config["Overlays"].get(overlay_id, {})
+    return GraphConfig(enforced_edges=frozenset(ol_cfg.get("EnforcedLinks", {})),
+                       manual_topology=ol_cfg.get("ManualTopology", False),
+                       max_successors=cm_config["MaxSuccessors"],
+                       max_long_dist_edges=cm_config["MaxLongDistEdges"])
+
+
 class Topology(ControllerModule, CFX):
     def __init__(self, cfx_handle, module_config, module_name):
         super(Topology, self).__init__(cfx_handle, module_config, module_name)
@@ -39,37 +54,55 @@ class Topology(ControllerModule, CFX):
         nid = self._cm_config["NodeId"]
         for olid in self._cfx_handle.query_param("Overlays"):
             self._overlays[olid] = dict(NetBuilder=NetworkBuilder(self, olid, nid), KnownPeers=[],
-                                        NewPeerCount=0, Banlist=dict())
+                                        NewPeerCount=0, Banlist=dict(),
+                                        GraphConfig=graph_config(self._cm_config, olid))
         try:
             # Subscribe for data request notifications from OverlayVisualizer
             self._cfx_handle.start_subscription("OverlayVisualizer",
                                                 "VIS_DATA_REQ")
         except NameError as err:
             if "OverlayVisualizer" in str(err):
-                self.register_cbt("Logger", "LOG_WARNING",
-                                  "OverlayVisualizer module not loaded."
-                                  " Visualization data will not be sent.")
-        self.register_cbt("Logger", "LOG_INFO", "Module loaded")
+                self.log("LOG_WARNING",
+                         "OverlayVisualizer module not loaded."
+                         " Visualization data will not be sent.")
+        self.log("LOG_INFO", "Module loaded")
 
     def terminate(self):
         pass
 
+    @response_handler("LNK_CREATE_TUNNEL")
     def resp_handler_create_tnl(self, cbt):
         params = cbt.request.params
         olid = params["OverlayId"]
         peer_id = params["PeerId"]
         if not cbt.response.status:
-            self.register_cbt("Logger", "LOG_WARNING", "Failed to create topology edge to {0}. {1}"
-                              .format(cbt.request.params["PeerId"], cbt.response.data))
+            self.log("LOG_WARNING", "Failed to create topology edge to {0}. {1}"
+                     .format(cbt.request.params["PeerId"], cbt.response.data))
             interval = self._cm_config["TimerInterval"]
-            self._overlays[olid]["Banlist"][peer_id] = \
-                {"RemovalTime": (random.randint(0, 5) * interval) + time.time()}
+            with self._lock:
+                self._ban_peer(olid, peer_id, random.randint(0, 5) * interval)
         self.free_cbt(cbt)
 
+    def _ban_peer(self, olid, peer_id, duration):
+        # Add the peer to the duration based banlist. Higher successive connection failures
+        # results in potentially longer duration in the banlist. The peer is removed when its
+        # timer expires.
+        banlist = self._overlays[olid]["Banlist"]
+        if peer_id in banlist:
+            banlist[peer_id].cancel()
+        banlist[peer_id] = self.schedule_timer(duration,
+                                               lambda: self._unban_peer(olid, peer_id))
+
+    def _unban_peer(self, olid, peer_id):
+        with self._lock:
+            self._overlays[olid]["Banlist"].pop(peer_id, None)
+        self.log("LOG_INFO", "Node {0} removed from banlist".format(peer_id[:7]))
+
+    @response_handler("LNK_REMOVE_TUNNEL")
     def resp_handler_remove_tnl(self, cbt):
         if not cbt.response.status:
-            self.register_cbt("Logger", "LOG_WARNING",
-                              "Failed to remove topology edge {0}".format(cbt.response.data))
+            self.log("LOG_WARNING",
+                     "Failed to remove topology edge {0}".format(cbt.response.data))
             params = cbt.request.params
             params["UpdateType"] = "RemoveEdgeFailed"
             params["LinkId"] = None
@@ -77,6 +110,7 @@ class Topology(ControllerModule, CFX):
             self._overlays[olid]["NetBuilder"].on_connection_update(params)
         self.free_cbt(cbt)
 
+    @notification_handler("SIG_PEER_PRESENCE_NOTIFY")
     def req_handler_peer_presence(self, cbt):
         """
         Handles peer presence notification. Determines when to build a new graph and refresh
@@ -92,29 +126,19 @@ class Topology(ControllerModule, CFX):
                 nb = self._overlays[olid]["NetBuilder"]
                 if (nb.is_ready() and self._overlays[olid]["NewPeerCount"]
                         >= self._cm_config["PeerDiscoveryCoalesce"]):
-                    self.register_cbt("Logger", "LOG_DEBUG", "Coalesced {0} new peer discovery, "
-                                      "initiating network refresh"
-                                      .format(self._overlays[olid]["NewPeerCount"]))
-                    enf_lnks = self._cm_config["Overlays"][olid].get("EnforcedLinks", {})
+                    self.log_debug("Coalesced {0} new peer discovery, initiating network refresh",
+                                   self._overlays[olid]["NewPeerCount"])
                     peer_list = [item for item in self._overlays[olid]["KnownPeers"] \
                         if item not in self._overlays[olid]["Banlist"]]
-                    manual_topo = self._cm_config["Overlays"][olid].get("ManualTopology", False)
-                    params = {"OverlayId": olid, "NodeId": self._cm_config["NodeId"],
-                              "Peers": peer_list,
-                              "EnforcedEdges": enf_lnks,
-                              "MaxSuccessors": self._cm_config.get("MaxSuccessors", 1),
-                              "MaxLongDistEdges": self._cm_config.get("MaxLongDistEdges", 4),
-                              "ManualTopology": manual_topo}
-                    gb = GraphBuilder(params)
+                    gb = GraphBuilder(self._graph_params(olid, peer_list))
                     adjl = gb.build_adj_list(nb.get_adj_list())
                     nb.refresh(adjl)
                     self._overlays[olid]["NewPeerCount"] = 0
                 else:
-                    self.register_cbt("Logger", "LOG_DEBUG", "{0} new peers discovered, delaying "
-                                      "refresh".format(self._overlays[olid]["NewPeerCount"]))
-        cbt.set_response(None, True)
-        self.complete_cbt(cbt)
+                    self.log_debug("{0} new peers discovered, delaying refresh",
+                                   self._overlays[olid]["NewPeerCount"])
 
+    @request_handler("TOP_QUERY_PEER_IDS")
     def req_handler_query_peer_ids(self, cbt):
         peer_ids = {}
         try:
@@ -126,9 +150,10 @@ class Topology(ControllerModule, CFX):
         except KeyError:
             cbt.set_response(data=None, status=False)
             self.complete_cbt(cbt)
-            self.register_cbt("Logger", "LOG_WARNING", "Overlay Id is not valid {0}".
-                              format(cbt.response.data))
+            self.log("LOG_WARNING", "Overlay Id is not valid {0}".
+                     format(cbt.response.data))
 
+    @request_handler("VIS_DATA_REQ")
     def req_handler_vis_data(self, cbt):
         topo_data = {}
         try:
@@ -152,91 +177,67 @@ class Topology(ControllerModule, CFX):
         except KeyError:
             cbt.set_response(data=None, status=False)
             self.complete_cbt(cbt)
-            self.register_cbt("Logger", "LOG_WARNING", "Topology data not available {0}".
-                              format(cbt.response.data))
+            self.log("LOG_WARNING", "Topology data not available {0}".
+                     format(cbt.response.data))
 
+    @notification_handler("LNK_TUNNEL_EVENTS")
     def req_handler_link_data_update(self, cbt):
         params = cbt.request.params
         olid = params["OverlayId"]
         peer_id = params["PeerId"]
         with self._lock:
             if params["UpdateType"] == "REMOVED":
-                self.top_log("Removing peer id from peer list {0}".format(peer_id))
+                self.log_debug("Removing peer id from peer list {0}", peer_id)
                 i = self._overlays[olid]["KnownPeers"].index(peer_id)
                 self._overlays[olid]["KnownPeers"].pop(i)
             self._overlays[olid]["NetBuilder"].on_connection_update(params)
-        cbt.set_response(None, True)
-        self.complete_cbt(cbt)
 
+    @request_handler("TOP_INCOMING_TUNNEL_REQ")
     def request_handler_tunnel_req(self, cbt):
         cbt.set_response("Accept", True)
         self.complete_cbt(cbt)
 
-    def process_cbt(self, cbt):
-        if cbt.op_type == "Request":
-            if cbt.request.action == "SIG_PEER_PRESENCE_NOTIFY":
-                self.req_handler_peer_presence(cbt)
-            elif cbt.request.action == "VIS_DATA_REQ":
-                self.req_handler_vis_data(cbt)
-            elif cbt.request.action == "TOP_QUERY_PEER_IDS":
-                self.req_handler_query_peer_ids(cbt)
-            elif cbt.request.action == "LNK_TUNNEL_EVENTS":
-                self.req_handler_link_data_update(cbt)
-            elif cbt.request.action == "TOP_INCOMING_TUNNEL_REQ":
-                self.request_handler_tunnel_req(cbt)
-            else:
-                self.req_handler_default(cbt)
-        elif cbt.op_type == "Response":
-            if cbt.request.action == "LNK_CREATE_TUNNEL":
-                self.resp_handler_create_tnl(cbt)
-            elif cbt.request.action == "LNK_REMOVE_TUNNEL":
-                self.resp_handler_remove_tnl(cbt)
-            else:
-                parent_cbt = cbt.parent
-                cbt_data = cbt.response.data
-                cbt_status = cbt.response.status
-                self.free_cbt(cbt)
-                if (parent_cbt is not None and parent_cbt.child_count == 1):
-                    parent_cbt.set_response(cbt_data, cbt_status)
-                    self.complete_cbt(parent_cbt)
-
-    def _cleanup_blacklist(self):
-        # Remove peers from the duration based banlist. Higher successive connection failures
-        # results in potentially longer duration in the banlist.
-        tmp = []
-        for olid in self._overlays:
-            for peer_id in self._overlays[olid]["Banlist"]:
-                rt = self._overlays[olid]["Banlist"][peer_id]["RemovalTime"]
-                if rt >= time.time():
-                    tmp.append(peer_id)
-            for peer_id in tmp:
-                self._overlays[olid]["Banlist"].pop(peer_id, None)
-                self.register_cbt("Logger", "LOG_INFO",
-                                  "Node {0} removed from banlist".format(peer_id[:7]))
+    def _graph_params(self, olid, peers):
+        graph_cfg = self._overlays[olid]["GraphConfig"]
+        return {"OverlayId": olid, "NodeId": self._cm_config["NodeId"], "Peers": peers,
+                "EnforcedEdges": graph_cfg.enforced_edges,
+                "MaxSuccessors": graph_cfg.max_successors,
+                "MaxLongDistEdges": graph_cfg.max_long_dist_edges,
+                "ManualTopology": graph_cfg.manual_topology}
 
     def manage_topology(self):
         # Periodically refresh the topology, making sure desired links exist and exipred ones are
         # removed.
         with self._lock:
-            self._cleanup_blacklist()
             for olid in self._overlays:
                 nb = self._overlays[olid]["NetBuilder"]
                 if nb.is_ready():
-                    self.register_cbt("Logger", "LOG_DEBUG", "Refreshing topology...")
-                    enf_lnks = self._cm_config["Overlays"][olid].get("EnforcedLinks", {})
-                    manual_topo = self._cm_config["Overlays"][olid].get("ManualTopology", False)
-                    params = {"OverlayId": olid, "NodeId": self._cm_config["NodeId"],
-                              "Peers": self._overlays[olid]["KnownPeers"],
-                              "EnforcedEdges": enf_lnks,
-                              "MaxSuccessors": self._cm_config.get("MaxSuccessors", 1),
-                              "MaxLongDistEdges": self._cm_config.get("MaxLongDistEdges", 4),
-                              "ManualTopology": manual_topo}
-                    gb = GraphBuilder(params)
+                    self.log("LOG_DEBUG", "Refreshing topology...")
+                    gb = GraphBuilder(self._graph_params(olid, self._overlays[olid]["KnownPeers"]))
                     adjl = gb.build_adj_list(nb.get_adj_list())
                     nb.refresh(adjl)
                     self._overlays[olid]["NewPeerCount"] = 0
                 else:
-                    self.register_cbt("Logger", "LOG_DEBUG", "Net builder busy, skipping...")
+                    self.log("LOG_DEBUG", "Net builder busy, skipping...")
+
+    def on_config_reload(self, changes):
+        # the graph parameters are read on every refresh, which is run once they are applied
+        pending = []
+        with self._lock:
+            for change in changes:
+                if (change.path in (("PeerDiscoveryCoalesce",), ("MaxSuccessors",),
+                                    ("MaxLongDistEdges",))
+                        or (len(change.path) >= 3 and change.path[0] == "Overlays"
+                            and change.path[1] in self._overlays
+                            and change.path[2] in ("EnforcedLinks", "ManualTopology"))):
+                    apply_config_change(self._cm_config, change)
+                else:
+                    pending.append(change)
+            for olid, overlay in self._overlays.items():
+                overlay["GraphConfig"] = graph_config(self._cm_config, olid)
+        if len(pending) < len(changes):
+            self.manage_topology()
+        return pending
 
     def timer_method(self):
         self.manage_topology()
@@ -245,16 +246,16 @@ class Topology(ControllerModule, CFX):
         """
         Start the connection process to a peer if a direct edge is desirable
         """
-        self.register_cbt("Logger", "LOG_INFO", "Creating peer edge {0}:{1}->{2}"
-                          .format(overlay_id, self._cm_config["NodeId"][:7], peer_id[:7]))
+        self.log("LOG_INFO", "Creating peer edge {0}:{1}->{2}"
+                 .format(overlay_id, self._cm_config["NodeId"][:7], peer_id[:7]))
         params = {"OverlayId": overlay_id, "PeerId": peer_id}
         self.register_cbt("LinkManager", "LNK_CREATE_TUNNEL", params)
 
     def top_remove_edge(self, overlay_id, peer_id):
-        self.register_cbt("Logger", "LOG_INFO", "Removing peer edge {0}:{1}->{2}"
-                          .format(overlay_id, self._cm_config["NodeId"][:7], peer_id[:7]))
+        self.log("LOG_INFO", "Removing peer edge {0}:{1}->{2}"
+                 .format(overlay_id, self._cm_config["NodeId"][:7], peer_id[:7]))
         params = {"OverlayId": overlay_id, "PeerId": peer_id}
         self.register_cbt("LinkManager", "LNK_REMOVE_TUNNEL", params)
 
     def top_log(self, msg, level="LOG_DEBUG"):
-        self.register_cbt("Logger", level, msg)
+        self.log(level, msg)
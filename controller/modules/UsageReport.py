@@ -26,8 +26,7 @@ try:
     import simplejson as json
 except ImportError:
     import json
-import urllib.request as urllib2
-from controller.framework.ControllerModule import ControllerModule
+from controller.framework.ControllerModule import ControllerModule, response_handler
 
 
 class UsageReport(ControllerModule):
@@ -38,27 +37,16 @@ class UsageReport(ControllerModule):
         self.lck = threading.Lock()
 
     def initialize(self):
-        self.register_cbt("Logger", "LOG_INFO", "{0} Loaded".format(self._module_name))
+        self.log("LOG_INFO", "{0} Loaded".format(self._module_name))
 
-    def process_cbt(self, cbt):
-        if cbt.op_type == "Response":
-            if cbt.request.action == "SIG_QUERY_REPORTING_DATA":
-                if not cbt.response.status:
-                    self.register_cbt("Logger", "LOG_WARNING",
-                                      "CBT failed {0}".format(cbt.response.data))
-                    self.free_cbt(cbt)
-                else:
-                    self.create_report(cbt)
-            else:
-                parent_cbt = cbt.parent
-                cbt_data = cbt.response.data
-                cbt_status = cbt.response.status
-                self.free_cbt(cbt)
-                if (parent_cbt is not None and parent_cbt.child_count == 1):
-                    parent_cbt.set_response(cbt_data, cbt_status)
-                    self.complete_cbt(parent_cbt)
+    @response_handler("SIG_QUERY_REPORTING_DATA")
+    def resp_handler_query_reporting_data(self, cbt):
+        if not cbt.response.status:
+            self.log("LOG_WARNING",
+                     "CBT failed {0}".format(cbt.response.data))
+            self.free_cbt(cbt)
         else:
-            self.req_handler_default(cbt)
+            self.create_report(cbt)
 
     def timer_method(self):
         cur_time = datetime.datetime.now()
@@ -107,8 +95,10 @@ class UsageReport(ControllerModule):
         self.free_cbt(cbt)
 
     def submit_report(self, report_data):
+        # urllib.request pulls in http.client and ssl, only import it when a report is sent
+        import urllib.request as urllib2
         data = json.dumps(report_data).encode('utf8')
-        self.register_cbt("Logger", "LOG_DEBUG", "Usage report data: {0}".format(data))
+        self.log("LOG_DEBUG", "Usage report data: {0}".format(data))
         url = None
         try:
             url = "http://" + self._cm_config["ServerAddress"] + ":" + \
@@ -120,12 +110,12 @@ class UsageReport(ControllerModule):
                 log = "Usage report successfully submitted to server {0}\n" \
                       "HTTP response code:{1}, msg:{2}" \
                     .format(url, res.getcode(), res.read())
-                self.register_cbt("Logger", "LOG_INFO", log)
+                self.log("LOG_INFO", log)
             else:
-                self.register_cbt("Logger", "LOG_WARNING",
-                                  "Usage report server indicated error "
-                                  "code: {0}".format(res.getcode()))
+                self.log("LOG_WARNING",
+                         "Usage report server indicated error "
+                         "code: {0}".format(res.getcode()))
         except (urllib2.HTTPError, urllib2.URLError) as error:
             log = "Usage report submission failed to server {0}. " \
                   "Error: {1}".format(url, error)
-            self.register_cbt("Logger", "LOG_WARNING", log)
+            self.log("LOG_WARNING", log)
@@ -0,0 +1,228 @@
+# ipop-project
+# Copyright 2016, University of Florida
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.  IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import ssl
+from queue import Queue
+try:
+    import simplejson as json
+except ImportError:
+    import json
+import sleekxmpp
+from sleekxmpp.xmlstream.stanzabase import ElementBase, JID
+from sleekxmpp.xmlstream import register_stanza_plugin
+from sleekxmpp.xmlstream.handler.callback import Callback
+from sleekxmpp.xmlstream.matcher import StanzaPath
+from sleekxmpp.stanza.message import Message
+
+
+class IpopSignal(ElementBase):
+    """Representation of SIGNAL's custom message stanza"""
+    name = "ipop"
+    namespace = "signal"
+    plugin_attrib = "ipop"
+    interfaces = set(("type", "payload"))
+
+
+class XmppTransport(sleekxmpp.ClientXMPP):
+    def __init__(self, jid, password, sasl_mech):
+        sleekxmpp.ClientXMPP.__init__(self, jid, password, sasl_mech=sasl_mech)
+        self._overlay_id = None
+        # self.overlay_descr = None
+        self._sig = None
+        self._node_id = None
+        self._presence_publisher = None
+        self._jid_cache = None
+        self._outgoing_rem_acts = None
+        self._cbt_to_action_tag = {}  # maps remote action tags to cbt tags
+        self._host = None
+        self._port = None
+
+    @staticmethod
+    def factory(overlay_id, overlay_descr, cm_mod, presence_publisher, jid_cache,
+                outgoing_rem_acts):
+        try:
+            keyring_installed = False
+            import keyring
+            keyring_installed = True
+        except ImportError as err:
+            cm_mod.sig_log("No key-ring found", "LOG_INFO")
+        host = overlay_descr["HostAddress"]
+        port = overlay_descr["Port"]
+        user = overlay_descr.get("Username", None)
+        pswd = overlay_descr.get("Password", None)
+        auth_method = overlay_descr.get("AuthenticationMethod", "Password")
+        if auth_method == "x509" and (user is not None or pswd is not None):
+            er_log = "x509 Authentication is enbabled but credentials " \
+                "exists in IPOP configuration file; x509 will be used."
+            cm_mod.sig_log(er_log, "LOG_WARNING")
+        if auth_method == "x509":
+            transport = XmppTransport(None, None, sasl_mech="EXTERNAL")
+            transport.ssl_version = ssl.PROTOCOL_TLSv1
+            transport.ca_certs = overlay_descr["TrustStore"]
+            transport.certfile = overlay_descr["CertDirectory"] + overlay_descr["CertFile"]
+            transport.keyfile = overlay_descr["CertDirectory"] + overlay_descr["Keyfile"]
+            transport.use_tls = True
+        elif auth_method == "PASSWORD":
+            if user is None:
+                raise RuntimeError("No username is provided in IPOP configuration file.")
+            if pswd is None and keyring_installed is True:
+                pswd = keyring.get_password("ipop", overlay_descr["Username"])
+            if pswd is None:
+                print("{0} XMPP Password: ".format(user))
+                pswd = str(input())
+                if keyring_installed is True:
+                    try:
+                        keyring.set_password("ipop", user, pswd)
+                    except keyring.errors.PasswordSetError as err:
+                        cm_mod.sig_log("Failed to store password in keyring. {0}".format(str(err)),
+                                       "LOG_ERROR")
+            transport = XmppTransport(user, pswd, sasl_mech="PLAIN")
+            transport.use_tls = True
+            del pswd
+        else:
+            raise RuntimeError("Invalid authentication method specified in configuration: {0}"
+                               .format(auth_method))
+        # pylint: disable=protected-access
+        transport._host = host
+        transport._port = port
+        transport._overlay_id = overlay_id
+        transport._sig = cm_mod
+        transport._node_id = cm_mod._cm_config["NodeId"]
+        transport._presence_publisher = presence_publisher
+        transport._jid_cache = jid_cache
+        transport._outgoing_rem_acts = outgoing_rem_acts
+        # event handler for session start and roster update
+        transport.add_event_handler("session_start", transport.start_event_handler)
+        return transport
+
+    def start_event_handler(self, event):
+        """Registers custom event handlers at the start of XMPP session"""
+        self._sig.sig_log("XMPP Signalling started for overlay: {0}".format(self._overlay_id))
+        # pylint: disable=broad-except
+        try:
+            # Notification of peer signon
+            self.add_event_handler("presence_available",
+                                   self.presence_event_handler)
+            # Register IPOP message with the server
+            register_stanza_plugin(Message, IpopSignal)
+            self.registerHandler(
+                Callback("ipop", StanzaPath("message/ipop"), self.message_listener))
+            # Get the friends list for the user
+            self.get_roster()
+            # Send sign-on presence
+            self.send_presence(pstatus="ident#" + self._node_id)
+        except Exception as err:
+            self._sig.sig_log("XmppTransport: Exception:{0} Event:{1}"
+                              .format(err, event), "LOG_ERROR")
+
+    def presence_event_handler(self, presence):
+        """
+        Handle peer presence event messages
+        """
+        try:
+            presence_sender = presence["from"]
+            presence_receiver_jid = JID(presence["to"])
+            presence_receiver = str(presence_receiver_jid.user) + "@" \
+                + str(presence_receiver_jid.domain)
+            status = presence["status"]
+            # self._sig.sig_log("Presence Overlay:{0} Local JID:{1} Msg:{2}".
+            #                   format(self._overlay_id, self.boundjid, presence))
+            if(presence_receiver == self.boundjid.bare and presence_sender != self.boundjid.full):
+                if (status != "" and "#" in status):
+                    pstatus, peer_id = status.split("#")
+                    if pstatus == "ident":
+                        if peer_id == self._sig._cm_config["NodeId"]:
+                            return
+                        # a notification of a peers node id to jid mapping
+                        pts = self._jid_cache.add_entry(node_id=peer_id, jid=presence_sender)
+                        self._presence_publisher.post_update(
+                            dict(PeerId=peer_id, OverlayId=self._overlay_id,
+                                 PresenceTimestamp=pts))
+                        self._sig.log_debug("Resolved {0}@{1}->{2}", peer_id[:7],
+                                            self._overlay_id, presence_sender)
+                    elif pstatus == "uid?":
+                        # a request for our node id
+                        if self._node_id == peer_id:
+                            payload = self.boundjid.full + "#" + self._node_id
+                            self.send_msg(presence_sender, "uid!", payload)
+                    else:
+                        self._sig.sig_log("Unrecognized PSTATUS:{0} on overlay:{1}"
+                                          .format(pstatus, self._overlay_id), "LOG_WARNING")
+        except Exception as err:
+            self._sig.sig_log("XmppTransport:Exception:{0} overlay:{1} presence:{2}"
+                              .format(err, self._overlay_id, presence), "LOG_ERROR")
+
+    def message_listener(self, msg):
+        """
+        Listen for matched messages on the xmpp stream, extract the header
+        and payload, and takes suitable action.
+        """
+        try:
+            sender_jid = msg["from"]
+            # discard the message if it was initiated by this node
+            if sender_jid == self.boundjid.full:
+                return
+            # extract header and content
+            msg_type = msg["ipop"]["type"]
+            msg_payload = msg["ipop"]["payload"]
+            if msg_type == "uid!":
+                match_jid, matched_uid = msg_payload.split("#")
+                # put the learned JID in cache
+                self._jid_cache.add_entry(matched_uid, match_jid)
+                # send the remote actions that are waiting on JID refresh
+                rm_que = self._outgoing_rem_acts.get(matched_uid, Queue())
+                while not rm_que.empty():
+                    entry = rm_que.get()
+                    msg_type, msg_data = entry[0], entry[1]
+                    self.send_msg(match_jid, msg_type, json.dumps(msg_data))
+                    self._sig.log_debug("Sent remote action: {0}", msg_payload)
+            elif msg_type in ("invk", "cmpt"):
+                rem_act = json.loads(msg_payload)
+                self._sig.handle_remote_action(self._overlay_id, rem_act, msg_type)
+            else:
+                self._sig.sig_log("Invalid message type received {0}".format(str(msg)),
+                                  "LOG_WARNING")
+        except Exception as err:
+            self._sig.sig_log("XmppTransport:Exception:{0} msg:{1}".format(err, msg),
+                              "LOG_ERROR")
+
+    def send_msg(self, peer_jid, msg_type, payload):
+        """Send a message to Peer JID via XMPP server"""
+        msg = self.Message()
+        msg["to"] = peer_jid
+        msg["from"] = self.boundjid.full
+        msg["type"] = "chat"
+        msg["ipop"]["type"] = msg_type
+        msg["ipop"]["payload"] = payload
+        msg.send()
+
+    def connect_to_server(self,):
+        try:
+            if self.connect(address=(self._host, self._port)):
+                self.process(block=False)
+                self._sig.sig_log("Starting overlay {0} connection to XMPP server {1}:{2}"
+                                  .format(self._overlay_id, self._host, self._port))
+        except Exception as err:
+            self._sig.sig_log("Failed to initialize XMPP transport instanace {}".format(str(err)),
+                              "LOG_ERROR")
+
+    def shutdown(self,):
+        self.disconnect()